@@ -0,0 +1,7 @@
+"""
+Benchmarks offline da automação DCTF.
+
+Módulos:
+    - mock_ecac: Servidor local que simula as páginas do e-CAC
+    - bench_transmissao: Mede a vazão de transmissao contra o e-CAC simulado
+"""
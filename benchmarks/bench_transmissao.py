@@ -0,0 +1,289 @@
+"""
+Benchmark offline de transmissao contra o e-CAC simulado (benchmarks/mock_ecac.py).
+
+Gera uma planilha temporária com N CNPJs, abre um Chrome (headless por padrão),
+executa transmissao (ou transmissao_abas) e informa:
+    - CNPJs por minuto
+    - latência por CNPJ (p50/p95/máx)
+    - tempo gasto regravando a planilha
+    - status finais e contadores do servidor
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_transmissao --cnpjs 50 --latencia 0.2 --taxa-erro 0.05
+    python -m benchmarks.bench_transmissao --json resultado.json --min-cnpjs-minuto 20
+
+Com --min-cnpjs-minuto, o processo termina com código 1 se a vazão ficar
+abaixo do limite (para detectar regressões na integração contínua).
+"""
+import argparse
+import json
+import logging
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from selenium import webdriver
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.mock_ecac import EcacSimulado
+from src import abas as modulo_abas
+from src.abas import transmissao_abas
+from src.automacao import transmissao
+from src.metricas import percentil
+from src.planilha import GravadorPlanilha, ler_planilha
+
+
+class GravadorCronometrado(GravadorPlanilha):
+    """GravadorPlanilha que mede o tempo das gravações e o instante de cada status."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tempos_salvamento = []
+        self.fim_por_cnpj = {}
+
+    def atualizar(self, cnpj, status, arquivo=None):
+        super().atualizar(cnpj, status, arquivo)
+        self.fim_por_cnpj[cnpj] = time.perf_counter()
+
+    def salvar(self):
+        inicio = time.perf_counter()
+        try:
+            return super().salvar()
+        finally:
+            self.tempos_salvamento.append(time.perf_counter() - inicio)
+
+
+# Pesos dos dígitos verificadores do CNPJ (módulo 11)
+PESOS_DV1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_DV2 = (6,) + PESOS_DV1
+
+
+def _digito_verificador(digitos, pesos):
+    resto = sum(d * p for d, p in zip(digitos, pesos)) % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def cnpj_ficticio(numero):
+    """CNPJ fictício (matriz 0001) com dígitos verificadores válidos."""
+    base = [int(c) for c in f"{numero:08d}0001"]
+    base.append(_digito_verificador(base, PESOS_DV1))
+    base.append(_digito_verificador(base, PESOS_DV2))
+    return ''.join(map(str, base))
+
+
+def criar_planilha(caminho, quantidade):
+    """Cria a planilha de clientes do benchmark (CNPJ fictícios sequenciais e válidos)."""
+    df = pd.DataFrame({
+        'COD': [str(1000 + i) for i in range(quantidade)],
+        'CNPJ': [cnpj_ficticio(i + 1) for i in range(quantidade)],
+        'RAZAO': [f"Empresa {i + 1}" for i in range(quantidade)],
+        'STATUS': [''] * quantidade,
+    })
+    df.to_excel(caminho, index=False)
+    return caminho
+
+
+def criar_driver(pasta_download, headless=True):
+    """Chrome do Selenium para o benchmark (sem undetected_chromedriver, apto a CI headless)."""
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1280,900")
+    options.add_experimental_option("prefs", {
+        "download.default_directory": str(pasta_download),
+        "download.prompt_for_download": False,
+        "plugins.always_open_pdf_externally": True,
+    })
+    driver = webdriver.Chrome(options=options)
+    driver.execute_cdp_cmd('Browser.setDownloadBehavior', {
+        'behavior': 'allow',
+        'downloadPath': str(pasta_download),
+    })
+    driver.implicitly_wait(0)
+    return driver
+
+
+def executar_benchmark(
+    cnpjs=30,
+    latencia=0.1,
+    taxa_erro=0.0,
+    taxa_sem_declaracao=0.1,
+    abas=1,
+    timeout_elemento=5,
+    tentativas_por_cnpj=2,
+    timeout_download=15,
+    salvar_a_cada=10,
+    perfil_espera='eventos',
+    headless=True,
+    semente=42
+):
+    """
+    Executa um benchmark completo e retorna as métricas.
+
+    Returns:
+        dict: Métricas da execução (ver relatorio).
+    """
+    servidor = EcacSimulado(0, latencia, taxa_erro, taxa_sem_declaracao, semente).iniciar()
+    driver = None
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench-dctf-") as tmp:
+            tmp = Path(tmp)
+            pasta_download = tmp / "downloads"
+            pasta_download.mkdir()
+            planilha = criar_planilha(tmp / "database.xlsx", cnpjs)
+
+            driver = criar_driver(pasta_download, headless)
+            driver.get(f"{servidor.url}/ecac/")
+            # As abas extras abrem a página inicial do e-CAC simulado
+            modulo_abas.URL_ECAC = f"{servidor.url}/ecac/"
+
+            lista_cnpjs, codigos, df, indice = ler_planilha(planilha)
+            gravador = GravadorCronometrado(df, planilha, salvar_a_cada=salvar_a_cada, indice=indice)
+            # Todos os CNPJs gerados precisam chegar ao portal, senão a vazão não é comparável
+            pendentes = len(gravador.pendentes(lista_cnpjs, codigos))
+            if pendentes != cnpjs:
+                raise RuntimeError(f"Planilha do benchmark com {pendentes} pendentes em vez de {cnpjs}")
+
+            inicio_por_cnpj = {}
+            padrao = re.compile(r'\d{14}')
+
+            def callback(msg, atual, total):
+                encontrado = padrao.search(msg)
+                if encontrado:
+                    inicio_por_cnpj.setdefault(encontrado.group(), time.perf_counter())
+
+            executar = transmissao_abas if abas > 1 else transmissao
+            opcoes = {'abas': abas} if abas > 1 else {}
+
+            inicio = time.perf_counter()
+            executar(
+                cnpjs=lista_cnpjs,
+                codigos=codigos,
+                df=df,
+                driver=driver,
+                competencia='01 2025',
+                pasta_competencia=pasta_download,
+                data_inicial='01012025',
+                data_final='31012025',
+                timeout_elemento=timeout_elemento,
+                tentativas_por_cnpj=tentativas_por_cnpj,
+                callback=callback,
+                perfil_espera=perfil_espera,
+                timeout_download=timeout_download,
+                gravador=gravador,
+                **opcoes
+            )
+            gravador.fechar()
+            duracao = time.perf_counter() - inicio
+
+            latencias = [
+                gravador.fim_por_cnpj[cnpj] - inicio_por_cnpj[cnpj]
+                for cnpj in gravador.fim_por_cnpj if cnpj in inicio_por_cnpj
+            ]
+            status = df['STATUS'].value_counts().to_dict()
+            pdfs = len(list(pasta_download.glob('*.pdf')))
+    finally:
+        if driver is not None:
+            driver.quit()
+        servidor.parar()
+
+    processados = len(gravador.fim_por_cnpj)
+    salvamentos = gravador.tempos_salvamento
+    return {
+        'parametros': {
+            'cnpjs': cnpjs, 'latencia': latencia, 'taxa_erro': taxa_erro,
+            'taxa_sem_declaracao': taxa_sem_declaracao, 'abas': abas,
+            'timeout_elemento': timeout_elemento, 'salvar_a_cada': salvar_a_cada,
+            'perfil_espera': perfil_espera,
+        },
+        'duracao_s': duracao,
+        'processados': processados,
+        'cnpjs_por_minuto': processados / duracao * 60 if duracao else 0.0,
+        'latencia_cnpj_s': {
+            'p50': percentil(latencias, 50),
+            'p95': percentil(latencias, 95),
+            'max': max(latencias, default=0.0),
+        },
+        'salvamento_planilha': {
+            'quantidade': len(salvamentos),
+            'total_s': sum(salvamentos),
+            'media_s': sum(salvamentos) / len(salvamentos) if salvamentos else 0.0,
+            'percentual': sum(salvamentos) / duracao * 100 if duracao else 0.0,
+        },
+        'status': status,
+        'pdfs': pdfs,
+        'servidor': dict(servidor.contagem),
+    }
+
+
+def relatorio(resultado):
+    """Texto resumido das métricas do benchmark."""
+    latencia = resultado['latencia_cnpj_s']
+    salvamento = resultado['salvamento_planilha']
+    linhas = [
+        "=" * 50,
+        "BENCHMARK TRANSMISSAO (e-CAC simulado)",
+        "=" * 50,
+        f"Parâmetros: {resultado['parametros']}",
+        f"CNPJs processados: {resultado['processados']} em {resultado['duracao_s']:.1f}s",
+        f"Vazão: {resultado['cnpjs_por_minuto']:.1f} CNPJs/min",
+        f"Latência por CNPJ: p50 {latencia['p50']:.2f}s | p95 {latencia['p95']:.2f}s | máx {latencia['max']:.2f}s",
+        f"Gravação da planilha: {salvamento['quantidade']}x, total {salvamento['total_s']:.2f}s "
+        f"({salvamento['percentual']:.1f}% do tempo), média {salvamento['media_s']:.3f}s",
+        f"PDFs baixados: {resultado['pdfs']}",
+        f"Status: {resultado['status']}",
+        f"Servidor: {resultado['servidor']}",
+    ]
+    return "\n".join(linhas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline de transmissao com e-CAC simulado")
+    parser.add_argument('--cnpjs', type=int, default=30)
+    parser.add_argument('--latencia', type=float, default=0.1, help="latência média do servidor (s)")
+    parser.add_argument('--taxa-erro', type=float, default=0.0)
+    parser.add_argument('--taxa-sem-declaracao', type=float, default=0.1)
+    parser.add_argument('--abas', type=int, default=1)
+    parser.add_argument('--timeout', type=int, default=5, help="timeout_elemento (s)")
+    parser.add_argument('--tentativas', type=int, default=2)
+    parser.add_argument('--salvar-a-cada', type=int, default=10)
+    parser.add_argument('--perfil-espera', default='eventos', choices=('eventos', 'fixo'))
+    parser.add_argument('--sem-headless', action='store_true')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--json', help="grava as métricas neste arquivo JSON")
+    parser.add_argument('--min-cnpjs-minuto', type=float, help="falha se a vazão ficar abaixo deste valor")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    resultado = executar_benchmark(
+        cnpjs=args.cnpjs,
+        latencia=args.latencia,
+        taxa_erro=args.taxa_erro,
+        taxa_sem_declaracao=args.taxa_sem_declaracao,
+        abas=args.abas,
+        timeout_elemento=args.timeout,
+        tentativas_por_cnpj=args.tentativas,
+        salvar_a_cada=args.salvar_a_cada,
+        perfil_espera=args.perfil_espera,
+        headless=not args.sem_headless,
+        semente=args.semente,
+    )
+    print(relatorio(resultado))
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    if args.min_cnpjs_minuto is not None and resultado['cnpjs_por_minuto'] < args.min_cnpjs_minuto:
+        print(f"REGRESSÃO: {resultado['cnpjs_por_minuto']:.1f} CNPJs/min < mínimo {args.min_cnpjs_minuto}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
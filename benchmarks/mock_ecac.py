@@ -0,0 +1,254 @@
+"""
+Servidor HTTP local que imita as páginas do e-CAC usadas por transmissao.
+
+As páginas têm os mesmos IDs e XPaths da automação (linkHome, btn214, frmApp,
+txtDataInicio, UpdatePanel de outorgantes, GridViewDctfs,
+LinkEmitirDARFIntegral e botão OK). O postback assíncrono do ASP.NET é
+simulado por um PageRequestManager mínimo, com os mesmos métodos consultados
+em src/esperas.py.
+
+Parâmetros da simulação:
+    latencia: tempo médio de resposta de cada página/postback (segundos, ±50%)
+    taxa_erro: fração das declarações que falham ao abrir (HTTP 500)
+    taxa_sem_declaracao: fração das pesquisas sem declaração na grade
+
+Uso isolado:
+    python -m benchmarks.mock_ecac --porta 8765 --latencia 0.2
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# PDF mínimo válido, servido como DARF
+PDF_DARF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 200 200]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+_CABECALHO = """
+<a id="linkHome" href="/ecac/">Home</a>
+<ul>
+  <li id="btn214"><a href="#" onclick="document.getElementById('containerServicos214').style.display='block'; return false;">Declarações e Demonstrativos</a></li>
+</ul>
+<div id="containerServicos214" style="display:none">
+  <div>Declarações</div>
+  <div><ul><li><a href="/ecac/dctf">Assinar e transmitir DCTF</a></li></ul></div>
+</div>
+"""
+
+_SCRIPT_POSTBACK = """
+<script>
+var Sys = {WebForms: {PageRequestManager: (function () {
+  var instancia = {
+    _assincrono: false,
+    _fim: [],
+    get_isInAsyncPostBack: function () { return this._assincrono; },
+    add_endRequest: function (fn) { this._fim.push(fn); }
+  };
+  return {getInstance: function () { return instancia; }};
+})()}};
+
+function postback(url, aoTerminar) {
+  var prm = Sys.WebForms.PageRequestManager.getInstance();
+  prm._assincrono = true;
+  fetch(url)
+    .then(function (r) { return r.json(); })
+    .catch(function () { return {}; })
+    .then(function (dados) {
+      aoTerminar(dados);
+      prm._assincrono = false;
+      prm._fim.forEach(function (fn) { fn(); });
+    });
+}
+</script>
+"""
+
+_PAGINA = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{titulo}</title>{script}</head>
+<body>{corpo}</body></html>
+"""
+
+_FILTRO = """
+<input type="checkbox" id="ctl00_cphConteudo_chkListarOutorgantes" {marcado}
+       onclick="postback('/dctf/outorgantes', function () {});"> Sou Procurador
+<div>
+  <input type="text" id="txtDataInicio" name="txtDataInicio">
+  <input type="text" id="txtDataFinal" name="txtDataFinal">
+</div>
+<div id="ctl00_cphConteudo_UpdatePanelListaOutorgantes">
+  <div>
+    <div>Outorgante</div>
+    <div><div><div>
+      <button type="button" onclick="var d = this.nextElementSibling; d.style.display = d.style.display === 'none' ? 'block' : 'none';">Outorgante</button>
+      <div style="display:none">
+        <div><input type="text" id="filtroOutorgante"></div>
+        <div><div><button type="button">Todos</button><button type="button" onclick="selecionado = '';">Nenhum</button></div></div>
+        <ul><li onclick="selecionado = document.getElementById('filtroOutorgante').value; this.parentNode.parentNode.style.display = 'none';">Selecionar</li></ul>
+      </div>
+    </div></div></div>
+  </div>
+</div>
+<input type="button" id="ctl00_cphConteudo_btnFiltar" value="Pesquisar"
+       onclick="postback('/dctf/pesquisar?cnpj=' + encodeURIComponent(selecionado), mostrarGrade);">
+<div id="ctl00_cphConteudo_tabelaListagemDctf"></div>
+<script>
+var selecionado = '';
+function mostrarGrade(dados) {
+  var tabela = document.getElementById('ctl00_cphConteudo_tabelaListagemDctf');
+  if (!dados.declaracao) { tabela.innerHTML = '<p>Nenhuma declaração encontrada.</p>'; return; }
+  tabela.innerHTML = '<table id="ctl00_cphConteudo_tabelaListagemDctf_GridViewDctfs"><tr><td>' +
+    '<a id="ctl00_cphConteudo_tabelaListagemDctf_GridViewDctfs_ctl02_lbkVisualizarDctf" ' +
+    'href="/dctf/declaracao?cnpj=' + encodeURIComponent(dados.cnpj) + '">Visualizar</a></td></tr></table>';
+}
+</script>
+"""
+
+_DECLARACAO = """
+<p>Declaração do CNPJ {cnpj}</p>
+<a id="LinkEmitirDARFIntegral" href="/dctf/darf?cnpj={cnpj}"
+   onclick="setTimeout(function () {{ document.getElementById('dialogo').style.display = 'block'; }}, 50);">Emitir DARF</a>
+<div id="dialogo" style="display:none">
+  <p>DARF emitido.</p>
+  <button type="button" onclick="document.getElementById('dialogo').style.display = 'none';">OK</button>
+</div>
+"""
+
+
+class EcacSimulado(ThreadingHTTPServer):
+    """
+    Servidor do e-CAC simulado.
+
+    Args:
+        porta (int): Porta local (0 escolhe uma porta livre).
+        latencia (float): Tempo médio de resposta (segundos).
+        taxa_erro (float): Fração de declarações que falham ao abrir.
+        taxa_sem_declaracao (float): Fração de pesquisas sem declaração.
+        semente (int): Semente do sorteio (resultados reprodutíveis).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, porta=0, latencia=0.1, taxa_erro=0.0, taxa_sem_declaracao=0.0, semente=None):
+        super().__init__(('127.0.0.1', porta), _Manipulador)
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+        self.taxa_sem_declaracao = taxa_sem_declaracao
+        self.procurador = False
+        self.contagem = {'paginas': 0, 'postbacks': 0, 'erros': 0, 'downloads': 0}
+        self._sorteio = random.Random(semente)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def sortear(self, taxa) -> bool:
+        with self._lock:
+            return self._sorteio.random() < taxa
+
+    def aguardar_latencia(self):
+        if self.latencia > 0:
+            with self._lock:
+                fator = self._sorteio.uniform(0.5, 1.5)
+            time.sleep(self.latencia * fator)
+
+    def contar(self, chave):
+        with self._lock:
+            self.contagem[chave] += 1
+
+    def iniciar(self):
+        """Atende as requisições em uma thread de fundo."""
+        self._thread = threading.Thread(target=self.serve_forever, name="ecac-simulado", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Manipulador(BaseHTTPRequestHandler):
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, corpo: bytes, tipo='text/html; charset=utf-8', status=200, cabecalhos=None):
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.send_header('Cache-Control', 'no-store')
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _pagina(self, titulo, corpo, script=''):
+        self.server.contar('paginas')
+        self._responder(_PAGINA.format(titulo=titulo, corpo=corpo, script=script).encode('utf-8'))
+
+    def _json(self, dados):
+        self.server.contar('postbacks')
+        self._responder(json.dumps(dados).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parametros = parse_qs(url.query)
+        cnpj = parametros.get('cnpj', [''])[0]
+        servidor = self.server
+        servidor.aguardar_latencia()
+
+        if url.path in ('/', '/ecac', '/ecac/', '/autenticacao/login'):
+            self._pagina("e-CAC (simulado)", _CABECALHO)
+        elif url.path == '/ecac/dctf':
+            corpo = _CABECALHO + '<iframe id="frmApp" name="frmApp" src="/dctf/filtro" width="100%" height="600"></iframe>'
+            self._pagina("DCTFWeb (simulado)", corpo)
+        elif url.path == '/dctf/filtro':
+            corpo = _FILTRO.replace('{marcado}', 'checked' if servidor.procurador else '')
+            self._pagina("Filtro DCTFWeb", corpo, _SCRIPT_POSTBACK)
+        elif url.path == '/dctf/outorgantes':
+            servidor.procurador = True
+            self._json({})
+        elif url.path == '/dctf/pesquisar':
+            self._json({'cnpj': cnpj, 'declaracao': bool(cnpj) and not servidor.sortear(servidor.taxa_sem_declaracao)})
+        elif url.path == '/dctf/declaracao':
+            if servidor.sortear(servidor.taxa_erro):
+                servidor.contar('erros')
+                self._responder(b'<html><body>Erro interno</body></html>', status=500)
+            else:
+                self._pagina("Declaração", _DECLARACAO.format(cnpj=cnpj))
+        elif url.path == '/dctf/darf':
+            servidor.contar('downloads')
+            self._responder(PDF_DARF, 'application/pdf', cabecalhos={
+                'Content-Disposition': f'attachment; filename="DARF-{cnpj}.pdf"',
+            })
+        else:
+            self._responder(b'Not found', 'text/plain', status=404)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que simula o e-CAC")
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--latencia', type=float, default=0.1)
+    parser.add_argument('--taxa-erro', type=float, default=0.0)
+    parser.add_argument('--taxa-sem-declaracao', type=float, default=0.0)
+    args = parser.parse_args()
+    servidor = EcacSimulado(args.porta, args.latencia, args.taxa_erro, args.taxa_sem_declaracao)
+    print(f"e-CAC simulado em {servidor.url}/ecac/ (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
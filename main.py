@@ -5,10 +5,19 @@ Uso:
     python main.py          # Abre a interface gráfica (padrão)
     python main.py --cli    # Executa no modo linha de comando
     python main.py --help   # Mostra ajuda
+    python main.py --limpar-perfil  # Apaga o cache do perfil persistente do Chrome
+    python main.py --exportar-status  # Grava na planilha o STATUS do estado da execução
+    python main.py --tempos-importacao  # Mostra o tempo de importação de cada módulo
+
+Selenium, pandas e a interface gráfica são importados apenas no modo que os
+usa, de modo que --help e os comandos de manutenção respondem de imediato.
 """
+import time
+
+_INICIO = time.perf_counter()
+
 import sys
 import logging
-import time
 from pathlib import Path
 
 # Adicionar o diretório do projeto ao path
@@ -16,8 +25,21 @@ PROJECT_ROOT = Path(__file__).parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
 from src.config import Config, get_config
-from src.automacao import configurar_driver, login, transmissao
-from src.planilha import ler_planilha
+from src.metricas import RegistroEtapas
+from src.resiliencia import Disjuntor, espera_exponencial
+from src.timeouts import TimeoutsAdaptativos
+
+# Módulos medidos por --tempos-importacao, na ordem em que o modo CLI os usa
+MODULOS_MEDIDOS = [
+    'src.planilha',
+    'src.estado',
+    'src.sessao',
+    'src.automacao',
+    'src.abas',
+    'src.paralelo',
+    'customtkinter',
+    'src.gui',
+]
 
 
 def setup_logging(config: Config):
@@ -36,6 +58,12 @@ def run_cli(config: Config = None):
     Args:
         config: Configuração a ser usada. Se None, carrega do arquivo.
     """
+    from src.abas import transmissao_abas
+    from src.automacao import configurar_driver, login, retomar_sessao, transmissao
+    from src.estado import EstadoExecucao
+    from src.paralelo import transmissao_paralela
+    from src.planilha import GravadorPlanilha, ler_planilha
+    
     # Carregar configuração
     if config is None:
         config = get_config()
@@ -51,6 +79,24 @@ def run_cli(config: Config = None):
     
     driver = None
     df = None
+    gravador = None
+    timeouts = None
+    if config.timeouts_adaptativos:
+        timeouts = TimeoutsAdaptativos(
+            config.timeouts_file,
+            multiplicador=config.timeout_multiplicador,
+            piso=config.timeout_piso,
+            teto=config.timeout_teto
+        )
+    metricas = RegistroEtapas(config.metricas_dir, timeouts)
+    estado = EstadoExecucao(config.estado_file, config.competencia) if config.estado_execucao else None
+    disjuntor = None
+    if config.disjuntor_falhas > 0:
+        disjuntor = Disjuntor(
+            config.disjuntor_falhas,
+            config.disjuntor_intervalo,
+            config.disjuntor_pausa_maxima
+        )
     
     while tentativas_gerais > 0:
         try:
@@ -62,14 +108,46 @@ def run_cli(config: Config = None):
             print(f"Período: {config.data_inicial} a {config.data_final}")
             print("=" * 50)
             
-            driver = configurar_driver(pasta_competencia)
-            cnpjs, codigos, df = ler_planilha(config.planilha)
+            driver = configurar_driver(
+                pasta_competencia,
+                config.perfil_espera,
+                config.downloads_cdp,
+                config.abas > 1,
+                pasta_perfil=config.cache if config.perfil_persistente else None
+            )
+            cnpjs, codigos, df, indice = ler_planilha(config.planilha, estado)
+            gravador = GravadorPlanilha(
+                df,
+                config.planilha,
+                salvar_a_cada=config.salvar_planilha_a_cada,
+                intervalo_salvamento=config.intervalo_salvamento,
+                indice=indice,
+                estado=estado
+            )
             
-            print("Aguardando login manual...")
-            login(driver)
-            input("Login concluído? Pressione ENTER para continuar com a navegação e processamento...")
+            # Nos reinícios, a sessão gravada após o login dispensa um novo login manual
+            arquivo_sessao = config.sessao_file if config.reutilizar_sessao else None
+            if retomar_sessao(driver, arquivo_sessao, config.timeout_elemento):
+                print("Sessão anterior restaurada. Login manual dispensado.")
+            else:
+                print("Aguardando login manual...")
+                login(driver, arquivo_sessao=arquivo_sessao)
+                input("Login concluído? Pressione ENTER para continuar com a navegação e processamento...")
             
-            transmissao(
+            # Com mais de um navegador, os CNPJs pendentes são divididos entre eles;
+            # com mais de uma aba, são processados em rodízio no navegador logado
+            executar = transmissao
+            opcoes_paralelo = {}
+            if config.workers > 1:
+                executar = transmissao_paralela
+                opcoes_paralelo = {'workers': config.workers}
+                if config.abas > 1:
+                    logging.warning(f"abas={config.abas} ignorado: com workers={config.workers}, cada navegador usa uma aba")
+            elif config.abas > 1:
+                executar = transmissao_abas
+                opcoes_paralelo = {'abas': config.abas}
+            
+            executar(
                 cnpjs=cnpjs,
                 codigos=codigos,
                 df=df,
@@ -80,12 +158,18 @@ def run_cli(config: Config = None):
                 data_final=config.data_final,
                 timeout_elemento=config.timeout_elemento,
                 tentativas_por_cnpj=config.tentativas_por_cnpj,
-                planilha_path=str(config.planilha)
+                planilha_path=str(config.planilha),
+                manter_pagina_filtro=config.manter_pagina_filtro,
+                perfil_espera=config.perfil_espera,
+                pausa_minima=config.pausa_minima,
+                timeout_download=config.timeout_download,
+                downloads_cdp=config.downloads_cdp,
+                gravador=gravador,
+                metricas=metricas,
+                disjuntor=disjuntor,
+                **opcoes_paralelo
             )
             
-            # Salvar planilha final
-            df.to_excel(config.planilha, index=False)
-            
             print("=" * 50)
             print("AUTOMAÇÃO CONCLUÍDA COM SUCESSO!")
             print("=" * 50)
@@ -111,20 +195,32 @@ def run_cli(config: Config = None):
                 except Exception:
                     pass
                 
-                tempo_espera = 5
-                print(f"Aguardando {tempo_espera} segundos antes da próxima tentativa...")
+                # Espera crescente com jitter: 2,5-5 s, 5-10 s, 10-20 s... (até 2 min)
+                tempo_espera = espera_exponencial(config.tentativas_gerais - tentativas_gerais, base=5, teto=120)
+                print(f"Aguardando {tempo_espera:.0f} segundos antes da próxima tentativa...")
                 time.sleep(tempo_espera)
             else:
                 print("Número máximo de tentativas excedido. Encerrando programa.")
                 logging.error("Número máximo de tentativas excedido. Programa finalizado com erro.")
+        
+        finally:
+            # Salvar planilha com status final; o que não for salvo fica no diário
+            # e é reaplicado pela próxima leitura
+            if gravador is not None:
+                if gravador.fechar():
+                    print("Planilha salva com status final dos processamentos.")
+                else:
+                    print("Não foi possível salvar a planilha final. Os status ficaram no diário e serão recuperados na próxima execução.")
+                gravador = None
     
-    # Salvar planilha com status final
-    if df is not None:
-        try:
-            df.to_excel(config.planilha, index=False)
-            print("Planilha salva com status final dos processamentos.")
-        except Exception as e:
-            print(f"Não foi possível salvar a planilha final: {e}")
+    # Tempo por etapa de toda a execução (inclui os reinícios)
+    print("Tempo por etapa:")
+    print(metricas.fechar())
+    if metricas.caminho is not None:
+        print(f"Detalhes em {metricas.caminho}")
+    
+    if estado is not None:
+        estado.fechar()
 
 
 def run_gui():
@@ -143,6 +239,15 @@ Uso:
     python main.py --gui        Abre a interface gráfica
     python main.py --cli        Executa no modo linha de comando
     python main.py --help       Mostra esta ajuda
+    python main.py --limpar-perfil [--completo]
+                                Apaga o cache do perfil persistente do Chrome
+                                (--completo apaga o perfil inteiro, inclusive cookies)
+    python main.py --exportar-status
+                                Grava na planilha o STATUS registrado no estado
+                                da execução (competência do config.json)
+    python main.py --tempos-importacao
+                                Mostra quanto tempo leva a importação de cada
+                                módulo (detalhes: python -X importtime main.py)
 
 Configurações:
     As configurações são salvas em config.json na raiz do projeto.
@@ -153,9 +258,70 @@ Arquivos:
     - config.json           Arquivo de configurações
     - AUTOMACAO-DCTF.log    Log de execução
     - Competencias executadas/  Pasta com os DARFs baixados
+    - metricas/             Tempo de cada etapa por execução (JSONL)
+    - estado-execucao.sqlite3  Status e tentativas de cada CNPJ por competência
+    - perfil-path/          Perfil persistente do Chrome ("perfil_persistente": true)
 """)
 
 
+def limpar_perfil(completo: bool = False):
+    """Poda o perfil persistente do Chrome (pasta perfil-path)."""
+    from src.perfil import PerfilEmUsoError, podar_perfil
+    config = get_config()
+    try:
+        liberado = podar_perfil(config.cache, completo=completo)
+    except PerfilEmUsoError as e:
+        print(e)
+        return
+    print(f"Perfil {config.cache}: {liberado / 1024 / 1024:.1f} MB liberados.")
+
+
+def exportar_status():
+    """Projeta o estado da execução (SQLite) na coluna STATUS da planilha."""
+    from src.estado import EstadoExecucao
+    from src.planilha import GravadorPlanilha, ler_planilha
+    config = get_config()
+    if not config.estado_file.exists():
+        print(f"Nenhum estado de execução encontrado em {config.estado_file}.")
+        return
+    with EstadoExecucao(config.estado_file, config.competencia) as estado:
+        _, _, df, indice = ler_planilha(config.planilha, estado)
+        gravador = GravadorPlanilha(df, config.planilha, indice=indice, estado=estado)
+        if gravador.salvar():
+            print(f"STATUS da competência {config.competencia} gravado em {config.planilha}.")
+        else:
+            print("Não foi possível gravar a planilha (verifique se ela está aberta no Excel).")
+
+
+def tempos_importacao(inicializacao: float):
+    """
+    Mostra o tempo de inicialização de main.py e o de importação de cada módulo pesado.
+    
+    Cada módulo é medido na ordem de MODULOS_MEDIDOS, descontando o que já foi
+    importado pelos anteriores (como no -X importtime do Python).
+    
+    Args:
+        inicializacao: Segundos entre o início de main.py e a chamada de main().
+    """
+    import importlib
+    
+    print("Tempo de importação (ms):")
+    print(f"  {'main.py (até main)':<24}{inicializacao * 1000:>10.1f}")
+    total = 0.0
+    for modulo in MODULOS_MEDIDOS:
+        carregados = len(sys.modules)
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(modulo)
+        except Exception as e:
+            print(f"  {modulo:<24}{'--':>10}   indisponível: {e}")
+            continue
+        decorrido = (time.perf_counter() - inicio) * 1000
+        total += decorrido
+        print(f"  {modulo:<24}{decorrido:>10.1f}   +{len(sys.modules) - carregados} módulos")
+    print(f"  {'total':<24}{total:>10.1f}")
+
+
 def main():
     """Função principal - ponto de entrada do programa."""
     # Processar argumentos de linha de comando
@@ -165,6 +331,18 @@ def main():
         show_help()
         return
     
+    if '--tempos-importacao' in args:
+        tempos_importacao(time.perf_counter() - _INICIO)
+        return
+    
+    if '--limpar-perfil' in args:
+        limpar_perfil(completo='--completo' in args)
+        return
+    
+    if '--exportar-status' in args:
+        exportar_status()
+        return
+    
     if '--cli' in args:
         # Modo CLI
         config = get_config()
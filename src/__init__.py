@@ -4,25 +4,48 @@ Pacote src - Módulos da automação DCTF.
 Módulos:
     - config: Configurações centralizadas
     - gui: Interface gráfica
+    - tabela: Tabela virtualizada da interface (somente as linhas visíveis)
     - automacao: Lógica de automação Selenium
+    - esperas: Esperas por eventos da página (postback, carregamento, download)
+    - downloads: Monitoramento da pasta de download dos DARFs
+    - sessao: Exportação/injeção da sessão do e-CAC
+    - perfil: Perfil persistente do Chrome (trava e limpeza)
+    - paralelo: Execução com vários navegadores compartilhando o login
+    - abas: Execução com várias abas em rodízio no navegador logado
+    - metricas: Tempo de cada etapa da transmissão
+    - timeouts: Timeouts por etapa aprendidos das durações observadas
+    - resiliencia: Espera exponencial entre tentativas e disjuntor do portal
+    - estado: Estado da execução em SQLite (status e tentativas por CNPJ)
     - planilha: Manipulação de planilhas Excel
     - utils: Funções utilitárias
 """
 
-from src.config import Config, get_config, save_config
-from src.automacao import configurar_driver, login, transmissao
-from src.planilha import ler_planilha, atualizar_status
-from src.utils import limpar_pasta, renomear_arquivo_recente
+import importlib
 
-__all__ = [
-    'Config',
-    'get_config', 
-    'save_config',
-    'configurar_driver',
-    'login',
-    'transmissao',
-    'ler_planilha',
-    'atualizar_status',
-    'limpar_pasta',
-    'renomear_arquivo_recente',
-]
+# Nome exportado -> módulo que o define. Os módulos são importados no primeiro
+# acesso (PEP 562): importar src.config não carrega Selenium nem pandas.
+_EXPORTADOS = {
+    'Config': 'src.config',
+    'get_config': 'src.config',
+    'save_config': 'src.config',
+    'configurar_driver': 'src.automacao',
+    'login': 'src.automacao',
+    'transmissao': 'src.automacao',
+    'ler_planilha': 'src.planilha',
+    'carregar_planilha': 'src.planilha',
+    'atualizar_status': 'src.planilha',
+    'salvar_planilha': 'src.planilha',
+    'GravadorPlanilha': 'src.planilha',
+    'IndiceStatus': 'src.planilha',
+    'limpar_pasta': 'src.utils',
+    'renomear_arquivo': 'src.utils',
+    'renomear_arquivo_recente': 'src.utils',
+}
+
+__all__ = list(_EXPORTADOS)
+
+
+def __getattr__(nome):
+    if nome in _EXPORTADOS:
+        return getattr(importlib.import_module(_EXPORTADOS[nome]), nome)
+    raise AttributeError(f"module 'src' has no attribute {nome!r}")
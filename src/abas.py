@@ -0,0 +1,436 @@
+"""
+Execução com várias abas no mesmo navegador logado.
+
+Alternativa mais leve que abrir vários navegadores: cada aba tem seu próprio
+frmApp e percorre as etapas de um CNPJ como uma pequena máquina de estados.
+As abas são visitadas em rodízio, de modo que, enquanto uma aguarda o postback
+da pesquisa ou o download do DARF, outra já preenche o próximo CNPJ.
+Como todas as abas baixam na mesma pasta, só uma aba emite DARF por vez, e
+um download que excede o prazo é isolado ao chegar antes que outra aba emita.
+"""
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    TimeoutException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    WebDriverException,
+)
+
+from src.automacao import (
+    URL_ECAC,
+    XPATH_EMITIR_DARF,
+    XPATH_OK,
+    XPATH_VISUALIZAR,
+    RenomearDarfError,
+    pesquisar_cnpj,
+    portal_disponivel,
+    transmissao,
+)
+from src.downloads import DownloadsCDP, MonitorDownloads
+from src.esperas import INTERVALO_VERIFICACAO, PERFIL_EVENTOS, SEM_RESULTADO, Esperas, resultado_pesquisa
+from src.metricas import ETAPA_CNPJ, RegistroEtapas
+from src.planilha import GravadorPlanilha
+from src.resiliencia import Disjuntor
+from src.utils import caminho_darf, renomear_arquivo
+
+
+# Estados de cada aba
+LIVRE = 'livre'
+PESQUISANDO = 'pesquisando'
+ABRINDO_DECLARACAO = 'abrindo declaração'
+AGUARDANDO_VEZ = 'aguardando vez de emitir'
+BAIXANDO = 'baixando DARF'
+CONFIRMANDO = 'confirmando'
+
+
+@dataclass
+class _Aba:
+    """Estado de uma aba: CNPJ em andamento, etapa atual e prazo da etapa."""
+
+    numero: int
+    handle: str
+    estado: str = LIVRE
+    cnpj: Optional[str] = None
+    codigo: Optional[str] = None
+    tentativas: int = 0
+    pausas: int = 0
+    marca: Optional[int] = None
+    limite: float = 0.0
+    prazo: float = 0.0
+    inicio_estado: Optional[float] = None
+    inicio_cnpj: float = 0.0
+    inicio_tentativa: float = 0.0
+    url_filtro: Optional[str] = None
+    forcar_navegacao: bool = True
+
+    def mudar(self, estado, prazo=None):
+        self.estado = estado
+        # A medição começa na próxima vez da aba no rodízio (ver iniciar_estado)
+        self.inicio_estado = None
+        self.prazo = prazo or 0.0
+        self.limite = time.monotonic() + prazo if prazo else 0.0
+
+    def expirou(self) -> bool:
+        return bool(self.limite) and time.monotonic() > self.limite
+
+    def iniciar_estado(self):
+        """Marca o início do trabalho da aba no estado atual, na sua primeira vez no rodízio."""
+        if self.inicio_estado is None:
+            self.inicio_estado = time.monotonic()
+
+
+def _condicao_imediata(driver, condicao):
+    """Avalia uma condição de espera uma única vez (sem bloquear)."""
+    try:
+        return condicao(driver)
+    except (NoSuchElementException, StaleElementReferenceException, WebDriverException):
+        # Documento em troca: a condição é reavaliada na próxima visita
+        return False
+
+
+def abrir_abas(driver, quantidade):
+    """
+    Abre (quantidade - 1) abas extras na página inicial do e-CAC.
+
+    Returns:
+        list: Handles das abas, começando pela aba atual.
+    """
+    handles = [driver.current_window_handle]
+    for _ in range(quantidade - 1):
+        driver.switch_to.new_window('tab')
+        driver.get(URL_ECAC)
+        handles.append(driver.current_window_handle)
+    driver.switch_to.window(handles[0])
+    return handles
+
+
+def transmissao_abas(
+    cnpjs,
+    codigos,
+    df,
+    driver,
+    competencia,
+    pasta_competencia,
+    data_inicial,
+    data_final,
+    abas: int = 2,
+    timeout_elemento: int = 30,
+    tentativas_por_cnpj: int = 3,
+    callback: Optional[Callable[[str, int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    planilha_path: Optional[str] = None,
+    manter_pagina_filtro: bool = True,
+    perfil_espera: str = PERFIL_EVENTOS,
+    pausa_minima: float = 0.5,
+    timeout_download: int = 60,
+    downloads_cdp: bool = False,
+    gravador: Optional[GravadorPlanilha] = None,
+    pasta_destino: Optional[str] = None,
+    metricas: Optional[RegistroEtapas] = None,
+    disjuntor: Optional[Disjuntor] = None
+):
+    """
+    Processa os CNPJs em várias abas do navegador logado, em rodízio.
+
+    Os parâmetros são os mesmos de transmissao, mais a quantidade de abas.
+    O progresso informa a aba, a etapa e o prazo de cada etapa, por exemplo
+    "[Aba 2] 12345678000190: pesquisando (prazo 30s)". Em metricas, cada etapa
+    da aba é medida do início ao fim do estado correspondente, a partir da
+    primeira vez da aba nele (sem contar a espera pelas demais abas do
+    rodízio). Com o disjuntor aberto, todas as abas ficam paradas até o portal
+    voltar e recomeçam pela pesquisa; uma aba que falha volta à fila
+    imediatamente, pois as demais continuam trabalhando.
+
+    Args:
+        abas (int): Quantidade de abas (incluindo a aba do login).
+    """
+    if abas <= 1 or perfil_espera != PERFIL_EVENTOS:
+        if abas > 1:
+            logging.warning("Várias abas exigem o perfil de espera 'eventos'. Usando uma aba.")
+        return transmissao(
+            cnpjs, codigos, df, driver, competencia, pasta_competencia, data_inicial, data_final,
+            timeout_elemento=timeout_elemento,
+            tentativas_por_cnpj=tentativas_por_cnpj,
+            callback=callback,
+            should_stop=should_stop,
+            planilha_path=planilha_path,
+            manter_pagina_filtro=manter_pagina_filtro,
+            perfil_espera=perfil_espera,
+            pausa_minima=pausa_minima,
+            timeout_download=timeout_download,
+            downloads_cdp=downloads_cdp,
+            gravador=gravador,
+            pasta_destino=pasta_destino,
+            metricas=metricas,
+            disjuntor=disjuntor,
+        )
+
+    gravador_proprio = gravador is None
+    if gravador_proprio:
+        gravador = GravadorPlanilha(df, planilha_path or 'database.xlsx')
+    if metricas is None:
+        metricas = RegistroEtapas()
+    politica = metricas.timeouts
+
+    def darf(codigo):
+        return caminho_darf(codigo, competencia, pasta_destino or pasta_competencia)
+
+    fila = deque()
+    for cnpj, codigo in gravador.pendentes(cnpjs, codigos):
+        # Idempotência: DARF já renomeado na pasta final não é emitido de novo
+        if darf(codigo).exists():
+            logging.info(f"DARF de {cnpj} já existe. Não será emitido novamente.")
+            gravador.atualizar(cnpj, 'Guia baixada', arquivo=darf(codigo))
+            continue
+        fila.append((cnpj, codigo))
+    total = len(fila)
+    concluidos = 0
+    logging.info(f"Modo abas: {total} CNPJs pendentes para até {abas} abas")
+
+    esperas = Esperas(driver, perfil=perfil_espera, pausa_minima=pausa_minima, timeout=timeout_elemento)
+    monitor = DownloadsCDP(driver, pasta_competencia) if downloads_cdp else MonitorDownloads(pasta_competencia)
+    handles = abrir_abas(driver, max(1, min(abas, total)))
+    lista_abas = [_Aba(numero=n + 1, handle=h) for n, h in enumerate(handles)]
+    emitindo = None  # Aba que está com o download em andamento
+    codigo_por_cnpj = dict(zip(cnpjs, codigos))
+    reenfileirados = set()
+
+    def reportar(aba, mensagem):
+        prazo = f" (prazo {aba.prazo:.0f}s)" if aba.prazo else ""
+        logging.info(f"[Aba {aba.numero}] {aba.cnpj}: {mensagem}{prazo}")
+        if callback:
+            callback(f"[Aba {aba.numero}] {aba.cnpj}: {mensagem}{prazo}", min(concluidos, total), total)
+
+    def prazo_etapa(estado, padrao=timeout_elemento):
+        return politica.timeout(estado, padrao) if politica is not None else padrao
+
+    def mudar(aba, estado, prazo=None, resultado='ok', sucesso=True):
+        # Fecha a medição do estado atual antes de passar ao próximo
+        if aba.estado != LIVRE:
+            aba.iniciar_estado()
+            duracao = time.monotonic() - aba.inicio_estado
+            metricas.registrar(
+                aba.estado, aba.cnpj, tentativas_por_cnpj - aba.tentativas + 1, resultado, duracao
+            )
+            if sucesso and resultado == 'ok' and politica is not None and aba.estado != AGUARDANDO_VEZ:
+                politica.observar(aba.estado, duracao)
+        aba.mudar(estado, prazo)
+
+    def registrar_tentativa(aba, status, erro=None, arquivo=None):
+        gravador.registrar_tentativa(
+            aba.cnpj, tentativas_por_cnpj - aba.tentativas + 1, status,
+            time.monotonic() - aba.inicio_tentativa, erro, arquivo
+        )
+
+    def finalizar(aba, status, resultado='ok', sucesso=True):
+        nonlocal concluidos
+        arquivo = darf(aba.codigo) if status == 'Guia baixada' else None
+        gravador.atualizar(aba.cnpj, status, arquivo=arquivo)
+        registrar_tentativa(aba, status, erro=None if sucesso else resultado, arquivo=arquivo)
+        gravador.salvar_se_necessario()
+        concluidos += 1
+        reportar(aba, status)
+        if sucesso and disjuntor is not None:
+            disjuntor.sucesso()
+        mudar(aba, LIVRE, resultado=resultado, sucesso=sucesso)
+        metricas.registrar(
+            ETAPA_CNPJ, aba.cnpj, tentativas_por_cnpj - aba.tentativas + 1,
+            status, time.monotonic() - aba.inicio_cnpj
+        )
+        aba.cnpj = aba.codigo = None
+
+    def entrar_frame(aba):
+        driver.switch_to.window(aba.handle)
+        driver.switch_to.frame('frmApp')
+
+    def avancar(aba) -> bool:
+        """Executa a próxima etapa da aba, se possível. Retorna True se houve progresso."""
+        nonlocal emitindo
+        aba.iniciar_estado()
+        if aba.expirou():
+            raise TimeoutException(f"Etapa '{aba.estado}' excedeu {aba.prazo:.0f} segundos")
+
+        if aba.estado == LIVRE:
+            if not aba.cnpj:
+                if not fila:
+                    return False
+                aba.cnpj, aba.codigo = fila.popleft()
+                aba.tentativas = tentativas_por_cnpj
+                aba.pausas = 0
+                aba.inicio_cnpj = time.monotonic()
+            aba.inicio_tentativa = time.monotonic()
+            driver.switch_to.window(aba.handle)
+            aba.url_filtro, aba.marca = pesquisar_cnpj(
+                driver,
+                esperas,
+                aba.cnpj,
+                data_inicial,
+                data_final,
+                aba.url_filtro,
+                reaproveitar=manter_pagina_filtro and not aba.forcar_navegacao,
+            )
+            aba.forcar_navegacao = False
+            mudar(aba, PESQUISANDO, prazo_etapa(PESQUISANDO))
+            reportar(aba, aba.estado)
+            return True
+
+        if aba.estado == PESQUISANDO:
+            entrar_frame(aba)
+            resultado = _condicao_imediata(driver, resultado_pesquisa((By.XPATH, XPATH_VISUALIZAR), aba.marca))
+            if not resultado:
+                return False
+            if resultado == SEM_RESULTADO:
+                logging.info(f"Nenhuma declaração encontrada para CNPJ {aba.cnpj}.")
+                finalizar(aba, 'Nenhuma declaração encontrada', resultado='sem declaracao')
+                return True
+            resultado.click()
+            mudar(aba, ABRINDO_DECLARACAO, prazo_etapa(ABRINDO_DECLARACAO))
+            reportar(aba, aba.estado)
+            return True
+
+        if aba.estado in (ABRINDO_DECLARACAO, AGUARDANDO_VEZ):
+            entrar_frame(aba)
+            bt_emitir_darf = _condicao_imediata(driver, EC.element_to_be_clickable((By.XPATH, XPATH_EMITIR_DARF)))
+            if not bt_emitir_darf:
+                return False
+            if emitindo is not None or not monitor.descartar_atrasados():
+                # Declaração aberta: espera a vez sem prazo, o download da outra aba
+                # (ou o atrasado, que será isolado) tem o seu
+                if aba.estado != AGUARDANDO_VEZ:
+                    mudar(aba, AGUARDANDO_VEZ)
+                    reportar(aba, aba.estado)
+                return False
+            emitindo = aba
+            monitor.preparar()
+            bt_emitir_darf.click()
+            mudar(aba, BAIXANDO, prazo_etapa(BAIXANDO, timeout_download))
+            reportar(aba, aba.estado)
+            return True
+
+        if aba.estado == BAIXANDO:
+            arquivo = monitor.verificar()
+            if arquivo is None:
+                return False
+            emitindo = None
+            logging.info(f"Arquivo {arquivo.name} associado ao CNPJ {aba.cnpj}")
+            if not renomear_arquivo(arquivo, aba.codigo, competencia, pasta_destino) or not darf(aba.codigo).exists():
+                raise RenomearDarfError(f"DARF de {aba.cnpj} não foi salvo como {darf(aba.codigo).name}")
+            gravador.atualizar(aba.cnpj, 'Guia baixada', arquivo=darf(aba.codigo))
+            mudar(aba, CONFIRMANDO, prazo_etapa(CONFIRMANDO))
+            return True
+
+        if aba.estado == CONFIRMANDO:
+            entrar_frame(aba)
+            bt_ok = _condicao_imediata(driver, EC.presence_of_element_located((By.XPATH, XPATH_OK)))
+            if not bt_ok:
+                return False
+            bt_ok.click()
+            finalizar(aba, 'Guia baixada')
+            return True
+
+        return False
+
+    def abandonar_download():
+        """Libera a emissão; o download em andamento, se chegar, não vale para a próxima aba."""
+        nonlocal emitindo
+        if emitindo is not None:
+            monitor.registrar_atraso(timeout_download)
+            emitindo = None
+
+    def tratar_erro(aba, status, erro, repetir):
+        if emitindo is aba:
+            abandonar_download()
+        try:
+            driver.switch_to.window(aba.handle)
+        except WebDriverException:
+            pass
+        aba.forcar_navegacao = True
+        portal = repetir and not isinstance(erro, RenomearDarfError)
+        if portal and disjuntor is not None and disjuntor.falha(aba.cnpj) and aba.pausas < tentativas_por_cnpj:
+            # Indisponibilidade do portal: a tentativa não é contada (até tentativas_por_cnpj vezes)
+            aba.pausas += 1
+            reportar(aba, f"falha durante indisponibilidade do portal em '{aba.estado}': {erro}")
+            registrar_tentativa(aba, 'Portal indisponível', erro=type(erro).__name__)
+            for anterior in disjuntor.cnpjs_afetados():
+                if (anterior != aba.cnpj and anterior in codigo_por_cnpj and anterior not in reenfileirados
+                        and 'Erro no download' in str(gravador.status(anterior))):
+                    reenfileirados.add(anterior)
+                    fila.append((anterior, codigo_por_cnpj[anterior]))
+            mudar(aba, LIVRE, resultado=type(erro).__name__, sucesso=False)
+            return
+        restantes = aba.tentativas - 1 if repetir else 0
+        reportar(aba, f"{status} em '{aba.estado}': {erro}")
+        if restantes > 0:
+            logging.info(f"Tentando novamente ({restantes} tentativas restantes)")
+            gravador.atualizar(aba.cnpj, status)
+            registrar_tentativa(aba, status, erro=type(erro).__name__)
+            mudar(aba, LIVRE, resultado=type(erro).__name__, sucesso=False)
+            aba.tentativas = restantes
+        else:
+            if repetir:
+                logging.error(f"Falha após {tentativas_por_cnpj} tentativas para o cliente {aba.cnpj}")
+            finalizar(aba, status, resultado=type(erro).__name__, sucesso=False)
+
+    try:
+        while any(aba.cnpj for aba in lista_abas) or fila:
+            if should_stop and should_stop():
+                logging.info("Execução interrompida pelo usuário.")
+                break
+
+            progresso = False
+            for aba in lista_abas:
+                try:
+                    progresso = avancar(aba) or progresso
+                except (
+                    TimeoutException, TimeoutError, NoSuchElementException, StaleElementReferenceException,
+                    RenomearDarfError,
+                ) as e:
+                    logging.error(f"Erro de elemento Selenium no processamento do cliente {aba.cnpj}: {e}")
+                    tratar_erro(aba, 'Erro no download', e, repetir=True)
+                    progresso = True
+                except Exception as e:
+                    logging.error(f"Erro inesperado no processamento do cliente {aba.cnpj}: {e}")
+                    tratar_erro(aba, 'Erro inesperado', e, repetir=False)
+                    progresso = True
+
+            if disjuntor is not None and disjuntor.aberto:
+                try:
+                    driver.switch_to.window(handles[0])
+                except WebDriverException:
+                    pass
+                if not disjuntor.aguardar_portal(lambda: portal_disponivel(driver, timeout_elemento), should_stop):
+                    continue
+                # Etapas interrompidas pela pausa recomeçam pela pesquisa
+                abandonar_download()
+                for aba in lista_abas:
+                    aba.forcar_navegacao = True
+                    if aba.cnpj and aba.estado != LIVRE:
+                        mudar(aba, LIVRE, resultado='pausa', sucesso=False)
+                continue
+
+            if not progresso:
+                time.sleep(INTERVALO_VERIFICACAO)
+    finally:
+        monitor.fechar()
+        for handle in handles[1:]:
+            try:
+                driver.switch_to.window(handle)
+                driver.close()
+            except WebDriverException:
+                pass
+        try:
+            driver.switch_to.window(handles[0])
+        except WebDriverException:
+            pass
+        if gravador_proprio:
+            gravador.fechar()
+
+    if callback:
+        callback("Processamento concluído!", total, total)
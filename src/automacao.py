@@ -3,6 +3,7 @@ Módulo de automação para transmissão DCTF no e-CAC.
 """
 import logging
 import time
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Callable, Optional
 
@@ -10,19 +11,71 @@ import undetected_chromedriver as uc
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-
-from src.utils import get_chrome_version, renomear_arquivo_recente
-from src.planilha import atualizar_status
-
-
-def configurar_driver(pasta_competencia):
+from selenium.common.exceptions import (
+    TimeoutException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    WebDriverException,
+)
+
+from src.downloads import DownloadsCDP, MonitorDownloads, habilitar_eventos_download
+from src.esperas import PERFIL_EVENTOS, SEM_RESULTADO, Esperas
+from src.utils import caminho_darf, get_chrome_version, renomear_arquivo, renomear_arquivo_recente
+from src.metricas import ETAPA_CNPJ, RegistroEtapas
+from src.planilha import GravadorPlanilha
+from src.perfil import PerfilEmUsoError, travar_perfil
+from src.resiliencia import Disjuntor, aguardar, espera_exponencial
+from src.sessao import restaurar_sessao, salvar_sessao, sessao_valida
+
+
+# Endereços do e-CAC
+URL_LOGIN = 'https://cav.receita.fazenda.gov.br/autenticacao/login'
+URL_ECAC = 'https://cav.receita.fazenda.gov.br/ecac/'
+
+# XPaths do painel de outorgantes (UpdatePanel do ASP.NET dentro do frmApp)
+XPATH_PAINEL_OUTORGANTES = '//*[@id="ctl00_cphConteudo_UpdatePanelListaOutorgantes"]/div/div[2]/div/div/div'
+
+# XPaths da listagem e da declaração
+XPATH_VISUALIZAR = '//*[@id="ctl00_cphConteudo_tabelaListagemDctf_GridViewDctfs_ctl02_lbkVisualizarDctf"]'
+XPATH_EMITIR_DARF = '//*[@id="LinkEmitirDARFIntegral"]'
+XPATH_OK = "//button[text()='OK']"
+
+# Espera implícita do driver no perfil de espera 'fixo' (ver configurar_driver)
+ESPERA_IMPLICITA = 10
+
+# Etapas retomáveis do processamento de um CNPJ, na ordem em que ocorrem.
+# Uma nova tentativa recomeça na primeira etapa cuja pré-condição não vale mais.
+ETAPA_PESQUISA = 'pesquisa'          # navegação, pesquisa e leitura da grade
+ETAPA_DECLARACAO = 'declaracao'      # pré-condição: grade do CNPJ com o link Visualizar
+ETAPA_DOWNLOAD = 'download'          # pré-condição: declaração aberta com o link Emitir DARF
+ETAPA_RENOMEAR = 'renomear'          # pré-condição: arquivo baixado ainda sem renomear
+ETAPA_CONFIRMACAO = 'confirmacao'    # pré-condição: DARF renomeado na pasta final
+
+
+class RenomearDarfError(RuntimeError):
+    """O DARF baixado não chegou à pasta final com o nome do cliente."""
+
+
+def configurar_driver(
+    pasta_competencia,
+    perfil_espera: str = PERFIL_EVENTOS,
+    eventos_download: bool = False,
+    varias_abas: bool = False,
+    pasta_perfil=None
+):
     """
     Configura e retorna uma instância do ChromeDriver com o diretório de download definido.
-    O Chrome usa um perfil temporário (sem cache persistente).
+    Por padrão o Chrome usa um perfil temporário (sem cache persistente).
 
     Args:
         pasta_competencia (str or Path): Pasta onde os arquivos serão baixados.
+        perfil_espera (str): Perfil de espera da execução. No perfil 'eventos' a
+            espera implícita é desativada, pois todas as esperas são explícitas.
+        eventos_download (bool): Ativa os eventos de download do DevTools (ver DownloadsCDP).
+        varias_abas (bool): Evita que o Chrome desacelere as abas em segundo plano
+            (ver transmissao_abas).
+        pasta_perfil (str or Path): Se informada, usa essa pasta como perfil persistente
+            do Chrome (cache HTTP mantido entre execuções), reservada com trava.
 
     Returns:
         driver (uc.Chrome): Instância do Chrome configurada.
@@ -44,25 +97,51 @@ def configurar_driver(pasta_competencia):
         options.add_argument("--disable-extensions")
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-infobars")
+        if varias_abas:
+            # Abas em segundo plano continuam com timers e renderização em ritmo normal
+            options.add_argument("--disable-background-timer-throttling")
+            options.add_argument("--disable-renderer-backgrounding")
+            options.add_argument("--disable-backgrounding-occluded-windows")
         options.add_experimental_option("prefs", {
             "download.default_directory": str(pasta_competencia),
             "download.prompt_for_download": False,
             "profile.default_content_settings.popups": 0,
         })
+        if eventos_download:
+            # Eventos do DevTools chegam pelo log 'performance' do ChromeDriver
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+            options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": False, "enablePage": True})
+
+        opcoes_chrome = {}
+        if pasta_perfil:
+            travar_perfil(pasta_perfil)
+            opcoes_chrome['user_data_dir'] = str(pasta_perfil)
 
         # Usar a versão do Chrome instalada para baixar o driver compatível (evita erro 145 vs 144)
         version_main = get_chrome_version()
+        inicio = time.perf_counter()
         if version_main is not None:
             logging.info(f"Chrome detectado: versão principal {version_main}. Usando driver compatível.")
-            driver = uc.Chrome(options=options, version_main=version_main)
+            driver = uc.Chrome(options=options, version_main=version_main, **opcoes_chrome)
         else:
-            driver = uc.Chrome(options=options)
-        driver.get('https://cav.receita.fazenda.gov.br/autenticacao/login')
+            driver = uc.Chrome(options=options, **opcoes_chrome)
+        tempo_inicio = time.perf_counter() - inicio
+        if eventos_download:
+            habilitar_eventos_download(driver, pasta_competencia)
+        inicio = time.perf_counter()
+        driver.get(URL_LOGIN)
+        tempo_pagina = time.perf_counter() - inicio
+        logging.info(
+            f"Chrome iniciado em {tempo_inicio:.2f}s; primeira página carregada em {tempo_pagina:.2f}s "
+            f"(perfil {'persistente' if pasta_perfil else 'temporário'})"
+        )
         driver.maximize_window()
-        driver.implicitly_wait(10)
+        driver.implicitly_wait(0 if perfil_espera == PERFIL_EVENTOS else ESPERA_IMPLICITA)
         logging.info("Driver configurado com sucesso.")
         return driver
 
+    except PerfilEmUsoError:
+        raise
     except Exception as e:
         msg_original = str(e).strip()
         logging.error(f"Falha ao configurar driver: {msg_original}")
@@ -73,13 +152,15 @@ def configurar_driver(pasta_competencia):
         ) from e
 
 
-def login(driver, callback: Optional[Callable[[str], None]] = None):
+def login(driver, callback: Optional[Callable[[str], None]] = None, arquivo_sessao=None):
     """
     Realiza o processo de login manual no e-CAC, aguardando confirmação do usuário.
     
     Args:
         driver (uc.Chrome): Instância do Chrome já aberta na página de login.
         callback: Função opcional para feedback de status (para GUI).
+        arquivo_sessao: Se informado, a sessão confirmada é gravada nele
+            (ver restaurar_sessao) para dispensar o login em reinícios.
         
     Returns:
         bool: True se o login foi confirmado pelo usuário.
@@ -101,21 +182,306 @@ def login(driver, callback: Optional[Callable[[str], None]] = None):
         
         logging.info("Verificando se login foi concluído.")
         
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="linkHome"]'))
-            )
+        if sessao_valida(driver, 10):
             logging.info("Login realizado com sucesso. Página principal identificada.")
+            if arquivo_sessao:
+                try:
+                    salvar_sessao(driver, arquivo_sessao)
+                except OSError as e:
+                    logging.warning(f"Não foi possível gravar a sessão: {e}")
             return True
-        except TimeoutException:
-            logging.warning("Não foi possível confirmar se o login foi bem-sucedido.")
-            return True
+        logging.warning("Não foi possível confirmar se o login foi bem-sucedido.")
+        return True
             
     except Exception as e:
         logging.error(f"Erro durante o processo de login: {e}")
         return True
 
 
+def retomar_sessao(driver, arquivo_sessao, timeout=10):
+    """
+    Tenta restaurar a sessão gravada por login() em um navegador recém-aberto.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome criada por configurar_driver.
+        arquivo_sessao (str or Path): Arquivo de sessão gravado após o login.
+        timeout (int): Tempo máximo para confirmar a sessão (segundos).
+
+    Returns:
+        bool: True se a sessão ainda é válida (login manual dispensado).
+            Se False, o navegador volta para a página de login.
+    """
+    if not arquivo_sessao or not Path(arquivo_sessao).exists():
+        return False
+    if restaurar_sessao(driver, arquivo_sessao, URL_ECAC, timeout):
+        return True
+    driver.get(URL_LOGIN)
+    return False
+
+
+def _navegar_ate_filtro(driver, esperas):
+    """
+    Navega a partir da Home até a página de filtro da DCTFWeb, dentro do frmApp.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome já logada.
+        esperas (Esperas): Camada de espera da execução (define também o timeout).
+
+    Returns:
+        str: URL da página de filtro carregada no frmApp.
+    """
+    timeout_elemento = esperas.timeout
+    driver.switch_to.default_content()
+
+    bt_home = WebDriverWait(driver, timeout_elemento).until(
+        EC.element_to_be_clickable((By.XPATH, '//*[@id="linkHome"]'))
+    )
+    logging.info("Clicando no botão Home")
+    esperas.marcar()
+    bt_home.click()
+    esperas.apos_navegacao(2)  # Aguardar página principal carregar completamente
+
+    bt_declaracoes = WebDriverWait(driver, timeout_elemento).until(
+        EC.element_to_be_clickable((By.XPATH, '//li[@id="btn214"]'))
+    )
+    logging.info("Clicando no botão Declarações e Demonstrativos")
+    esperas.antes_da_acao(1)
+    bt_declaracoes.click()
+    esperas.apos_acao(2)  # Aguardar submenu expandir
+
+    bt_assinar = WebDriverWait(driver, timeout_elemento).until(
+        EC.element_to_be_clickable((By.XPATH, '//*[@id="containerServicos214"]/div[2]/ul/li[1]/a'))
+    )
+    logging.info("Clicando no botão Assinar e transmitir DCTF")
+    esperas.antes_da_acao(1)  # Aguardar link ficar visível
+    esperas.marcar()
+    bt_assinar.click()
+    esperas.apos_navegacao(2)  # Aguardar página carregar antes de buscar iframe
+
+    esperas.entrar_frame((By.XPATH, '//*[@id="frmApp"]'))
+
+    _marcar_sou_procurador(driver, esperas)
+    return driver.execute_script("return window.location.href;")
+
+
+def _marcar_sou_procurador(driver, esperas):
+    """Marca a opção 'Sou Procurador' caso ainda não esteja marcada."""
+    bt_sou_procurador = WebDriverWait(driver, esperas.timeout).until(
+        EC.element_to_be_clickable((By.XPATH, '//*[@id="ctl00_cphConteudo_chkListarOutorgantes"]'))
+    )
+    if not bt_sou_procurador.is_selected():
+        logging.info("Clicando no botão Sou Procurador")
+        marca = esperas.marcar()
+        bt_sou_procurador.click()
+        esperas.apos_postback(marca, 0)
+
+
+def _retomar_pagina_filtro(driver, esperas, url_filtro=None):
+    """
+    Tenta reaproveitar a página de filtro já aberta no frmApp, sem passar pela Home.
+
+    Se o frmApp estiver em outra página (ex.: visualização da declaração) e a URL
+    do filtro for conhecida, recarrega apenas o iframe nessa URL.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome já logada.
+        esperas (Esperas): Camada de espera da execução.
+        url_filtro (str): URL da página de filtro registrada na última navegação.
+
+    Returns:
+        bool: True se o driver ficou posicionado na página de filtro, dentro do frmApp.
+    """
+    # Sem espera implícita: aqui a ausência de elementos é resposta, não atraso
+    espera_implicita = driver.timeouts.implicit_wait
+    driver.implicitly_wait(0)
+    try:
+        frame_atual = driver.execute_script("return window.frameElement && window.frameElement.id;")
+        if frame_atual != 'frmApp':
+            driver.switch_to.default_content()
+            frames = driver.find_elements(By.ID, 'frmApp')
+            if not frames:
+                return False
+            driver.switch_to.frame(frames[0])
+
+        if not driver.find_elements(By.ID, 'txtDataInicio'):
+            if not url_filtro:
+                return False
+            logging.info("Recarregando a página de filtro no frmApp")
+            esperas.recarregar_frame(url_filtro)
+            WebDriverWait(driver, esperas.timeout).until(
+                EC.presence_of_element_located((By.ID, 'txtDataInicio'))
+            )
+
+        _marcar_sou_procurador(driver, esperas)
+        return True
+    except (TimeoutException, WebDriverException) as e:
+        logging.info(f"Página de filtro não reaproveitada: {e}")
+        return False
+    finally:
+        driver.implicitly_wait(espera_implicita)
+
+
+def _preencher_campo(driver, timeout_elemento, xpath, valor):
+    """Preenche um campo de texto, evitando reescrever quando o valor já confere."""
+    campo = WebDriverWait(driver, timeout_elemento).until(
+        EC.element_to_be_clickable((By.XPATH, xpath))
+    )
+    if campo.get_attribute('value') != valor:
+        campo.clear()
+        campo.send_keys(valor)
+
+
+def pesquisar_cnpj(
+    driver,
+    esperas,
+    cnpj,
+    data_inicial,
+    data_final,
+    url_filtro=None,
+    reaproveitar=True,
+    cronometro=None,
+    ajustar_timeout=None
+):
+    """
+    Posiciona o driver na página de filtro, seleciona o outorgante e dispara a pesquisa.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome já logada.
+        esperas (Esperas): Camada de espera da execução.
+        cnpj (str): CNPJ do outorgante.
+        data_inicial (str): Data inicial do filtro.
+        data_final (str): Data final do filtro.
+        url_filtro (str): URL da página de filtro registrada na última navegação.
+        reaproveitar (bool): Se True, tenta reaproveitar a página de filtro atual.
+        cronometro: Função nome -> medidor de etapa (ver RegistroEtapas.cronometro).
+        ajustar_timeout: Função chamada com o nome da etapa antes de executá-la,
+            para ajustar esperas.timeout (ver TimeoutsAdaptativos).
+
+    Returns:
+        tuple: (URL da página de filtro, marca do documento antes da pesquisa)
+    """
+    etapa = cronometro or (lambda nome: nullcontext())
+    ajustar_timeout = ajustar_timeout or (lambda nome: None)
+
+    ajustar_timeout('navegacao')
+    with etapa('navegacao') as intervalo:
+        if reaproveitar and _retomar_pagina_filtro(driver, esperas, url_filtro):
+            logging.info(f"Reaproveitando a página de filtro para CNPJ {cnpj}.")
+            # Só a navegação completa, a partir da Home, alimenta o timeout da etapa
+            if intervalo is not None:
+                intervalo.resultado = 'filtro reaproveitado'
+        else:
+            logging.info(f"Iniciando navegação no sistema para CNPJ {cnpj}.")
+            url_filtro = _navegar_ate_filtro(driver, esperas)
+
+    ajustar_timeout('pesquisa')
+    with etapa('pesquisa'):
+        marca = _preencher_pesquisa(driver, esperas, cnpj, data_inicial, data_final)
+    return url_filtro, marca
+
+
+def _preencher_pesquisa(driver, esperas, cnpj, data_inicial, data_final):
+    """Preenche datas e outorgante na página de filtro e clica em pesquisar; retorna a marca do documento."""
+    timeout_elemento = esperas.timeout
+    logging.info(f'Iniciando a transmissão da empresa: {cnpj}')
+    _preencher_campo(driver, timeout_elemento, '//*[@id="txtDataInicio"]', data_inicial)
+    _preencher_campo(driver, timeout_elemento, '//*[@id="txtDataFinal"]', data_final)
+
+    bt_ortogante = WebDriverWait(driver, timeout_elemento).until(
+        EC.presence_of_element_located((By.XPATH, f'{XPATH_PAINEL_OUTORGANTES}/button'))
+    )
+    logging.info("Clicando no botão Outorgante")
+    bt_ortogante.click()
+
+    bt_nenhum = WebDriverWait(driver, timeout_elemento).until(
+        EC.presence_of_element_located((By.XPATH, f'{XPATH_PAINEL_OUTORGANTES}/div/div[2]/div/button[2]'))
+    )
+    logging.info("Clicando no botão Nenhum")
+    bt_nenhum.click()
+
+    campo_cnpj = WebDriverWait(driver, timeout_elemento).until(
+        EC.presence_of_element_located((By.XPATH, f'{XPATH_PAINEL_OUTORGANTES}/div/div[1]/input'))
+    )
+    campo_cnpj.clear()
+    campo_cnpj.send_keys(cnpj)
+
+    selecionar_cnpj = WebDriverWait(driver, timeout_elemento).until(
+        EC.presence_of_element_located((By.XPATH, f'{XPATH_PAINEL_OUTORGANTES}/div/ul'))
+    )
+    selecionar_cnpj.click()
+
+    bt_pesquisar = WebDriverWait(driver, timeout_elemento).until(
+        EC.presence_of_element_located((By.XPATH, '//*[@id="ctl00_cphConteudo_btnFiltar"]'))
+    )
+    esperas.antes_da_acao(0)  # Seleção do outorgante pode disparar postback
+    marca = esperas.marcar()
+    bt_pesquisar.click()
+    return marca
+
+
+def _elemento_no_frame(driver, xpath) -> bool:
+    """Verifica, sem esperar, se o elemento está visível no frmApp (deixa o driver no frame)."""
+    espera_implicita = driver.timeouts.implicit_wait
+    driver.implicitly_wait(0)
+    try:
+        driver.switch_to.default_content()
+        frames = driver.find_elements(By.ID, 'frmApp')
+        if not frames:
+            return False
+        driver.switch_to.frame(frames[0])
+        return any(elemento.is_displayed() for elemento in driver.find_elements(By.XPATH, xpath))
+    except WebDriverException:
+        return False
+    finally:
+        driver.implicitly_wait(espera_implicita)
+
+
+def portal_disponivel(driver, timeout=10) -> bool:
+    """Sonda do disjuntor: abre a página inicial do e-CAC e verifica se ela responde logada."""
+    try:
+        driver.switch_to.default_content()
+        driver.get(URL_ECAC)
+        return sessao_valida(driver, timeout)
+    except WebDriverException:
+        return False
+
+
+def _etapa_de_retomada(driver, etapa_falha, darf, arquivo, monitor):
+    """
+    Escolhe a etapa em que a próxima tentativa do CNPJ deve recomeçar.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome.
+        etapa_falha (str): Etapa em que a tentativa falhou.
+        darf (Path): Caminho final do DARF do CNPJ.
+        arquivo (Path): Arquivo baixado nesta execução e ainda não renomeado (ou None).
+        monitor: Monitor de downloads (MonitorDownloads ou DownloadsCDP).
+
+    Returns:
+        tuple: (etapa, arquivo baixado ou None)
+    """
+    if darf.exists():
+        return ETAPA_CONFIRMACAO, None
+    if arquivo is not None and Path(arquivo).exists():
+        return ETAPA_RENOMEAR, arquivo
+    if etapa_falha == ETAPA_DOWNLOAD:
+        # O download pode ter terminado depois do timeout: não emite outro DARF
+        tardio = monitor.verificar()
+        if tardio is not None:
+            logging.info(f"Download concluído após o timeout: {tardio.name}")
+            monitor.cancelar_atraso()
+            return ETAPA_RENOMEAR, tardio
+    if etapa_falha in (ETAPA_DECLARACAO, ETAPA_DOWNLOAD) and _elemento_no_frame(driver, XPATH_EMITIR_DARF):
+        return ETAPA_DOWNLOAD, None
+    if etapa_falha == ETAPA_DECLARACAO and _elemento_no_frame(driver, XPATH_VISUALIZAR):
+        return ETAPA_DECLARACAO, None
+    try:
+        driver.switch_to.default_content()
+    except WebDriverException:
+        pass
+    return ETAPA_PESQUISA, None
+
+
 def transmissao(
     cnpjs, 
     codigos, 
@@ -129,10 +495,27 @@ def transmissao(
     tentativas_por_cnpj: int = 3,
     callback: Optional[Callable[[str, int, int], None]] = None,
     should_stop: Optional[Callable[[], bool]] = None,
-    planilha_path: Optional[str] = None
+    planilha_path: Optional[str] = None,
+    manter_pagina_filtro: bool = True,
+    perfil_espera: str = PERFIL_EVENTOS,
+    pausa_minima: float = 0.5,
+    timeout_download: int = 60,
+    downloads_cdp: bool = False,
+    gravador: Optional[GravadorPlanilha] = None,
+    pasta_destino: Optional[str] = None,
+    metricas: Optional[RegistroEtapas] = None,
+    disjuntor: Optional[Disjuntor] = None
 ):
     """
     Realiza o processo de transmissão e download dos DARFs para cada cliente da lista.
+
+    Cada CNPJ passa pelas etapas pesquisa, declaração, download, renomear e
+    confirmação. Após um erro, a nova tentativa recomeça na primeira etapa cuja
+    pré-condição não vale mais (ver _etapa_de_retomada), e um DARF já presente
+    na pasta final nunca é emitido de novo. Se um download exceder o timeout,
+    o próximo CNPJ só começa depois que o arquivo atrasado chegar (e for
+    isolado como '_orfao') ou um novo timeout_download se esgotar. As novas
+    tentativas aguardam um tempo crescente com jitter (ver espera_exponencial).
     
     Args:
         cnpjs (list): Lista de CNPJs.
@@ -147,195 +530,278 @@ def transmissao(
         tentativas_por_cnpj (int): Número de tentativas por CNPJ.
         callback: Função para reportar progresso (mensagem, atual, total).
         should_stop: Função que retorna True se deve parar a execução.
-        planilha_path: Caminho para salvar a planilha (opcional).
+        planilha_path: Caminho para salvar a planilha (opcional, ignorado se houver gravador).
+        manter_pagina_filtro: Se True, permanece no frmApp entre CNPJs e só volta
+            pela Home quando não estiver na página de filtro.
+        perfil_espera: 'eventos' (aguarda sinais da página) ou 'fixo' (pausas antigas).
+        pausa_minima: Intervalo mínimo entre ações no perfil 'eventos' (segundos).
+        timeout_download: Tempo máximo para cada download de DARF concluir (segundos).
+        downloads_cdp: Se True, identifica cada download pelo GUID dos eventos do
+            DevTools (o driver deve ter sido criado com eventos_download=True).
+        gravador: Gravador de status da planilha. Se None, um gravador é criado
+            para planilha_path e fechado (com gravação final) ao término.
+        pasta_destino: Pasta final dos DARFs renomeados. Se None, usa pasta_competencia.
+        metricas: Registro do tempo de cada etapa (ver RegistroEtapas). Se None,
+            as durações ficam apenas em memória. Se tiver uma política de
+            timeouts, cada etapa usa o timeout aprendido no lugar de
+            timeout_elemento/timeout_download.
+        disjuntor: Disjuntor que pausa o lote quando o e-CAC parece fora do ar
+            (ver Disjuntor). As falhas durante a pausa não consomem tentativas
+            (até tentativas_por_cnpj pausas por CNPJ; depois disso contam), e os CNPJs que esgotaram as tentativas na sequência de falhas voltam
+            para o fim da fila.
     """
-    total = len(cnpjs)
-    planilha_save_path = planilha_path or 'database.xlsx'
+    if metricas is None:
+        metricas = RegistroEtapas()
+    politica = metricas.timeouts
+
+    def limite(etapa, padrao=timeout_elemento):
+        """Timeout da etapa (aprendido ou padrão), aplicado também às esperas."""
+        segundos = politica.timeout(etapa, padrao) if politica is not None else padrao
+        esperas.timeout = segundos
+        return segundos
+
+    esperas = Esperas(driver, perfil=perfil_espera, pausa_minima=pausa_minima, timeout=timeout_elemento)
+    monitor = DownloadsCDP(driver, pasta_competencia) if downloads_cdp else MonitorDownloads(pasta_competencia)
+    gravador_proprio = gravador is None
+    if gravador_proprio:
+        gravador = GravadorPlanilha(df, planilha_path or 'database.xlsx')
+    url_filtro = None
+    forcar_navegacao = True
+    codigo_por_cnpj = dict(zip(cnpjs, codigos))
+    fila = gravador.pendentes(cnpjs, codigos)
+    total = len(fila)
+    if total < len(cnpjs):
+        logging.info(f"{len(cnpjs) - total} CNPJs já processados com sucesso. Pulando...")
+    reenfileirados = set()
+
+    def reenfileirar_afetados(atual):
+        """Devolve à fila os CNPJs que esgotaram as tentativas durante a indisponibilidade."""
+        for anterior in disjuntor.cnpjs_afetados():
+            if (anterior != atual and anterior in codigo_por_cnpj and anterior not in reenfileirados
+                    and 'Erro no download' in str(gravador.status(anterior))):
+                logging.info(f"CNPJ {anterior} volta para a fila após a indisponibilidade do portal.")
+                reenfileirados.add(anterior)
+                fila.append((anterior, codigo_por_cnpj[anterior]))
     
-    for idx, (cnpj, codigo) in enumerate(zip(cnpjs, codigos)):
-        # Verificar se deve parar
-        if should_stop and should_stop():
-            logging.info("Execução interrompida pelo usuário.")
-            break
-        
-        # Reportar progresso
-        if callback:
-            callback(f"Processando {cnpj}...", idx + 1, total)
-        
-        # Verificar status - CORRIGIDO: só pula se já foi baixada com sucesso
-        cnpj_str = str(cnpj).strip()
-        status = df.loc[df['CNPJ'] == cnpj_str, 'STATUS'].values
-        
-        if len(status) > 0 and 'Guia baixada' in str(status[0]):
-            logging.info(f"CNPJ {cnpj} já processado com sucesso. Pulando...")
-            continue
-        
-        tentativas = tentativas_por_cnpj
-        sucesso = False
-        
-        while tentativas > 0 and not sucesso:
+    try:
+        # A fila pode crescer durante o laço (ver reenfileirar_afetados)
+        for idx, (cnpj, codigo) in enumerate(fila):
             # Verificar se deve parar
             if should_stop and should_stop():
                 logging.info("Execução interrompida pelo usuário.")
                 break
-            
-            try:
-                # Garantir que estamos no contexto principal antes de começar
-                try:
-                    driver.switch_to.default_content()
-                except Exception:
-                    pass
-                
-                logging.info(f"Iniciando navegação no sistema para CNPJ {cnpj}.")
-
-                bt_home = WebDriverWait(driver, timeout_elemento).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="linkHome"]'))
-                )
-                logging.info("Clicando no botão Home")
-                bt_home.click()
-                time.sleep(2)  # Aguardar página principal carregar completamente
-
-                bt_declaracoes = WebDriverWait(driver, timeout_elemento).until(
-                    EC.element_to_be_clickable((By.XPATH, '//li[@id="btn214"]'))
-                )
-                logging.info("Clicando no botão Declarações e Demonstrativos")
-                time.sleep(1)
-                bt_declaracoes.click()
-                time.sleep(2)  # Aguardar submenu expandir
-
-                bt_assinar = WebDriverWait(driver, timeout_elemento).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="containerServicos214"]/div[2]/ul/li[1]/a'))
-                )
-                logging.info("Clicando no botão Assinar e transmitir DCTF")
-                time.sleep(1)  # Aguardar link ficar visível
-                bt_assinar.click()
-                time.sleep(2)  # Aguardar página carregar antes de buscar iframe
-
-                iframe = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="frmApp"]'))
-                )
-                driver.switch_to.frame(iframe)
-                
-                bt_sou_procurador = WebDriverWait(driver, timeout_elemento).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="ctl00_cphConteudo_chkListarOutorgantes"]'))
-                )
-                logging.info("Clicando no botão Sou Procurador")
-                bt_sou_procurador.click()
-                driver.switch_to.default_content()
-
-                logging.info(f'Iniciando a transmissão da empresa: {cnpj}')
-                iframe = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="frmApp"]'))
-                )
-                driver.switch_to.frame(iframe)
-
-                data_inicio = WebDriverWait(driver, timeout_elemento).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="txtDataInicio"]'))
-                )
-                data_inicio.clear()
-                data_inicio.send_keys(data_inicial)
-
-                data_fim = WebDriverWait(driver, timeout_elemento).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="txtDataFinal"]'))
-                )
-                data_fim.clear()
-                data_fim.send_keys(data_final)
-
-                bt_ortogante = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="ctl00_cphConteudo_UpdatePanelListaOutorgantes"]/div/div[2]/div/div/div/button'))
-                )
-                logging.info("Clicando no botão Outorgante")
-                bt_ortogante.click()
-
-                bt_nenhum = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="ctl00_cphConteudo_UpdatePanelListaOutorgantes"]/div/div[2]/div/div/div/div/div[2]/div/button[2]'))
-                )
-                logging.info("Clicando no botão Nenhum")
-                bt_nenhum.click()
-
-                campo_cnpj = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="ctl00_cphConteudo_UpdatePanelListaOutorgantes"]/div/div[2]/div/div/div/div/div[1]/input'))
-                )
-                campo_cnpj.send_keys(cnpj)
-
-                selecionar_cnpj = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="ctl00_cphConteudo_UpdatePanelListaOutorgantes"]/div/div[2]/div/div/div/div/ul'))
-                )
-                selecionar_cnpj.click()
-
-                bt_pesquisar = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="ctl00_cphConteudo_btnFiltar"]'))
-                )
-                bt_pesquisar.click()
+        
+            # Reportar progresso
+            if callback:
+                callback(f"Processando {cnpj}...", min(idx + 1, total), total)
+        
+            tentativas = tentativas_por_cnpj
+            sucesso = False
+            tentativa = 0
+            pausas = 0
+            status_cnpj = None
+            inicio_cnpj = time.perf_counter()
+
+            # Idempotência: com o DARF já renomeado na pasta final, não emite outro
+            darf = caminho_darf(codigo, competencia, pasta_destino or pasta_competencia)
+            if darf.exists():
+                logging.info(f"DARF de {cnpj} já existe ({darf.name}). Não será emitido novamente.")
+                gravador.atualizar(cnpj, 'Guia baixada', arquivo=darf)
+                gravador.salvar_se_necessario()
+                continue
+
+            etapa = ETAPA_PESQUISA
+            arquivo = None
+            bt_visualizar = None
+
+            while tentativas > 0 and not sucesso:
+                # Verificar se deve parar
+                if should_stop and should_stop():
+                    logging.info("Execução interrompida pelo usuário.")
+                    break
 
+                if disjuntor is not None and disjuntor.aberto:
+                    if not disjuntor.aguardar_portal(lambda: portal_disponivel(driver, timeout_elemento), should_stop):
+                        continue
+                    # A sondagem levou o navegador à página inicial
+                    forcar_navegacao = True
+                    if etapa in (ETAPA_DECLARACAO, ETAPA_DOWNLOAD):
+                        etapa = ETAPA_PESQUISA
+            
+                tentativa += 1
+                cronometro = metricas.cronometro(cnpj, tentativa)
+                inicio_tentativa = time.perf_counter()
                 try:
-                    bt_visualizar = WebDriverWait(driver, 15).until(
-                        EC.element_to_be_clickable((By.XPATH, '//*[@id="ctl00_cphConteudo_tabelaListagemDctf_GridViewDctfs_ctl02_lbkVisualizarDctf"]'))
+                    if etapa == ETAPA_PESQUISA:
+                        url_filtro, marca = pesquisar_cnpj(
+                            driver,
+                            esperas,
+                            cnpj,
+                            data_inicial,
+                            data_final,
+                            url_filtro,
+                            reaproveitar=manter_pagina_filtro and not forcar_navegacao,
+                            cronometro=cronometro,
+                            ajustar_timeout=limite,
+                        )
+                        forcar_navegacao = False
+
+                        with cronometro('resultado') as intervalo:
+                            bt_visualizar = esperas.resultado_pesquisa(
+                                (By.XPATH, XPATH_VISUALIZAR), marca, timeout_fixo=limite('resultado', 15 if esperas.fixo else timeout_elemento)
+                            )
+                            if bt_visualizar == SEM_RESULTADO:
+                                intervalo.resultado = 'sem declaracao'
+                        if bt_visualizar == SEM_RESULTADO:
+                            logging.info(f"Nenhuma declaração encontrada para CNPJ {cnpj}.")
+                            status_cnpj = 'Nenhuma declaração encontrada'
+                            gravador.atualizar(cnpj, status_cnpj)
+                            gravador.registrar_tentativa(cnpj, tentativa, status_cnpj, time.perf_counter() - inicio_tentativa)
+                            # Permanece no frmApp: a página de filtro continua válida
+                            break
+                        etapa = ETAPA_DECLARACAO
+
+                    if etapa == ETAPA_DECLARACAO:
+                        with cronometro('declaracao'):
+                            if bt_visualizar is None:
+                                # Retomada: a grade do CNPJ continua na página de filtro
+                                bt_visualizar = WebDriverWait(driver, limite('declaracao')).until(
+                                    EC.element_to_be_clickable((By.XPATH, XPATH_VISUALIZAR))
+                                )
+                            logging.info("Clicando no botão Visualizar")
+                            bt_visualizar.click()
+                            bt_visualizar = None
+                            WebDriverWait(driver, limite('declaracao')).until(
+                                EC.element_to_be_clickable((By.XPATH, XPATH_EMITIR_DARF))
+                            )
+                        etapa = ETAPA_DOWNLOAD
+
+                    if etapa == ETAPA_DOWNLOAD:
+                        with cronometro('download'):
+                            bt_emitir_darf = WebDriverWait(driver, limite('declaracao')).until(
+                                EC.element_to_be_clickable((By.XPATH, XPATH_EMITIR_DARF))
+                            )
+                            logging.info("Clicando no botão Emitir DARF")
+                            monitor.preparar()
+                            bt_emitir_darf.click()
+                            arquivo = esperas.download(monitor, limite('download', timeout_download), 5)
+                        etapa = ETAPA_RENOMEAR
+
+                    if etapa == ETAPA_RENOMEAR:
+                        with cronometro('renomear'):
+                            if arquivo is not None:
+                                logging.info(f"Arquivo {arquivo.name} associado ao CNPJ {cnpj}")
+                                renomeado = renomear_arquivo(arquivo, codigo, competencia, pasta_destino)
+                            else:
+                                renomeado = renomear_arquivo_recente(codigo, competencia, pasta_competencia, pasta_destino)
+                            if not renomeado or not darf.exists():
+                                # O arquivo baixado continua na pasta: a retomada tenta renomear de novo
+                                raise RenomearDarfError(f"DARF de {cnpj} não foi salvo como {darf.name}")
+                        arquivo = None
+
+                        logging.info(f"Download concluído para {cnpj}")
+                        status_cnpj = 'Guia baixada'
+                        gravador.atualizar(cnpj, status_cnpj, arquivo=darf)
+                        etapa = ETAPA_CONFIRMACAO
+
+                    if etapa == ETAPA_CONFIRMACAO:
+                        with cronometro('confirmacao'):
+                            bt_ok = WebDriverWait(driver, limite('confirmacao')).until(
+                                EC.presence_of_element_located((By.XPATH, XPATH_OK))
+                            )
+                            logging.info("Clicando no botão OK")
+                            bt_ok.click()
+                        if not manter_pagina_filtro:
+                            driver.switch_to.default_content()
+
+                    sucesso = True
+                    gravador.registrar_tentativa(
+                        cnpj, tentativa, status_cnpj, time.perf_counter() - inicio_tentativa,
+                        arquivo=darf if darf.exists() else None
                     )
-                    logging.info("Clicando no botão Visualizar")
-                    bt_visualizar.click()
-                except (TimeoutException, NoSuchElementException):
-                    logging.info(f"Nenhuma declaração encontrada para CNPJ {cnpj}.")
-                    atualizar_status(df, cnpj, 'Nenhuma declaração encontrada')
-                    driver.switch_to.default_content()
-                    break
-
-                bt_emitir_darf = WebDriverWait(driver, timeout_elemento).until(
-                    EC.element_to_be_clickable((By.XPATH, '//*[@id="LinkEmitirDARFIntegral"]'))
-                )
-                logging.info("Clicando no botão Emitir DARF")
-                bt_emitir_darf.click()
-
-                time.sleep(5)
-                renomear_arquivo_recente(codigo, competencia, pasta_competencia)
-
-                logging.info(f"Download concluído para {cnpj}")
-                atualizar_status(df, cnpj, 'Guia baixada')
-
-                bt_ok = WebDriverWait(driver, timeout_elemento).until(
-                    EC.presence_of_element_located((By.XPATH, "//button[text()='OK']"))
-                )
-                logging.info("Clicando no botão OK")
-                bt_ok.click()
-                driver.switch_to.default_content()
-
-                sucesso = True
-                
-            except (TimeoutException, NoSuchElementException) as e:
-                logging.error(f"Erro de elemento Selenium no processamento do cliente {cnpj}: {e}")
                 
-                # Garantir retorno ao contexto principal
-                try:
-                    driver.switch_to.default_content()
-                except Exception:
-                    pass
+                except (
+                    TimeoutException, TimeoutError, NoSuchElementException, StaleElementReferenceException,
+                    RenomearDarfError,
+                ) as e:
+                    logging.error(f"Erro de elemento Selenium no processamento do cliente {cnpj} (etapa {etapa}): {e}")
+
+                    # Recomeça na primeira etapa cuja pré-condição não vale mais
+                    etapa, arquivo = _etapa_de_retomada(driver, etapa, darf, arquivo, monitor)
+                    if etapa == ETAPA_CONFIRMACAO:
+                        # DARF já salvo: falta apenas fechar o diálogo, que pode nem existir mais
+                        logging.info(f"DARF de {cnpj} já salvo; confirmação ignorada.")
+                        status_cnpj = 'Guia baixada'
+                        gravador.atualizar(cnpj, status_cnpj, arquivo=darf)
+                        gravador.registrar_tentativa(
+                            cnpj, tentativa, status_cnpj, time.perf_counter() - inicio_tentativa,
+                            erro=type(e).__name__, arquivo=darf
+                        )
+                        forcar_navegacao = True
+                        break
+                    if etapa == ETAPA_PESQUISA:
+                        forcar_navegacao = True
+
+                    portal = not isinstance(e, RenomearDarfError)
+                    if portal and disjuntor is not None and disjuntor.falha(cnpj) and pausas < tentativas_por_cnpj:
+                        # Indisponibilidade do portal: o lote é pausado sem gastar a tentativa
+                        pausas += 1
+                        gravador.registrar_tentativa(
+                            cnpj, tentativa, 'Portal indisponível', time.perf_counter() - inicio_tentativa,
+                            erro=type(e).__name__
+                        )
+                        reenfileirar_afetados(cnpj)
+                        continue
                 
-                atualizar_status(df, cnpj, 'Erro no download')
-                tentativas -= 1
+                    status_cnpj = 'Erro no download'
+                    gravador.atualizar(cnpj, status_cnpj)
+                    gravador.registrar_tentativa(
+                        cnpj, tentativa, status_cnpj, time.perf_counter() - inicio_tentativa, erro=type(e).__name__
+                    )
+                    tentativas -= 1
                 
-                if tentativas > 0:
-                    logging.info(f"Tentando novamente ({tentativas} tentativas restantes)")
-                    time.sleep(3)
-                else:
-                    logging.error(f"Falha após {tentativas_por_cnpj} tentativas para o cliente {cnpj}")
+                    if tentativas > 0:
+                        espera = espera_exponencial(tentativa)
+                        logging.info(
+                            f"Tentando novamente a partir da etapa {etapa} em {espera:.1f} segundos "
+                            f"({tentativas} tentativas restantes)"
+                        )
+                        aguardar(espera, should_stop)
+                    else:
+                        logging.error(f"Falha após {tentativas_por_cnpj} tentativas para o cliente {cnpj}")
                     
-            except Exception as e:
-                logging.error(f"Erro inesperado no processamento do cliente {cnpj}: {e}")
+                except Exception as e:
+                    logging.error(f"Erro inesperado no processamento do cliente {cnpj}: {e}")
                 
-                # Garantir retorno ao contexto principal
-                try:
-                    driver.switch_to.default_content()
-                except Exception:
-                    pass
+                    # Garantir retorno ao contexto principal
+                    try:
+                        driver.switch_to.default_content()
+                    except Exception:
+                        pass
+                    forcar_navegacao = True
                 
-                atualizar_status(df, cnpj, 'Erro inesperado')
-                tentativas = 0
+                    status_cnpj = 'Erro inesperado'
+                    gravador.atualizar(cnpj, status_cnpj)
+                    gravador.registrar_tentativa(
+                        cnpj, tentativa, status_cnpj, time.perf_counter() - inicio_tentativa, erro=type(e).__name__
+                    )
+                    tentativas = 0
+        
+            if disjuntor is not None and status_cnpj in ('Guia baixada', 'Nenhuma declaração encontrada'):
+                disjuntor.sucesso()
+            if tentativa:
+                metricas.registrar(ETAPA_CNPJ, cnpj, tentativa, status_cnpj or 'interrompido', time.perf_counter() - inicio_cnpj)
+
+            # Um download que excedeu o timeout pode chegar a qualquer momento:
+            # é isolado aqui para não ser associado ao próximo CNPJ
+            monitor.aguardar_atrasados(should_stop)
         
-        # Salva a planilha ao final do processamento de cada cliente
-        try:
-            df.to_excel(planilha_save_path, index=False)
-        except Exception as e:
-            logging.error(f"Erro ao salvar planilha: {e}")
+            # Status já está no diário; a planilha é regravada periodicamente
+            gravador.salvar_se_necessario()
+    finally:
+        monitor.fechar()
+        if gravador_proprio:
+            gravador.fechar()
     
     # Reportar conclusão
     if callback:
@@ -30,10 +30,53 @@ class Config:
     timeout_elemento: int = 30
     tentativas_por_cnpj: int = 3
     tentativas_gerais: int = 3
+    timeout_download: int = 60
+    
+    # Timeouts por etapa aprendidos (multiplicador x p99 recente, entre piso e teto)
+    timeouts_adaptativos: bool = True
+    timeout_multiplicador: float = 3.0
+    timeout_piso: int = 5
+    timeout_teto: int = 120
+    
+    # Disjuntor: falhas seguidas em N CNPJs diferentes pausam o lote (0 = desativado)
+    disjuntor_falhas: int = 4
+    disjuntor_intervalo: int = 30
+    disjuntor_pausa_maxima: int = 1800
+    
+    # Downloads identificados pelos eventos do Chrome DevTools (GUID)
+    downloads_cdp: bool = False
+    
+    # Navegadores em paralelo (1 = somente o navegador do login)
+    workers: int = 1
+    
+    # Abas no navegador logado, processadas em rodízio (1 = uma aba; ignorado com workers > 1)
+    abas: int = 1
+    
+    # Perfil persistente do Chrome em 'perfil-path' (cache HTTP entre execuções)
+    perfil_persistente: bool = False
+    
+    # Sessão: gravar cookies/localStorage após o login e restaurá-los nos reinícios
+    reutilizar_sessao: bool = True
+    
+    # Navegação: permanecer na página de filtro do frmApp entre CNPJs
+    manter_pagina_filtro: bool = True
+    
+    # Esperas: 'eventos' (sinais da página) ou 'fixo' (pausas antigas)
+    perfil_espera: str = 'eventos'
+    pausa_minima: float = 0.5
     
     # Caminho da planilha (pode ser personalizado)
     planilha_path: str = ''
     
+    # Estado da execução em SQLite (status e tentativas por CNPJ e competência);
+    # com ele, a coluna STATUS da planilha é gravada ao final ou sob demanda
+    estado_execucao: bool = True
+    
+    # Gravação da planilha: a cada N alterações de status ou T segundos
+    # (planilhas Excel: intervalos 10x maiores; entre as gravações, o diário guarda os status)
+    salvar_planilha_a_cada: int = 50
+    intervalo_salvamento: int = 60
+    
     # Paths (não serializados no JSON, calculados dinamicamente)
     _pasta_base: Optional[Path] = field(default=None, repr=False)
     
@@ -74,6 +117,26 @@ class Config:
         """Retorna o caminho do cache do perfil do Chrome."""
         return self.pasta_base / "perfil-path"
     
+    @property
+    def sessao_file(self) -> Path:
+        """Retorna o caminho do arquivo com a sessão gravada do e-CAC."""
+        return self.pasta_base / "sessao-ecac.json"
+    
+    @property
+    def estado_file(self) -> Path:
+        """Retorna o banco SQLite com o estado da execução por CNPJ e competência."""
+        return self.pasta_base / "estado-execucao.sqlite3"
+    
+    @property
+    def metricas_dir(self) -> Path:
+        """Retorna a pasta dos arquivos de tempo por etapa de cada execução."""
+        return self.pasta_base / "metricas"
+    
+    @property
+    def timeouts_file(self) -> Path:
+        """Retorna o arquivo com as durações usadas nos timeouts aprendidos."""
+        return self.metricas_dir / "timeouts-aprendidos.json"
+    
     @property
     def log_file(self) -> Path:
         """Retorna o caminho do arquivo de log."""
@@ -88,7 +151,26 @@ class Config:
             'timeout_elemento': self.timeout_elemento,
             'tentativas_por_cnpj': self.tentativas_por_cnpj,
             'tentativas_gerais': self.tentativas_gerais,
+            'timeout_download': self.timeout_download,
+            'timeouts_adaptativos': self.timeouts_adaptativos,
+            'timeout_multiplicador': self.timeout_multiplicador,
+            'timeout_piso': self.timeout_piso,
+            'timeout_teto': self.timeout_teto,
+            'disjuntor_falhas': self.disjuntor_falhas,
+            'disjuntor_intervalo': self.disjuntor_intervalo,
+            'disjuntor_pausa_maxima': self.disjuntor_pausa_maxima,
+            'workers': self.workers,
+            'abas': self.abas,
+            'downloads_cdp': self.downloads_cdp,
+            'reutilizar_sessao': self.reutilizar_sessao,
+            'perfil_persistente': self.perfil_persistente,
+            'manter_pagina_filtro': self.manter_pagina_filtro,
+            'perfil_espera': self.perfil_espera,
+            'pausa_minima': self.pausa_minima,
             'planilha_path': self.planilha_path,
+            'salvar_planilha_a_cada': self.salvar_planilha_a_cada,
+            'intervalo_salvamento': self.intervalo_salvamento,
+            'estado_execucao': self.estado_execucao,
         }
     
     @classmethod
@@ -101,7 +183,26 @@ class Config:
             timeout_elemento=data.get('timeout_elemento', 30),
             tentativas_por_cnpj=data.get('tentativas_por_cnpj', 3),
             tentativas_gerais=data.get('tentativas_gerais', 3),
+            timeout_download=data.get('timeout_download', 60),
+            timeouts_adaptativos=data.get('timeouts_adaptativos', True),
+            timeout_multiplicador=data.get('timeout_multiplicador', 3.0),
+            timeout_piso=data.get('timeout_piso', 5),
+            timeout_teto=data.get('timeout_teto', 120),
+            disjuntor_falhas=data.get('disjuntor_falhas', 4),
+            disjuntor_intervalo=data.get('disjuntor_intervalo', 30),
+            disjuntor_pausa_maxima=data.get('disjuntor_pausa_maxima', 1800),
+            workers=data.get('workers', 1),
+            abas=data.get('abas', 1),
+            downloads_cdp=data.get('downloads_cdp', False),
+            reutilizar_sessao=data.get('reutilizar_sessao', True),
+            perfil_persistente=data.get('perfil_persistente', False),
+            manter_pagina_filtro=data.get('manter_pagina_filtro', True),
+            perfil_espera=data.get('perfil_espera', 'eventos'),
+            pausa_minima=data.get('pausa_minima', 0.5),
             planilha_path=data.get('planilha_path', ''),
+            salvar_planilha_a_cada=data.get('salvar_planilha_a_cada', 50),
+            intervalo_salvamento=data.get('intervalo_salvamento', 60),
+            estado_execucao=data.get('estado_execucao', True),
         )
     
     def save(self, filepath: Optional[Path] = None) -> None:
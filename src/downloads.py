@@ -0,0 +1,456 @@
+"""
+Monitoramento da pasta de download dos DARFs.
+
+Entrega o caminho exato do arquivo concluído após o clique em "Emitir DARF",
+ignorando downloads parciais. No Linux usa inotify; nos demais sistemas
+verifica a pasta periodicamente, só relendo o conteúdo quando ela muda.
+Um download que excede o timeout é isolado com o sufixo '_orfao' se chegar
+depois, para não ser associado ao CNPJ seguinte.
+Opcionalmente, acompanha os eventos de download do Chrome DevTools (CDP).
+"""
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+
+# Extensões de downloads ainda em andamento (Chrome, Firefox e temporários)
+EXTENSOES_PARCIAIS = ('.crdownload', '.part', '.tmp', '.download')
+
+# Intervalo de verificação no modo sem inotify (segundos)
+INTERVALO_POLLING = 0.2
+
+# Marca dos downloads atrasados que não pertencem a nenhum CNPJ
+SUFIXO_ORFAO = '_orfao'
+
+
+def arquivo_concluido(nome: str) -> bool:
+    """Indica se o nome corresponde a um download finalizado (e ainda não renomeado)."""
+    nome_lower = nome.lower()
+    return (
+        not nome.startswith('.')
+        and not nome_lower.endswith(EXTENSOES_PARCIAIS)
+        and "DARFWEB" not in nome
+        and SUFIXO_ORFAO not in nome_lower
+    )
+
+
+def isolar_orfao(arquivo: Path) -> Optional[Path]:
+    """
+    Renomeia um download atrasado para '<nome>_orfao<extensão>'.
+
+    Returns:
+        Path ou None: Novo caminho, ou None se o arquivo não pôde ser renomeado.
+    """
+    destino = arquivo.with_name(f"{arquivo.stem}{SUFIXO_ORFAO}{arquivo.suffix}")
+    numero = 1
+    while destino.exists():
+        destino = arquivo.with_name(f"{arquivo.stem}{SUFIXO_ORFAO}{numero}{arquivo.suffix}")
+        numero += 1
+    try:
+        os.replace(arquivo, destino)
+    except OSError as e:
+        logging.warning(f"Não foi possível isolar o download atrasado {arquivo.name}: {e}")
+        return None
+    logging.warning(f"Download atrasado isolado como {destino.name}: não foi associado a nenhum CNPJ")
+    return destino
+
+
+class _Inotify:
+    """Acesso mínimo ao inotify do Linux via ctypes."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    _CABECALHO = struct.Struct('iIII')
+
+    def __init__(self, pasta: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            erro = ctypes.get_errno()
+            raise OSError(erro, os.strerror(erro))
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(str(pasta)), self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+        if wd < 0:
+            erro = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(erro, os.strerror(erro))
+
+    def ler(self, timeout: float) -> list:
+        """Retorna os nomes de arquivos fechados/movidos para a pasta até o timeout."""
+        prontos, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not prontos:
+            return []
+        try:
+            dados = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        nomes = []
+        pos = 0
+        while pos + self._CABECALHO.size <= len(dados):
+            _, _, _, tamanho = self._CABECALHO.unpack_from(dados, pos)
+            pos += self._CABECALHO.size
+            nome = dados[pos:pos + tamanho].rstrip(b'\0')
+            pos += tamanho
+            if nome:
+                nomes.append(os.fsdecode(nome))
+        return nomes
+
+    def descartar_pendentes(self):
+        while self.ler(0):
+            pass
+
+    def fechar(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class MonitorDownloads:
+    """
+    Aguarda o término de cada download na pasta indicada.
+
+    Uso:
+        monitor.preparar()          # antes do clique que dispara o download
+        arquivo = monitor.aguardar(timeout)
+
+    Se o download exceder o timeout, os arquivos que surgirem depois são
+    isolados por descartar_atrasados(), que deve liberar antes que outro CNPJ
+    dispare um download na mesma pasta.
+
+    Args:
+        pasta (str or Path): Pasta de download do Chrome.
+        usar_inotify (bool): Permite desativar o inotify (força o modo polling).
+    """
+
+    def __init__(self, pasta, usar_inotify: bool = True):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self._inotify = None
+        if usar_inotify and sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify(self.pasta)
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify indisponível, usando verificação periódica: {e}")
+        self._mtime = None
+        self._conhecidos = set()
+        self._atualizar_conhecidos()
+        self._antes = set(self._conhecidos)
+        # Download atrasado: nomes presentes antes dele, prazo e arquivos já isolados
+        self._antes_atraso = None
+        self._prazo_atraso = 0.0
+        self._isolados = 0
+
+    @property
+    def modo(self) -> str:
+        return 'inotify' if self._inotify else 'polling'
+
+    def _listar(self) -> set:
+        try:
+            with os.scandir(self.pasta) as entradas:
+                return {e.name for e in entradas if e.is_file()}
+        except OSError:
+            return set()
+
+    def _atualizar_conhecidos(self) -> set:
+        """Relê a pasta somente se ela mudou desde a última leitura; retorna os nomes novos."""
+        try:
+            mtime = os.stat(self.pasta).st_mtime_ns
+        except OSError:
+            return set()
+        if mtime == self._mtime:
+            return set()
+        self._mtime = mtime
+        atuais = self._listar()
+        novos = atuais - self._conhecidos
+        self._conhecidos = atuais
+        return novos
+
+    def preparar(self):
+        """Registra o estado da pasta imediatamente antes de disparar um novo download."""
+        if self._inotify:
+            self._inotify.descartar_pendentes()
+            self._antes = self._listar()
+        else:
+            self._atualizar_conhecidos()
+            self._antes = set(self._conhecidos)
+
+    def registrar_atraso(self, espera: float):
+        """
+        Marca o download disparado após o último preparar() como atrasado.
+
+        Até descartar_atrasados() liberar, todo arquivo que surgir na pasta
+        é desse download e será isolado. Um novo atraso antes da liberação
+        mantém a foto da pasta do primeiro e apenas estende o prazo.
+
+        Args:
+            espera (float): Tempo máximo para o download atrasado chegar (segundos).
+        """
+        if self._antes_atraso is None:
+            self._antes_atraso = set(self._antes)
+            self._isolados = 0
+        self._prazo_atraso = time.monotonic() + espera
+
+    def cancelar_atraso(self):
+        """O download atrasado chegou e foi associado ao CNPJ que o disparou."""
+        self._antes_atraso = None
+
+    def descartar_atrasados(self) -> bool:
+        """
+        Isola, sem bloquear, os arquivos do download atrasado que já chegaram.
+
+        Returns:
+            bool: True quando não há mais download atrasado a esperar, isto é,
+            o arquivo chegou (e foi isolado) ou o prazo terminou.
+        """
+        if self._antes_atraso is None:
+            return True
+        em_andamento = False
+        for nome in sorted(self._listar() - self._antes_atraso):
+            if nome.lower().endswith(EXTENSOES_PARCIAIS):
+                em_andamento = True
+            elif arquivo_concluido(nome) and isolar_orfao(self.pasta / nome) is not None:
+                self._isolados += 1
+        if em_andamento and time.monotonic() < self._prazo_atraso:
+            return False
+        if not self._isolados and time.monotonic() < self._prazo_atraso:
+            return False
+        if em_andamento:
+            logging.warning(f"Download atrasado ainda em andamento na pasta {self.pasta} após o prazo")
+        self._antes_atraso = None
+        return True
+
+    def aguardar_atrasados(self, should_stop=None):
+        """Bloqueia até descartar_atrasados() liberar (ou a execução ser interrompida)."""
+        if self._antes_atraso is not None:
+            logging.info("Aguardando o download atrasado antes do próximo CNPJ...")
+        while not self.descartar_atrasados():
+            if should_stop and should_stop():
+                return
+            time.sleep(INTERVALO_POLLING)
+
+    def aguardar(self, timeout: float) -> Path:
+        """
+        Aguarda o próximo download concluído.
+
+        Args:
+            timeout (float): Tempo máximo de espera (segundos).
+
+        Returns:
+            Path: Caminho do arquivo baixado.
+
+        Raises:
+            TimeoutError: Se nenhum download terminar dentro do tempo.
+        """
+        limite = time.monotonic() + timeout
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                self.registrar_atraso(timeout)
+                raise TimeoutError(f"Download não concluído em {timeout} segundos na pasta {self.pasta}")
+
+            if self._inotify:
+                nomes = self._inotify.ler(restante)
+            else:
+                time.sleep(min(INTERVALO_POLLING, restante))
+                nomes = self._atualizar_conhecidos()
+
+            arquivo = self._primeiro_concluido(nomes)
+            if arquivo is not None:
+                return arquivo
+
+    def verificar(self) -> Optional[Path]:
+        """
+        Verifica, sem bloquear, se o download iniciado após preparar() terminou.
+
+        Returns:
+            Path ou None: Caminho do arquivo baixado, se já concluído.
+        """
+        nomes = self._inotify.ler(0) if self._inotify else self._atualizar_conhecidos()
+        return self._primeiro_concluido(nomes)
+
+    def _primeiro_concluido(self, nomes) -> Optional[Path]:
+        for nome in sorted(nomes):
+            arquivo = self.pasta / nome
+            if arquivo_concluido(nome) and arquivo.is_file() and arquivo.stat().st_size > 0:
+                logging.info(f"Download concluído ({self.modo}): {arquivo.name}")
+                return arquivo
+        return None
+
+    def fechar(self):
+        if self._inotify:
+            self._inotify.fechar()
+            self._inotify = None
+
+
+def habilitar_eventos_download(driver, pasta):
+    """
+    Ativa os eventos de download do Chrome DevTools (CDP) para a pasta indicada.
+
+    Com o comportamento 'allowAndName', cada arquivo é salvo com o GUID do
+    download como nome, o que permite associá-lo ao CNPJ que o disparou.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome (criada com o log 'performance' ativo).
+        pasta (str or Path): Pasta de download.
+    """
+    driver.execute_cdp_cmd('Browser.setDownloadBehavior', {
+        'behavior': 'allowAndName',
+        'downloadPath': str(pasta),
+        'eventsEnabled': True,
+    })
+
+
+class DownloadsCDP:
+    """
+    Acompanha downloads pelos eventos do DevTools (downloadWillBegin/downloadProgress).
+
+    Tem a mesma interface de MonitorDownloads. Os eventos são lidos do log
+    'performance' do ChromeDriver; se não chegarem, o monitor de pasta
+    garante a detecção do arquivo. Com os eventos ativos, um arquivo só é
+    entregue se o nome for o GUID do download atual: o de um download
+    anterior que chegou atrasado é isolado, sem esperar por ele.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome configurada com eventos de download.
+        pasta (str or Path): Pasta de download.
+    """
+
+    METODOS_INICIO = ('Browser.downloadWillBegin', 'Page.downloadWillBegin')
+    METODOS_PROGRESSO = ('Browser.downloadProgress', 'Page.downloadProgress')
+
+    def __init__(self, driver, pasta):
+        self.driver = driver
+        self.pasta = Path(pasta)
+        self._monitor = MonitorDownloads(pasta)
+        self._eventos_ativos = True
+        self._concluidos = set()
+        self._guids_vistos = set()
+        self._abandonados = set()
+        self.ultimo_guid = None
+
+    @property
+    def modo(self) -> str:
+        return 'cdp' if self._eventos_ativos else self._monitor.modo
+
+    def _ler_eventos(self) -> list:
+        if not self._eventos_ativos:
+            return []
+        try:
+            entradas = self.driver.get_log('performance')
+        except Exception as e:
+            logging.warning(f"Eventos de download do DevTools indisponíveis: {e}")
+            self._eventos_ativos = False
+            return []
+        eventos = []
+        for entrada in entradas:
+            try:
+                mensagem = json.loads(entrada['message'])['message']
+            except (KeyError, TypeError, ValueError):
+                continue
+            metodo = mensagem.get('method', '')
+            if metodo in self.METODOS_INICIO or metodo in self.METODOS_PROGRESSO:
+                eventos.append((metodo, mensagem.get('params', {})))
+        return eventos
+
+    def _processar_eventos(self):
+        for metodo, params in self._ler_eventos():
+            guid = params.get('guid')
+            if metodo in self.METODOS_INICIO:
+                self._guids_vistos.add(guid)
+                if self.ultimo_guid is None:
+                    self.ultimo_guid = guid
+                    logging.info(f"Download iniciado (GUID {guid}): {params.get('suggestedFilename', '')}")
+            elif params.get('state') == 'completed':
+                self._concluidos.add(guid)
+            elif params.get('state') == 'canceled' and guid == self.ultimo_guid:
+                raise TimeoutError(f"Download {guid} cancelado pelo navegador")
+
+    def preparar(self):
+        """Descarta eventos antigos e registra o estado antes de um novo download."""
+        self._processar_eventos()
+        self.ultimo_guid = None
+        self._concluidos.clear()
+        self._monitor.preparar()
+
+    def verificar(self) -> Optional[Path]:
+        """
+        Verifica, sem bloquear, se o download iniciado após preparar() terminou.
+
+        Returns:
+            Path ou None: Caminho do arquivo baixado (nomeado pelo GUID do download).
+        """
+        self._processar_eventos()
+        guid = self.ultimo_guid
+        if guid and guid in self._concluidos:
+            arquivo = self.pasta / guid
+            if arquivo.is_file():
+                logging.info(f"Download concluído (cdp): GUID {guid}")
+                return arquivo
+        arquivo = self._monitor.verificar()
+        if arquivo is None or arquivo.name == guid:
+            return arquivo
+        if arquivo.name in self._guids_vistos:
+            # GUID de um download anterior: chegou atrasado e não é deste CNPJ
+            isolar_orfao(arquivo)
+            return None
+        # Sem eventos do DevTools, vale o arquivo detectado na pasta
+        return arquivo if guid is None else None
+
+    def aguardar(self, timeout: float) -> Path:
+        """
+        Aguarda o download iniciado após preparar() terminar.
+
+        Returns:
+            Path: Caminho do arquivo baixado.
+
+        Raises:
+            TimeoutError: Se o download não terminar dentro do tempo.
+        """
+        limite = time.monotonic() + timeout
+        while True:
+            arquivo = self.verificar()
+            if arquivo is not None:
+                return arquivo
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                self.registrar_atraso(timeout)
+                raise TimeoutError(f"Download não concluído em {timeout} segundos na pasta {self.pasta}")
+            time.sleep(min(INTERVALO_POLLING, restante))
+
+    def registrar_atraso(self, espera: float):
+        """
+        Marca o download atual como atrasado.
+
+        Com o GUID conhecido, o arquivo é reconhecido pelo nome e isolado quando
+        chegar, sem bloquear o próximo download. Sem ele, vale a foto da pasta
+        (ver MonitorDownloads.registrar_atraso).
+        """
+        if self._eventos_ativos and self.ultimo_guid:
+            self._abandonados.add(self.ultimo_guid)
+        else:
+            self._monitor.registrar_atraso(espera)
+
+    def cancelar_atraso(self):
+        self._abandonados.discard(self.ultimo_guid)
+        self._monitor.cancelar_atraso()
+
+    def descartar_atrasados(self) -> bool:
+        for guid in sorted(self._abandonados):
+            arquivo = self.pasta / guid
+            if arquivo.is_file() and isolar_orfao(arquivo) is not None:
+                self._abandonados.discard(guid)
+        return self._monitor.descartar_atrasados()
+
+    def aguardar_atrasados(self, should_stop=None):
+        self._monitor.aguardar_atrasados(should_stop)
+
+    def fechar(self):
+        self._monitor.fechar()
@@ -0,0 +1,264 @@
+"""
+Camada de espera por sinais reais da página do e-CAC.
+
+Em vez de pausas fixas, cada etapa aguarda o fim do postback assíncrono do
+ASP.NET (UpdatePanel), o carregamento do documento/iframe e a chegada do
+arquivo baixado. O perfil 'fixo' mantém as pausas antigas como alternativa.
+"""
+import logging
+import time
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    JavascriptException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
+
+
+PERFIL_EVENTOS = 'eventos'
+PERFIL_FIXO = 'fixo'
+PERFIS_ESPERA = (PERFIL_EVENTOS, PERFIL_FIXO)
+
+# Intervalo de verificação das condições (segundos)
+INTERVALO_VERIFICACAO = 0.1
+
+# Resultado da pesquisa quando o postback terminou sem listar declarações
+SEM_RESULTADO = 'sem_resultado'
+
+_JS_POSTBACK_CONCLUIDO = """
+var prm = window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager;
+return !prm || !prm.getInstance().get_isInAsyncPostBack();
+"""
+
+_JS_MARCAR_DOCUMENTO = """
+window.__dctfMarcado = true;
+var prm = window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager;
+if (prm && !window.__dctfContador) {
+    window.__dctfContador = true;
+    window.__dctfPostbacks = 0;
+    prm.getInstance().add_endRequest(function () { window.__dctfPostbacks++; });
+}
+return window.__dctfPostbacks || 0;
+"""
+
+_JS_REQUISICAO_CONCLUIDA = """
+if (!window.__dctfMarcado) { return document.readyState === 'complete'; }
+var prm = window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager;
+return (window.__dctfPostbacks || 0) > arguments[0]
+    && !(prm && prm.getInstance().get_isInAsyncPostBack());
+"""
+
+
+def postback_concluido(driver):
+    """Condição: não há postback assíncrono (UpdatePanel) em andamento."""
+    return bool(driver.execute_script(_JS_POSTBACK_CONCLUIDO))
+
+
+def documento_pronto(driver):
+    """Condição: o documento do contexto atual terminou de carregar."""
+    return driver.execute_script("return document.readyState;") == 'complete'
+
+
+def pagina_estavel(driver):
+    """Condição: documento carregado e sem postback assíncrono pendente."""
+    return documento_pronto(driver) and postback_concluido(driver)
+
+
+def documento_substituido(driver):
+    """Condição: o documento marcado por marcar_documento foi trocado e o novo está pronto."""
+    return bool(driver.execute_script(
+        "return !window.__dctfMarcado && document.readyState === 'complete';"
+    ))
+
+
+def marcar_documento(driver):
+    """
+    Marca o documento do contexto atual e passa a contar os postbacks concluídos.
+
+    Returns:
+        int: Quantidade de postbacks assíncronos concluídos até o momento.
+    """
+    return driver.execute_script(_JS_MARCAR_DOCUMENTO) or 0
+
+
+def requisicao_concluida(postbacks_antes):
+    """
+    Condição: terminou a requisição disparada após marcar_documento.
+
+    Aceita tanto um postback assíncrono (UpdatePanel) quanto a troca completa do documento.
+    """
+    def _condicao(driver):
+        return bool(driver.execute_script(_JS_REQUISICAO_CONCLUIDA, postbacks_antes))
+    return _condicao
+
+
+def resultado_pesquisa(locator, marca):
+    """
+    Condição: a pesquisa marcada terminou; retorna o elemento da grade ou SEM_RESULTADO.
+
+    Args:
+        locator (tuple): Localizador do primeiro item da grade de resultados.
+        marca (int): Retorno de marcar_documento antes do clique em pesquisar.
+    """
+    concluida = requisicao_concluida(marca)
+
+    def _condicao(driver):
+        if not concluida(driver):
+            return False
+        elementos = driver.find_elements(*locator)
+        if not elementos:
+            return SEM_RESULTADO
+        return elementos[0] if elementos[0].is_displayed() and elementos[0].is_enabled() else False
+    return _condicao
+
+
+class Esperas:
+    """
+    Decide quando o fluxo pode seguir, a partir de eventos da página.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome.
+        perfil (str): 'eventos' (padrão) ou 'fixo' (pausas antigas).
+        pausa_minima (float): Intervalo mínimo entre ações no perfil 'eventos' (segundos).
+        timeout (int): Tempo máximo de espera por cada sinal (segundos).
+    """
+
+    def __init__(self, driver, perfil: str = PERFIL_EVENTOS, pausa_minima: float = 0.5, timeout: int = 30):
+        if perfil not in PERFIS_ESPERA:
+            logging.warning(f"Perfil de espera desconhecido '{perfil}'. Usando '{PERFIL_EVENTOS}'.")
+            perfil = PERFIL_EVENTOS
+        self.driver = driver
+        self.perfil = perfil
+        self.pausa_minima = max(0.0, float(pausa_minima))
+        self.timeout = timeout
+
+    @property
+    def fixo(self) -> bool:
+        return self.perfil == PERFIL_FIXO
+
+    def _aguardar(self, condicao, timeout=None):
+        # Durante a troca de documento o script pode falhar momentaneamente
+        return WebDriverWait(
+            self.driver,
+            timeout or self.timeout,
+            poll_frequency=INTERVALO_VERIFICACAO,
+            ignored_exceptions=(JavascriptException, StaleElementReferenceException),
+        ).until(condicao)
+
+    def _respeitar_pausa_minima(self, inicio):
+        restante = self.pausa_minima - (time.monotonic() - inicio)
+        if restante > 0:
+            time.sleep(restante)
+
+    def antes_da_acao(self, segundos_fixos):
+        """Aguarda a página ficar estável antes de um clique."""
+        if self.fixo:
+            time.sleep(segundos_fixos)
+            return
+        inicio = time.monotonic()
+        self._aguardar(pagina_estavel)
+        self._respeitar_pausa_minima(inicio)
+
+    def apos_acao(self, segundos_fixos):
+        """Aguarda o fim de um postback/atualização disparado por um clique."""
+        self.antes_da_acao(segundos_fixos)
+
+    def apos_navegacao(self, segundos_fixos):
+        """
+        Aguarda a troca de página após um clique que pode navegar.
+
+        Deve ser precedido por marcar(). Se a página não for trocada
+        dentro do tempo da pausa fixa antiga, segue apenas com a checagem de estabilidade.
+        """
+        if self.fixo:
+            time.sleep(segundos_fixos)
+            return
+        inicio = time.monotonic()
+        try:
+            self._aguardar(documento_substituido, timeout=segundos_fixos)
+        except TimeoutException:
+            logging.debug("Documento não foi substituído; seguindo com a página atual.")
+        self._aguardar(pagina_estavel)
+        self._respeitar_pausa_minima(inicio)
+
+    def marcar(self):
+        """
+        Marca o documento atual antes de um clique (ver apos_navegacao e apos_postback).
+
+        Returns:
+            int ou None: Contagem de postbacks no momento da marcação.
+        """
+        if self.fixo:
+            return None
+        try:
+            return marcar_documento(self.driver)
+        except WebDriverException as e:
+            logging.debug(f"Não foi possível marcar o documento: {e}")
+            return None
+
+    def apos_postback(self, marca, segundos_fixos):
+        """Aguarda o postback disparado depois de marcar() terminar."""
+        if self.fixo or marca is None:
+            self.antes_da_acao(segundos_fixos)
+            return
+        inicio = time.monotonic()
+        self._aguardar(requisicao_concluida(marca))
+        self._respeitar_pausa_minima(inicio)
+
+    def entrar_frame(self, locator):
+        """Troca para o iframe indicado e aguarda seu documento terminar de carregar."""
+        self._aguardar(EC.frame_to_be_available_and_switch_to_it(locator))
+        if not self.fixo:
+            self._aguardar(pagina_estavel)
+
+    def recarregar_frame(self, url):
+        """Recarrega o documento do iframe atual na URL indicada."""
+        self.marcar()
+        self.driver.execute_script("window.location.href = arguments[0];", url)
+        if not self.fixo:
+            self._aguardar(documento_substituido)
+
+    def resultado_pesquisa(self, locator, marca, timeout_fixo=15):
+        """
+        Aguarda o resultado da pesquisa de declarações.
+
+        No perfil 'eventos', o fim do postback (marcado antes do clique em
+        pesquisar) sem o elemento na grade já indica que não há declaração;
+        no perfil 'fixo', aguarda até timeout_fixo segundos.
+
+        Returns:
+            WebElement ou SEM_RESULTADO.
+        """
+        if self.fixo or marca is None:
+            try:
+                return WebDriverWait(self.driver, timeout_fixo).until(EC.element_to_be_clickable(locator))
+            except TimeoutException:
+                return SEM_RESULTADO
+
+        return self._aguardar(resultado_pesquisa(locator, marca))
+
+    def download(self, monitor, timeout, segundos_fixos=5):
+        """
+        Aguarda o download disparado após monitor.preparar() terminar.
+
+        Args:
+            monitor (MonitorDownloads): Monitor da pasta de download.
+            timeout (float): Tempo máximo para o download concluir (segundos).
+            segundos_fixos (int): Pausa usada no perfil 'fixo'.
+
+        Returns:
+            Path ou None: Arquivo baixado (None no perfil 'fixo').
+
+        Raises:
+            TimeoutError: Se o download não terminar dentro do tempo.
+        """
+        if self.fixo:
+            time.sleep(segundos_fixos)
+            return None
+        inicio = time.monotonic()
+        arquivo = monitor.aguardar(timeout)
+        self._respeitar_pausa_minima(inicio)
+        return arquivo
@@ -0,0 +1,215 @@
+"""
+Estado da execução em SQLite, por (CNPJ, competência).
+
+Guarda o status atual de cada CNPJ e o histórico de tentativas (resultado,
+duração, classe do erro e arquivo gerado). A consulta dos pendentes usa um
+índice, e a coluna STATUS da planilha passa a ser uma projeção deste estado,
+exportada quando necessário (ver GravadorPlanilha).
+"""
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from src.planilha import STATUS_CNPJ_INVALIDO, normalizar_cnpj
+
+
+# Status que encerra o CNPJ na competência
+STATUS_CONCLUIDO = 'Guia baixada'
+
+# Status que tiram o CNPJ dos pendentes
+STATUS_FINAIS = (STATUS_CONCLUIDO, STATUS_CNPJ_INVALIDO)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cnpjs (
+    cnpj TEXT NOT NULL,
+    competencia TEXT NOT NULL,
+    codigo TEXT,
+    ordem INTEGER,
+    status TEXT NOT NULL DEFAULT '',
+    concluido INTEGER NOT NULL DEFAULT 0,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    arquivo TEXT,
+    atualizado REAL,
+    PRIMARY KEY (cnpj, competencia)
+);
+CREATE INDEX IF NOT EXISTS idx_cnpjs_pendentes ON cnpjs (competencia, concluido, ordem);
+CREATE TABLE IF NOT EXISTS tentativas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cnpj TEXT NOT NULL,
+    competencia TEXT NOT NULL,
+    tentativa INTEGER,
+    resultado TEXT,
+    duracao REAL,
+    erro TEXT,
+    arquivo TEXT,
+    inicio REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tentativas_cnpj ON tentativas (cnpj, competencia);
+"""
+
+
+class EstadoExecucao:
+    """
+    Banco SQLite com o estado dos CNPJs de uma competência.
+
+    Pode ser compartilhado entre threads (modo paralelo).
+
+    Args:
+        caminho (str or Path): Arquivo do banco (criado se não existir).
+        competencia (str): Competência da execução (ex: '06 2025').
+    """
+
+    def __init__(self, caminho, competencia):
+        self.caminho = Path(caminho)
+        self.competencia = competencia
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(str(self.caminho), check_same_thread=False)
+        with self._lock:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("PRAGMA synchronous=NORMAL")
+            self._conexao.executescript(_ESQUEMA)
+            self._conexao.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fechar()
+
+    def sincronizar(self, indice, codigos=None):
+        """
+        Inclui no banco os CNPJs da planilha e projeta o estado gravado no DataFrame.
+
+        CNPJs novos entram com o STATUS que já tinham na planilha; para os demais,
+        o status do banco prevalece, exceto 'CNPJ inválido', que vem da validação
+        feita na leitura da planilha.
+
+        Args:
+            indice (IndiceStatus): Índice de status do DataFrame da planilha.
+            codigos (list): Códigos dos clientes, na ordem das linhas (opcional).
+
+        Returns:
+            int: Quantidade de status da planilha alterados pelo banco.
+        """
+        df = indice.df
+        cnpjs = df['CNPJ'].tolist()
+        if codigos is None:
+            codigos = df['COD'].astype(str).tolist() if 'COD' in df.columns else [None] * len(cnpjs)
+        status = df['STATUS'].astype(str).tolist()
+        agora = time.time()
+        linhas = [
+            (normalizar_cnpj(cnpj), self.competencia, str(codigo), ordem, situacao,
+             int(situacao in STATUS_FINAIS), agora)
+            for ordem, (cnpj, codigo, situacao) in enumerate(zip(cnpjs, codigos, status))
+        ]
+        invalidos = [
+            (STATUS_CNPJ_INVALIDO, agora, linha[0], self.competencia)
+            for linha in linhas if linha[4] == STATUS_CNPJ_INVALIDO
+        ]
+        with self._lock:
+            self._conexao.executemany(
+                "INSERT OR IGNORE INTO cnpjs (cnpj, competencia, codigo, ordem, status, concluido, atualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                linhas,
+            )
+            self._conexao.executemany(
+                "UPDATE cnpjs SET status = ?, concluido = 1, atualizado = ? WHERE cnpj = ? AND competencia = ?",
+                invalidos,
+            )
+            self._conexao.commit()
+            gravados = self._conexao.execute(
+                "SELECT cnpj, status FROM cnpjs WHERE competencia = ? AND status != ''",
+                (self.competencia,),
+            ).fetchall()
+
+        alterados = 0
+        for cnpj, situacao in gravados:
+            if cnpj in indice and indice.get(cnpj) != situacao:
+                indice.set(cnpj, situacao)
+                alterados += 1
+        if alterados:
+            logging.info(f"{alterados} status da planilha atualizados a partir de {self.caminho.name}")
+        return alterados
+
+    def pendentes(self) -> set:
+        """CNPJs (normalizados) ainda não concluídos na competência, pela consulta indexada."""
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT cnpj FROM cnpjs WHERE competencia = ? AND concluido = 0 ORDER BY ordem",
+                (self.competencia,),
+            ).fetchall()
+        return {cnpj for (cnpj,) in linhas}
+
+    def status(self, cnpj, padrao=''):
+        """Status atual do CNPJ na competência."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT status FROM cnpjs WHERE cnpj = ? AND competencia = ?",
+                (normalizar_cnpj(cnpj), self.competencia),
+            ).fetchone()
+        return linha[0] if linha else padrao
+
+    def atualizar(self, cnpj, status, arquivo=None):
+        """Grava o status atual do CNPJ (e o arquivo gerado, se informado)."""
+        with self._lock:
+            self._conexao.execute(
+                "INSERT INTO cnpjs (cnpj, competencia, status, concluido, arquivo, atualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (cnpj, competencia) DO UPDATE SET status = excluded.status, "
+                "concluido = excluded.concluido, arquivo = COALESCE(excluded.arquivo, arquivo), "
+                "atualizado = excluded.atualizado",
+                (normalizar_cnpj(cnpj), self.competencia, status, int(status in STATUS_FINAIS),
+                 str(arquivo) if arquivo else None, time.time()),
+            )
+            self._conexao.commit()
+
+    def registrar_tentativa(self, cnpj, tentativa, resultado, duracao, erro=None, arquivo=None):
+        """
+        Acrescenta uma tentativa ao histórico do CNPJ.
+
+        Args:
+            cnpj (str): CNPJ do cliente.
+            tentativa (int): Número da tentativa no CNPJ.
+            resultado (str): Status resultante da tentativa.
+            duracao (float): Duração da tentativa (segundos).
+            erro (str): Classe do erro que encerrou a tentativa, se houve.
+            arquivo (str or Path): DARF gerado pela tentativa, se houve.
+        """
+        chave = normalizar_cnpj(cnpj)
+        with self._lock:
+            self._conexao.execute(
+                "INSERT INTO tentativas (cnpj, competencia, tentativa, resultado, duracao, erro, arquivo, inicio) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chave, self.competencia, tentativa, resultado, round(duracao, 4), erro,
+                 str(arquivo) if arquivo else None, time.time() - duracao),
+            )
+            self._conexao.execute(
+                "UPDATE cnpjs SET tentativas = tentativas + 1 WHERE cnpj = ? AND competencia = ?",
+                (chave, self.competencia),
+            )
+            self._conexao.commit()
+
+    def historico(self, cnpj) -> list:
+        """
+        Tentativas registradas para o CNPJ na competência.
+
+        Returns:
+            list: Dicionários com tentativa, resultado, duracao, erro, arquivo e inicio.
+        """
+        with self._lock:
+            cursor = self._conexao.execute(
+                "SELECT tentativa, resultado, duracao, erro, arquivo, inicio FROM tentativas "
+                "WHERE cnpj = ? AND competencia = ? ORDER BY id",
+                (normalizar_cnpj(cnpj), self.competencia),
+            )
+            colunas = [coluna[0] for coluna in cursor.description]
+            return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+
+    def fechar(self):
+        with self._lock:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
@@ -1,11 +1,15 @@
 """
 Interface grafica para a automacao DCTF usando CustomTkinter.
 Visual moderno e limpo, mantendo o fluxo funcional existente.
+
+Selenium e pandas sao importados apenas quando usados (leitura da planilha e
+execucao, ambas fora da thread da interface): a janela abre sem espera.
 """
 import logging
 import queue
 import threading
 import tkinter as tk
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from tkinter import filedialog, messagebox
@@ -13,10 +17,12 @@ from tkinter import ttk
 import webbrowser
 
 import customtkinter as ctk
-import pandas as pd
 
-from src.automacao import configurar_driver, transmissao
 from src.config import Config, get_config, save_config
+from src.metricas import RegistroEtapas
+from src.resiliencia import Disjuntor
+from src.tabela import TabelaVirtual
+from src.timeouts import TimeoutsAdaptativos
 
 
 COLORS = {
@@ -36,15 +42,80 @@ COLORS = {
 }
 
 
+# Painel de log: linhas mantidas, intervalo entre atualizacoes e niveis exibiveis
+LOG_MAX_LINHAS = 2000
+LOG_INTERVALO_MS = 120
+LOG_NIVEIS = {"Info": logging.INFO, "Avisos": logging.WARNING, "Erros": logging.ERROR}
+
+# Progresso: a interface aplica o estado mais recente 10x por segundo
+PROGRESSO_INTERVALO_MS = 100
+
+
+def _filtro_erro(status):
+    from src.planilha import STATUS_CNPJ_INVALIDO
+    return status.str.contains("Erro", regex=False) | (status == STATUS_CNPJ_INVALIDO)
+
+
+# Filtros da tabela: rotulo -> funcao (Series de STATUS) -> mascara
+FILTROS_STATUS = {
+    "Todos": None,
+    "Pendente": lambda status: status.str.strip() == "",
+    "Guia baixada": lambda status: status.str.contains("Guia baixada", regex=False),
+    "Erro": _filtro_erro,
+}
+
+
 class TextHandler(logging.Handler):
-    """Handler de logging que envia logs para uma fila."""
+    """Handler de logging que envia (nivel, mensagem formatada) para uma fila."""
 
     def __init__(self, log_queue):
         super().__init__()
         self.log_queue = log_queue
 
     def emit(self, record):
-        self.log_queue.put(self.format(record))
+        self.log_queue.put((record.levelno, self.format(record)))
+
+
+class CanalProgresso:
+    """
+    Canal thread-safe entre as threads de trabalho e a interface.
+
+    As threads publicam o estado mais recente (progresso, texto de status e
+    status por CNPJ); a interface coleta tudo em intervalos fixos, de modo que
+    atualizacoes intermediarias sao descartadas em vez de enfileiradas. Acoes
+    pontuais na interface (botoes, dialogos) sao executadas na ordem publicada.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._progresso = None
+        self._status = None
+        self._cnpjs = {}
+        self._acoes = []
+
+    def progresso(self, mensagem, atual, total):
+        with self._lock:
+            self._progresso = (atual, total)
+            self._status = mensagem
+
+    def status(self, texto):
+        with self._lock:
+            self._status = texto
+
+    def cnpj(self, cnpj, status):
+        with self._lock:
+            self._cnpjs[cnpj] = status
+
+    def executar(self, acao):
+        with self._lock:
+            self._acoes.append(acao)
+
+    def coletar(self):
+        """Retorna e limpa (acoes, progresso, status, {cnpj: status})."""
+        with self._lock:
+            coletado = (self._acoes, self._progresso, self._status, self._cnpjs)
+            self._acoes, self._progresso, self._status, self._cnpjs = [], None, None, {}
+        return coletado
 
 
 class AutomacaoDCTFApp:
@@ -67,19 +138,34 @@ class AutomacaoDCTFApp:
         self.waiting_login = False
         self.driver = None
         self.worker_thread = None
+        self.metricas = None
         self.log_queue = queue.Queue()
+        self.log_buffer = deque(maxlen=LOG_MAX_LINHAS)
+        self.progresso = CanalProgresso()
 
         # Dados da planilha
         self.df = None
+        self.indice = None
         self.cnpjs = []
         self.codigos = []
         self.planilha_carregada = False
+        self.total_baixados = 0
+        self.total_invalidos = 0
+        self._baixado = bytearray()
+        self._table_columns = None
+        self._filter_job = None
+        self._carga = None
+        self._preview = []
 
         # Variaveis de UI
         self.planilha_path_var = tk.StringVar(value=str(self.config.planilha))
         self.resumo_var = tk.StringVar(value="Nenhuma planilha carregada")
         self.status_var = tk.StringVar(value="Aguardando...")
         self.progress_pct_var = tk.IntVar(value=0)
+        self.filtro_status_var = tk.StringVar(value="Todos")
+        self.busca_var = tk.StringVar()
+        self.log_nivel_var = tk.StringVar(value="Info")
+        self.log_autoscroll_var = tk.BooleanVar(value=True)
 
         self.field_vars = {
             "data_inicial": tk.StringVar(),
@@ -88,12 +174,15 @@ class AutomacaoDCTFApp:
             "timeout": tk.StringVar(),
             "tentativas_cnpj": tk.StringVar(),
             "tentativas_gerais": tk.StringVar(),
+            "workers": tk.StringVar(),
+            "abas": tk.StringVar(),
         }
 
         self.setup_logging()
         self.create_widgets()
         self.load_config_to_fields()
         self.check_log_queue()
+        self.check_progress()
 
     # =========================================================================
     # WIDGETS
@@ -175,7 +264,8 @@ class AutomacaoDCTFApp:
         actions = ctk.CTkFrame(card, fg_color="transparent")
         actions.grid(row=0, column=2, padx=(8, 0), pady=(0, 8))
         ctk.CTkButton(actions, text="Selecionar", width=100, command=self.select_planilha).pack(side=tk.LEFT, padx=4)
-        ctk.CTkButton(actions, text="Carregar Dados", width=120, command=self.load_planilha, fg_color=COLORS["success"], hover_color="#059669").pack(side=tk.LEFT, padx=4)
+        self.load_btn = ctk.CTkButton(actions, text="Carregar Dados", width=120, command=self.load_planilha, fg_color=COLORS["success"], hover_color="#059669")
+        self.load_btn.pack(side=tk.LEFT, padx=4)
 
         ctk.CTkLabel(
             card,
@@ -184,11 +274,30 @@ class AutomacaoDCTFApp:
             text_color=COLORS["warning"],
         ).grid(row=1, column=0, columnspan=3, sticky="w", pady=(2, 10))
 
+        filters = ctk.CTkFrame(card, fg_color="transparent")
+        filters.grid(row=2, column=0, columnspan=3, sticky="ew", pady=(0, 8))
+        filters.grid_columnconfigure(1, weight=1)
+        ctk.CTkSegmentedButton(
+            filters,
+            values=list(FILTROS_STATUS),
+            variable=self.filtro_status_var,
+            command=lambda valor: self.apply_filter(),
+        ).grid(row=0, column=0, sticky="w")
+        ctk.CTkEntry(
+            filters,
+            textvariable=self.busca_var,
+            placeholder_text="Buscar CNPJ ou codigo",
+            fg_color="#0f172a",
+            border_color=COLORS["border"],
+            text_color=COLORS["text"],
+        ).grid(row=0, column=1, sticky="ew", padx=(8, 0))
+        self.busca_var.trace_add("write", lambda *args: self._schedule_filter(250))
+
         table_wrap = ctk.CTkFrame(card, fg_color="#0b1220", corner_radius=10)
-        table_wrap.grid(row=2, column=0, columnspan=3, sticky="nsew")
+        table_wrap.grid(row=3, column=0, columnspan=3, sticky="nsew")
         table_wrap.grid_columnconfigure(0, weight=1)
         table_wrap.grid_rowconfigure(0, weight=1)
-        card.grid_rowconfigure(2, weight=1)
+        card.grid_rowconfigure(3, weight=1)
 
         style = ttk.Style(self.root)
         style.theme_use("default")
@@ -212,28 +321,27 @@ class AutomacaoDCTFApp:
         style.map("Dark.Treeview", background=[("selected", "#1d4ed8")], foreground=[("selected", "#ffffff")])
         style.map("Dark.Treeview.Heading", background=[("active", COLORS["accent_hover"])])
 
-        y_scroll = ttk.Scrollbar(table_wrap, orient="vertical")
-        y_scroll.grid(row=0, column=1, sticky="ns")
-
-        self.data_table = ttk.Treeview(
+        # Somente as linhas visiveis viram itens do Treeview (ver TabelaVirtual)
+        self.data_table = TabelaVirtual(
             table_wrap,
-            columns=("cod", "cnpj", "nome", "status"),
-            show="headings",
+            [
+                ("cod", "Codigo", 80, 60, tk.CENTER),
+                ("cnpj", "CNPJ", 180, 130, tk.W),
+                ("nome", "Nome / Razao Social", 370, 180, tk.W),
+                ("status", "Status", 230, 140, tk.W),
+            ],
+            self._table_row,
             style="Dark.Treeview",
-            yscrollcommand=y_scroll.set,
-            height=8,
+            altura_linha=28,
+            bg="#0b1220",
         )
-        y_scroll.configure(command=self.data_table.yview)
         self.data_table.grid(row=0, column=0, sticky="nsew")
 
-        self.data_table.heading("cod", text="Codigo")
-        self.data_table.heading("cnpj", text="CNPJ")
-        self.data_table.heading("nome", text="Nome / Razao Social")
-        self.data_table.heading("status", text="Status")
-        self.data_table.column("cod", width=80, minwidth=60, anchor=tk.CENTER)
-        self.data_table.column("cnpj", width=180, minwidth=130, anchor=tk.W)
-        self.data_table.column("nome", width=370, minwidth=180, anchor=tk.W)
-        self.data_table.column("status", width=230, minwidth=140, anchor=tk.W)
+        # Visivel apenas durante a leitura da planilha
+        self.load_progress = ctk.CTkProgressBar(card, progress_color=COLORS["accent"], height=10)
+        self.load_progress.grid(row=4, column=0, columnspan=3, sticky="ew", pady=(8, 0))
+        self.load_progress.set(0)
+        self.load_progress.grid_remove()
 
     def _build_config_card(self):
         card_outer, card = self._card(self.main, "CONFIGURACOES")
@@ -247,6 +355,8 @@ class AutomacaoDCTFApp:
             ("Timeout (seg)", "timeout", "", 1, 2),
             ("Tentativas/CNPJ", "tentativas_cnpj", "", 2, 0),
             ("Tentativas Gerais", "tentativas_gerais", "", 2, 2),
+            ("Navegadores", "workers", "em paralelo", 3, 0),
+            ("Abas", "abas", "por navegador", 3, 2),
         ]
 
         for label, key, hint, row, col in fields:
@@ -288,6 +398,7 @@ class AutomacaoDCTFApp:
             command=self.start_automation,
             fg_color=COLORS["success"],
             hover_color="#059669",
+            state="disabled",
             height=40,
         )
         self.start_btn.grid(row=0, column=0, padx=4, sticky="ew")
@@ -333,6 +444,9 @@ class AutomacaoDCTFApp:
         self.progress_label = ctk.CTkLabel(card, text="0/0 | 0%", text_color=COLORS["text"])
         self.progress_label.grid(row=3, column=0, sticky="e")
 
+        self.media_label = ctk.CTkLabel(card, text="Media: -- s/CNPJ", text_color=COLORS["text_dim"])
+        self.media_label.grid(row=3, column=0, sticky="w")
+
     def _build_log_card(self):
         card_outer, card = self._card(self.main, "LOG DE EXECUCAO")
         card_outer.grid(row=3, column=1, sticky="nsew", padx=(9, 18), pady=8)
@@ -355,6 +469,21 @@ class AutomacaoDCTFApp:
 
         log_actions = ctk.CTkFrame(card, fg_color="transparent")
         log_actions.grid(row=1, column=0, sticky="ew", pady=(8, 0))
+        ctk.CTkOptionMenu(
+            log_actions,
+            values=list(LOG_NIVEIS),
+            variable=self.log_nivel_var,
+            command=lambda valor: self._render_log(),
+            width=100,
+            fg_color="#334155",
+            button_color="#475569",
+        ).pack(side=tk.LEFT)
+        ctk.CTkCheckBox(
+            log_actions,
+            text="Rolagem automatica",
+            variable=self.log_autoscroll_var,
+            text_color=COLORS["text_dim"],
+        ).pack(side=tk.LEFT, padx=10)
         ctk.CTkButton(
             log_actions,
             text="Limpar Log",
@@ -411,6 +540,8 @@ class AutomacaoDCTFApp:
         self.field_vars["timeout"].set(str(self.config.timeout_elemento))
         self.field_vars["tentativas_cnpj"].set(str(self.config.tentativas_por_cnpj))
         self.field_vars["tentativas_gerais"].set(str(self.config.tentativas_gerais))
+        self.field_vars["workers"].set(str(self.config.workers))
+        self.field_vars["abas"].set(str(self.config.abas))
         self.planilha_path_var.set(str(self.config.planilha))
 
     def get_config_from_fields(self) -> Config:
@@ -421,7 +552,26 @@ class AutomacaoDCTFApp:
             timeout_elemento=int(self.field_vars["timeout"].get()),
             tentativas_por_cnpj=int(self.field_vars["tentativas_cnpj"].get()),
             tentativas_gerais=int(self.field_vars["tentativas_gerais"].get()),
+            workers=int(self.field_vars["workers"].get()),
+            abas=int(self.field_vars["abas"].get()),
             planilha_path=self.planilha_path_var.get().strip(),
+            manter_pagina_filtro=self.config.manter_pagina_filtro,
+            perfil_espera=self.config.perfil_espera,
+            pausa_minima=self.config.pausa_minima,
+            timeout_download=self.config.timeout_download,
+            downloads_cdp=self.config.downloads_cdp,
+            reutilizar_sessao=self.config.reutilizar_sessao,
+            estado_execucao=self.config.estado_execucao,
+            timeouts_adaptativos=self.config.timeouts_adaptativos,
+            timeout_multiplicador=self.config.timeout_multiplicador,
+            timeout_piso=self.config.timeout_piso,
+            timeout_teto=self.config.timeout_teto,
+            disjuntor_falhas=self.config.disjuntor_falhas,
+            disjuntor_intervalo=self.config.disjuntor_intervalo,
+            disjuntor_pausa_maxima=self.config.disjuntor_pausa_maxima,
+            perfil_persistente=self.config.perfil_persistente,
+            salvar_planilha_a_cada=self.config.salvar_planilha_a_cada,
+            intervalo_salvamento=self.config.intervalo_salvamento,
         )
 
     def save_config(self):
@@ -442,21 +592,40 @@ class AutomacaoDCTFApp:
     def select_planilha(self):
         filepath = filedialog.askopenfilename(
             title="Selecionar Planilha",
-            filetypes=[("Arquivos Excel", "*.xlsx *.xls"), ("Todos", "*.*")],
+            filetypes=[
+                ("Planilhas", "*.xlsx *.xlsm *.csv *.parquet"),
+                ("Arquivos Excel", "*.xlsx *.xlsm"),
+                ("CSV", "*.csv"),
+                ("Parquet", "*.parquet"),
+                ("Todos", "*.*"),
+            ],
             initialdir=str(self.config.pasta_base),
         )
         if filepath:
+            if self._carga is not None:
+                self.cancel_load()
             self.planilha_path_var.set(filepath)
             self.log_message(f"Planilha selecionada: {filepath}")
-            self.df = None
-            self.cnpjs = []
-            self.codigos = []
-            self.planilha_carregada = False
-            self.resumo_var.set("Clique em 'Carregar Dados' para visualizar")
-            for item in self.data_table.get_children():
-                self.data_table.delete(item)
+            self._clear_planilha("Clique em 'Carregar Dados' para visualizar")
+
+    def _clear_planilha(self, resumo):
+        self.df = None
+        self.indice = None
+        self.cnpjs = []
+        self.codigos = []
+        self.planilha_carregada = False
+        self._preview = []
+        self.start_btn.configure(state="disabled")
+        self._populate_table()
+        self.resumo_var.set(resumo)
 
     def load_planilha(self):
+        if self._carga is not None:
+            self.cancel_load()
+            return
+        if self.running:
+            messagebox.showwarning("Aviso", "Aguarde o fim da automacao para carregar outra planilha.")
+            return
         planilha_path = self.planilha_path_var.get()
         if not planilha_path:
             messagebox.showwarning("Aviso", "Nenhuma planilha selecionada!")
@@ -465,69 +634,212 @@ class AutomacaoDCTFApp:
             messagebox.showerror("Erro", f"Arquivo nao encontrado: {planilha_path}")
             return
 
+        self.log_message(f"Carregando planilha: {planilha_path}")
+        self._clear_planilha("Lendo planilha...")
+        self.load_btn.configure(text="Cancelar", fg_color=COLORS["danger"], hover_color="#dc2626")
+        self.load_progress.set(0)
+        self.load_progress.grid()
+
+        # A leitura roda em outra thread; blocos e resultado chegam pelo canal de progresso
+        self._carga = threading.Event()
+        threading.Thread(
+            target=self._load_planilha_worker,
+            args=(planilha_path, self._carga),
+            daemon=True,
+        ).start()
+
+    def cancel_load(self):
+        carga = self._carga
+        carga.set()
+        self._finish_load(carga, None)
+
+    def _load_planilha_worker(self, planilha_path, carga):
+        """Le a planilha fora da thread da interface, enviando as linhas em blocos para a tabela."""
+        def ao_ler(colunas, bloco, lidas, total):
+            nome_col = next((c for c in COLUNAS_NOME if c in colunas), None)
+            indices = [colunas.index(c) if c in colunas else None for c in ("COD", "CNPJ", nome_col, "STATUS")]
+            preview = [
+                tuple("" if i is None or valores[i] is None else str(valores[i]).strip() for i in indices)
+                for _, valores in bloco
+            ]
+            self.progresso.executar(lambda: self._append_preview(carga, preview, lidas, total))
+
         try:
-            self.log_message(f"Carregando planilha: {planilha_path}")
-            df = pd.read_excel(planilha_path)
-
-            required = ["CNPJ", "COD"]
-            missing = [c for c in required if c not in df.columns]
-            if missing:
-                raise ValueError(f"Colunas obrigatorias nao encontradas: {', '.join(missing)}")
-
-            df["CNPJ"] = df["CNPJ"].astype(str).str.strip()
-            df["COD"] = df["COD"].astype(str).str.strip()
-            if "STATUS" not in df.columns:
-                df["STATUS"] = ""
-            else:
-                df["STATUS"] = df["STATUS"].fillna("")
+            from src.estado import EstadoExecucao
+            from src.planilha import (
+                COLUNAS_NOME,
+                IndiceStatus,
+                aplicar_diario,
+                carregar_planilha,
+                marcar_cnpjs_invalidos,
+            )
 
-            self.df = df
-            self.cnpjs = df["CNPJ"].tolist()
-            self.codigos = df["COD"].tolist()
-            self.planilha_carregada = True
+            # Planilha inalterada desde a ultima leitura vem do cache, sem blocos
+            df = carregar_planilha(planilha_path, ao_ler=ao_ler, deve_parar=carga.is_set)
+            if df is None:
+                return
+            indice = IndiceStatus(df)
+            aplicar_diario(indice, planilha_path)
+            marcar_cnpjs_invalidos(df)
+            if self.config.estado_execucao and self.config.estado_file.exists():
+                with EstadoExecucao(self.config.estado_file, self.config.competencia) as estado:
+                    estado.sincronizar(indice)
+            if not carga.is_set():
+                self.progresso.executar(lambda: self._finish_load(carga, indice))
+        except Exception as e:
+            msg = str(e)
+            self.progresso.executar(lambda: self._finish_load(carga, None, msg))
 
-            self._populate_table()
+    def _append_preview(self, carga, preview, lidas, total):
+        if carga is not self._carga:
+            return
+        self._preview.extend(preview)
+        self.load_progress.set(lidas / total if total else 1)
+        self.resumo_var.set(f"Lendo planilha... {lidas}/{total} linhas")
+        self.data_table.mostrar(range(len(self._preview)), manter_posicao=True)
+
+    def _finish_load(self, carga, indice, erro=None):
+        """Conclui a carga: exibe a planilha lida, o erro ocorrido ou o cancelamento."""
+        if carga is not self._carga:
+            return
+        self._carga = None
+        # O botao volta a "Carregar Dados" antes de qualquer passo que possa falhar
+        self.load_progress.grid_remove()
+        self.load_btn.configure(text="Carregar Dados", fg_color=COLORS["success"], hover_color="#059669")
 
-            total = len(self.cnpjs)
-            baixados = len(df[df["STATUS"].str.contains("Guia baixada", na=False)])
-            pendentes = total - baixados
-            self.log_message(f"Planilha carregada: {total} CNPJs ({pendentes} pendentes)")
-            messagebox.showinfo("Sucesso", f"Planilha carregada!\n\nTotal: {total}\nPendentes: {pendentes}")
+        if indice is not None:
+            try:
+                self._exibir_planilha(indice)
+                return
+            except Exception as e:
+                logging.exception("Erro ao exibir a planilha carregada")
+                erro = str(e)
+
+        if erro is None:
+            self.log_message("Carregamento da planilha cancelado")
+            self._clear_planilha("Carregamento cancelado")
+        else:
+            self.log_message(f"Erro ao carregar planilha: {erro}")
+            self._clear_planilha("Nenhuma planilha carregada")
+            messagebox.showerror("Erro", f"Erro ao carregar planilha:\n{erro}")
+
+    def _exibir_planilha(self, indice):
+        """Passa a usar a planilha lida e habilita o inicio da automacao."""
+        df = indice.df
+        self.df = df
+        self.indice = indice
+        self.cnpjs = df["CNPJ"].tolist()
+        self.codigos = df["COD"].tolist()
+        self.planilha_carregada = True
+        self._preview = []
 
-        except Exception as e:
-            self.log_message(f"Erro ao carregar planilha: {e}")
-            messagebox.showerror("Erro", f"Erro ao carregar planilha:\n{e}")
-            self.planilha_carregada = False
+        self._populate_table()
+        self.start_btn.configure(state="normal")
+
+        total = len(self.cnpjs)
+        pendentes = total - self.total_baixados - self.total_invalidos
+        self.log_message(f"Planilha carregada: {total} CNPJs ({pendentes} pendentes)")
+        messagebox.showinfo("Sucesso", f"Planilha carregada!\n\nTotal: {total}\nPendentes: {pendentes}")
 
     def _get_nome_col(self):
         if self.df is None:
             return None
-        for col in ["NOME", "RAZAO", "RAZAO_SOCIAL", "RAZAO SOCIAL", "EMPRESA"]:
+        from src.planilha import COLUNAS_NOME
+        for col in COLUNAS_NOME:
             if col in self.df.columns:
                 return col
         return None
 
     def _populate_table(self):
-        for item in self.data_table.get_children():
-            self.data_table.delete(item)
+        """Prepara as colunas exibidas e os contadores (somente ao carregar a planilha)."""
         if self.df is None:
+            self._table_columns = None
+            self._baixado = bytearray()
+            self.total_baixados = 0
+            self.total_invalidos = 0
+            self.data_table.mostrar([])
             return
 
+        from src.planilha import cnpjs_validos
+
         nome_col = self._get_nome_col()
-        for _, row in self.df.iterrows():
-            cod = str(row["COD"])
-            cnpj = str(row["CNPJ"])
-            nome = str(row[nome_col]) if nome_col else ""
-            status = str(row["STATUS"]) if row["STATUS"] else "Pendente"
-            self.data_table.insert("", "end", values=(cod, cnpj, nome, status))
+        cods = self.df["COD"].astype(str)
+        cnpjs = self.df["CNPJ"].astype(str)
+        self._table_columns = {
+            "cod": cods.tolist(),
+            "cnpj": cnpjs.tolist(),
+            "nome": self.df[nome_col].astype(str).tolist() if nome_col else None,
+            # Chaves de busca: codigo e CNPJ somente com digitos
+            "busca_cod": cods,
+            "busca_cnpj": cnpjs.str.replace(r"\D", "", regex=True),
+        }
+        baixados = self.df["STATUS"].astype(str).str.contains("Guia baixada", regex=False)
+        self._baixado = bytearray(baixados.to_numpy(dtype="uint8").tobytes())
+        self.total_baixados = int(baixados.sum())
+        # CNPJs invalidos nunca vao ao portal: nao contam como pendentes
+        self.total_invalidos = int((~cnpjs_validos(self.df["CNPJ"])).sum())
+        self._update_resumo()
+        self.apply_filter()
+
+    def _table_row(self, posicao):
+        if self.df is None:
+            # Durante a carga: linhas ja lidas, sem filtro
+            cod, cnpj, nome, status = self._preview[posicao]
+            return (cod, cnpj, nome, status or "Pendente")
+        colunas = self._table_columns
+        nome = colunas["nome"][posicao] if colunas["nome"] is not None else ""
+        status = self.df.iat[posicao, self.df.columns.get_loc("STATUS")]
+        return (colunas["cod"][posicao], colunas["cnpj"][posicao], nome, status or "Pendente")
+
+    def apply_filter(self, manter_posicao=False):
+        """Exibe as linhas que atendem ao filtro de status e a busca por CNPJ/codigo."""
+        import pandas as pd
+
+        self._filter_job = None
+        if self.df is None or self._table_columns is None:
+            self.data_table.mostrar(range(len(self._preview)), manter_posicao)
+            return
+        mascara = pd.Series(True, index=self.df.index)
+        filtro = FILTROS_STATUS.get(self.filtro_status_var.get())
+        if filtro is not None:
+            mascara &= filtro(self.df["STATUS"].astype(str))
+        termo = self.busca_var.get().strip()
+        if termo:
+            encontrado = self._table_columns["busca_cod"].str.contains(termo, regex=False)
+            digitos = "".join(c for c in termo if c.isdigit())
+            if digitos:
+                encontrado |= self._table_columns["busca_cnpj"].str.contains(digitos, regex=False)
+            mascara &= encontrado
+        self.data_table.mostrar(mascara.to_numpy().nonzero()[0].tolist(), manter_posicao)
+
+    def _schedule_filter(self, atraso, manter_posicao=False):
+        if self._filter_job is not None:
+            return
+        self._filter_job = self.root.after(atraso, lambda: self.apply_filter(manter_posicao))
 
+    def _update_resumo(self):
         total = len(self.cnpjs)
-        baixados = len(self.df[self.df["STATUS"].str.contains("Guia baixada", na=False)])
-        pendentes = total - baixados
-        self.resumo_var.set(f"Total: {total}  |  Baixados: {baixados}  |  Pendentes: {pendentes}")
+        pendentes = total - self.total_baixados - self.total_invalidos
+        self.resumo_var.set(f"Total: {total}  |  Baixados: {self.total_baixados}  |  Pendentes: {pendentes}")
 
-    def refresh_table(self):
-        self._populate_table()
+    def update_rows(self, alteracoes):
+        """Atualiza as linhas visiveis dos CNPJs alterados ({cnpj: status}) e os contadores do resumo."""
+        if self.indice is None:
+            return
+        posicoes = []
+        for cnpj, status in alteracoes.items():
+            baixado = "Guia baixada" in str(status)
+            for posicao in self.indice.posicoes(cnpj):
+                posicoes.append(posicao)
+                if posicao < len(self._baixado) and self._baixado[posicao] != baixado:
+                    self._baixado[posicao] = baixado
+                    self.total_baixados += 1 if baixado else -1
+        self._update_resumo()
+        if self.filtro_status_var.get() != "Todos":
+            # A linha pode ter entrado ou saido do filtro; reaplica no maximo 1x por segundo
+            self._schedule_filter(1000, manter_posicao=True)
+        else:
+            self.data_table.atualizar(posicoes)
 
     # =========================================================================
     # VALIDACAO
@@ -541,6 +853,10 @@ class AutomacaoDCTFApp:
                 raise ValueError("Data final deve ter 8 digitos (DDMMAAAA)")
             if not cfg.competencia:
                 raise ValueError("Competencia nao pode estar vazia")
+            if cfg.workers < 1:
+                raise ValueError("Navegadores deve ser pelo menos 1")
+            if cfg.abas < 1:
+                raise ValueError("Abas deve ser pelo menos 1")
             if not self.planilha_carregada:
                 raise ValueError("Planilha nao foi carregada! Clique em 'Carregar Dados' primeiro.")
             if not self.cnpjs:
@@ -555,11 +871,28 @@ class AutomacaoDCTFApp:
     # =========================================================================
     def log_message(self, message: str):
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert("end", f"[{timestamp}] {message}\n")
-        self.log_text.see("end")
+        self.log_queue.put((logging.INFO, f"[{timestamp}] {message}"))
 
     def clear_log(self):
+        self.log_buffer.clear()
+        self.log_text.delete("1.0", "end")
+
+    def _append_log(self, linhas):
+        """Insere as linhas de uma vez e descarta as mais antigas alem de LOG_MAX_LINHAS."""
+        if not linhas:
+            return
+        self.log_text.insert("end", "\n".join(linhas) + "\n")
+        excedente = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINHAS
+        if excedente > 0:
+            self.log_text.delete("1.0", f"{excedente + 1}.0")
+        if self.log_autoscroll_var.get():
+            self.log_text.see("end")
+
+    def _render_log(self):
+        """Reescreve o painel a partir do buffer, com o nivel selecionado."""
+        minimo = LOG_NIVEIS.get(self.log_nivel_var.get(), logging.INFO)
         self.log_text.delete("1.0", "end")
+        self._append_log([mensagem for nivel, mensagem in self.log_buffer if nivel >= minimo])
 
     def open_manual(self):
         manual_path = self.config.pasta_base / "manual.html"
@@ -573,25 +906,60 @@ class AutomacaoDCTFApp:
             messagebox.showerror("Erro", f"Nao foi possivel abrir o manual:\n{e}")
 
     def check_log_queue(self):
+        """Esvazia a fila de log em lote: um unico insert por ciclo."""
+        minimo = LOG_NIVEIS.get(self.log_nivel_var.get(), logging.INFO)
+        novas = []
         while True:
             try:
-                msg = self.log_queue.get_nowait()
-                self.log_text.insert("end", msg + "\n")
-                self.log_text.see("end")
+                nivel, mensagem = self.log_queue.get_nowait()
             except queue.Empty:
                 break
-        self.root.after(120, self.check_log_queue)
+            self.log_buffer.append((nivel, mensagem))
+            if nivel >= minimo:
+                novas.append(mensagem)
+        try:
+            # Num pico de mensagens, so as ultimas LOG_MAX_LINHAS chegariam a aparecer
+            self._append_log(novas[-LOG_MAX_LINHAS:])
+        except Exception:
+            logging.exception("Erro ao exibir o log")
+        finally:
+            # Um erro no ciclo nao pode parar a leitura da fila
+            self.root.after(LOG_INTERVALO_MS, self.check_log_queue)
 
     # =========================================================================
     # PROGRESSO
     # =========================================================================
-    def update_progress(self, message: str, current: int, total: int):
+    def check_progress(self):
+        """Aplica o estado mais recente publicado no canal de progresso."""
+        try:
+            acoes, progresso, status, alteracoes = self.progresso.coletar()
+            for acao in acoes:
+                # Uma acao com erro nao impede as demais (ex.: _finish_load de uma carga)
+                try:
+                    acao()
+                except Exception:
+                    logging.exception("Erro ao atualizar a interface")
+            if alteracoes:
+                self.update_rows(alteracoes)
+            if progresso is not None:
+                self.update_progress(*progresso)
+            if status is not None:
+                self.status_var.set(status)
+        except Exception:
+            logging.exception("Erro ao atualizar o progresso")
+        finally:
+            self.root.after(PROGRESSO_INTERVALO_MS, self.check_progress)
+
+    def update_progress(self, current: int, total: int):
         if total > 0:
             pct = int((current / total) * 100)
             self.progress_pct_var.set(pct)
             self.progress_bar.set(pct / 100)
             self.progress_label.configure(text=f"{current}/{total} | {pct}%")
-        self.status_var.set(message)
+        if self.metricas is not None:
+            media = self.metricas.media_por_cnpj()
+            if media:
+                self.media_label.configure(text=f"Media: {media:.1f} s/CNPJ")
 
     # =========================================================================
     # AUTOMACAO
@@ -604,6 +972,19 @@ class AutomacaoDCTFApp:
             return
 
         self.config = self.get_config_from_fields()
+        estado = None
+        if self.config.estado_execucao:
+            from src.estado import EstadoExecucao
+            try:
+                estado = EstadoExecucao(self.config.estado_file, self.config.competencia)
+                # Na thread do Tk: a tabela le o mesmo DataFrame que a sincronizacao altera
+                if estado.sincronizar(self.indice, self.codigos):
+                    self._populate_table()
+            except Exception as e:
+                if estado is not None:
+                    estado.fechar()
+                messagebox.showerror("Erro", f"Nao foi possivel abrir o estado da execucao:\n\n{e}")
+                return
         self.running = True
         self.should_stop = False
         self.start_btn.configure(state="disabled")
@@ -612,39 +993,81 @@ class AutomacaoDCTFApp:
         self.progress_pct_var.set(0)
         self.progress_bar.set(0)
         self.progress_label.configure(text="0/0 | 0%")
+        self.media_label.configure(text="Media: -- s/CNPJ")
 
         self.status_var.set("Iniciando...")
         self.log_message("Iniciando automacao DCTF...")
 
-        self.worker_thread = threading.Thread(target=self.run_automation, daemon=True)
+        self.worker_thread = threading.Thread(target=self.run_automation, args=(estado,), daemon=True)
         self.worker_thread.start()
 
-    def run_automation(self):
+    def run_automation(self, estado=None):
         import time
 
+        from src.abas import transmissao_abas
+        from src.automacao import configurar_driver, retomar_sessao, transmissao
+        from src.paralelo import transmissao_paralela
+        from src.planilha import GravadorPlanilha
+        from src.sessao import salvar_sessao, sessao_valida
+
+        gravador = None
+        concluido = False
+        timeouts = None
+        if self.config.timeouts_adaptativos:
+            timeouts = TimeoutsAdaptativos(
+                self.config.timeouts_file,
+                multiplicador=self.config.timeout_multiplicador,
+                piso=self.config.timeout_piso,
+                teto=self.config.timeout_teto,
+            )
+        self.metricas = RegistroEtapas(self.config.metricas_dir, timeouts)
         try:
             config = self.config
             pasta = config.pasta_download
             if not pasta.exists():
                 pasta.mkdir(parents=True)
 
-            self.root.after(0, lambda: self.status_var.set("Configurando navegador..."))
+            self.progresso.status("Configurando navegador...")
             self.log_message("Configurando driver do Chrome...")
-            self.driver = configurar_driver(pasta)
-
-            self.root.after(0, lambda: self.status_var.set("Aguardando login manual..."))
-            self.root.after(0, lambda: self.login_btn.configure(state="normal"))
-            self.log_message("Navegador aberto. Faca o login e clique em 'Confirmar Login'.")
-
-            self.waiting_login = True
-            while self.waiting_login and not self.should_stop:
-                time.sleep(0.5)
-
-            if self.should_stop:
-                raise Exception("Automacao interrompida pelo usuario")
+            self.driver = configurar_driver(
+                pasta,
+                config.perfil_espera,
+                config.downloads_cdp,
+                config.abas > 1,
+                pasta_perfil=config.cache if config.perfil_persistente else None,
+            )
 
-            self.root.after(0, lambda: self.login_btn.configure(state="disabled"))
-            self.root.after(0, lambda: self.status_var.set("Processando..."))
+            arquivo_sessao = config.sessao_file if config.reutilizar_sessao else None
+            if retomar_sessao(self.driver, arquivo_sessao, config.timeout_elemento):
+                self.log_message("Sessao anterior restaurada. Login manual dispensado.")
+            else:
+                self.progresso.status("Aguardando login manual...")
+                self.progresso.executar(lambda: self.login_btn.configure(state="normal"))
+                self.log_message("Navegador aberto. Faca o login e clique em 'Confirmar Login'.")
+
+                self.waiting_login = True
+                while self.waiting_login and not self.should_stop:
+                    time.sleep(0.5)
+
+                if self.should_stop:
+                    raise Exception("Automacao interrompida pelo usuario")
+
+                if arquivo_sessao and sessao_valida(self.driver, 10):
+                    try:
+                        salvar_sessao(self.driver, arquivo_sessao)
+                    except OSError as e:
+                        self.log_message(f"Nao foi possivel gravar a sessao: {e}")
+
+            self.progresso.executar(lambda: self.login_btn.configure(state="disabled"))
+            self.progresso.status("Processando...")
+
+            disjuntor = None
+            if config.disjuntor_falhas > 0:
+                disjuntor = Disjuntor(
+                    config.disjuntor_falhas,
+                    config.disjuntor_intervalo,
+                    config.disjuntor_pausa_maxima,
+                )
 
             cnpjs = self.cnpjs
             codigos = self.codigos
@@ -652,12 +1075,33 @@ class AutomacaoDCTFApp:
             planilha_path = self.planilha_path_var.get()
             total = len(cnpjs)
             self.log_message(f"Iniciando processamento de {total} CNPJs")
+            gravador = GravadorPlanilha(
+                df,
+                planilha_path,
+                salvar_a_cada=config.salvar_planilha_a_cada,
+                intervalo_salvamento=config.intervalo_salvamento,
+                indice=self.indice,
+                estado=estado,
+                observador=self.progresso.cnpj,
+            )
 
             def progress_callback(msg, current, total_count):
-                self.root.after(0, lambda: self.update_progress(msg, current, total_count))
-                self.root.after(0, self.refresh_table)
-
-            transmissao(
+                self.progresso.progresso(msg, current, total_count)
+
+            executar = transmissao
+            opcoes_paralelo = {}
+            if config.workers > 1:
+                executar = transmissao_paralela
+                opcoes_paralelo = {"workers": config.workers}
+                self.log_message(f"Modo paralelo: {config.workers} navegadores")
+                if config.abas > 1:
+                    logging.warning(f"abas={config.abas} ignorado: com workers={config.workers}, cada navegador usa uma aba")
+            elif config.abas > 1:
+                executar = transmissao_abas
+                opcoes_paralelo = {"abas": config.abas}
+                self.log_message(f"Modo abas: {config.abas} abas no navegador")
+
+            executar(
                 cnpjs=cnpjs,
                 codigos=codigos,
                 df=df,
@@ -671,21 +1115,33 @@ class AutomacaoDCTFApp:
                 callback=progress_callback,
                 should_stop=lambda: self.should_stop,
                 planilha_path=planilha_path,
+                manter_pagina_filtro=config.manter_pagina_filtro,
+                perfil_espera=config.perfil_espera,
+                pausa_minima=config.pausa_minima,
+                timeout_download=config.timeout_download,
+                downloads_cdp=config.downloads_cdp,
+                gravador=gravador,
+                metricas=self.metricas,
+                disjuntor=disjuntor,
+                **opcoes_paralelo,
             )
 
-            df.to_excel(planilha_path, index=False)
-            self.root.after(0, self.refresh_table)
-            self.root.after(0, lambda: self.status_var.set("Concluido!"))
-            self.log_message("Automacao concluida com sucesso!")
-            self.root.after(0, lambda: messagebox.showinfo("Sucesso", "Automacao concluida!"))
+            concluido = True
 
         except Exception as e:
-            msg = str(e)
-            self.log_message(f"Erro: {msg}")
-            self.root.after(0, lambda: self.status_var.set(f"Erro: {msg[:60]}..."))
-            self.root.after(0, lambda: messagebox.showerror("Erro", f"Ocorreu um erro:\n\n{msg}"))
+            self._reportar_erro(str(e))
 
         finally:
+            # Planilha gravada uma unica vez, com o status final (ou o processado ate o erro)
+            if gravador is not None and not gravador.fechar():
+                self._reportar_erro("Nao foi possivel salvar a planilha. Os status ficaram no diario e serao recuperados ao carregar novamente.")
+            elif concluido:
+                self.progresso.status("Concluido!")
+                self.log_message("Automacao concluida com sucesso!")
+                self.progresso.executar(lambda: messagebox.showinfo("Sucesso", "Automacao concluida!"))
+            if estado is not None:
+                estado.fechar()
+            self.metricas.fechar()
             if self.driver:
                 try:
                     self.driver.quit()
@@ -693,9 +1149,14 @@ class AutomacaoDCTFApp:
                     pass
                 self.driver = None
             self.running = False
-            self.root.after(0, lambda: self.start_btn.configure(state="normal"))
-            self.root.after(0, lambda: self.stop_btn.configure(state="disabled"))
-            self.root.after(0, lambda: self.login_btn.configure(state="disabled"))
+            self.progresso.executar(lambda: self.start_btn.configure(state="normal"))
+            self.progresso.executar(lambda: self.stop_btn.configure(state="disabled"))
+            self.progresso.executar(lambda: self.login_btn.configure(state="disabled"))
+
+    def _reportar_erro(self, msg):
+        self.log_message(f"Erro: {msg}")
+        self.progresso.status(f"Erro: {msg[:60]}...")
+        self.progresso.executar(lambda: messagebox.showerror("Erro", f"Ocorreu um erro:\n\n{msg}"))
 
     def confirm_login(self):
         self.waiting_login = False
@@ -0,0 +1,183 @@
+"""
+Medição do tempo de cada etapa da transmissão.
+
+Cada etapa (navegação, pesquisa, resultado, declaração, download...) é medida
+por um intervalo nomeado, marcado com CNPJ, tentativa e resultado, e gravado
+em um arquivo JSONL por execução. Ao final, um resumo por etapa
+(quantidade, média, p95 e máximo) é registrado no log e gravado ao lado.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+
+# Intervalo que mede o CNPJ inteiro (todas as tentativas)
+ETAPA_CNPJ = 'cnpj'
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolação linear."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    base = int(posicao)
+    fracao = posicao - base
+    if base + 1 < len(ordenados):
+        return ordenados[base] + (ordenados[base + 1] - ordenados[base]) * fracao
+    return ordenados[base]
+
+
+class _Intervalo:
+    """Intervalo em andamento; o resultado pode ser ajustado antes do fim."""
+
+    def __init__(self, etapa, cnpj, tentativa):
+        self.etapa = etapa
+        self.cnpj = cnpj
+        self.tentativa = tentativa
+        self.resultado = 'ok'
+
+
+class RegistroEtapas:
+    """
+    Registra a duração das etapas de uma execução.
+
+    Pode ser compartilhado entre threads (modo paralelo).
+
+    Args:
+        pasta (str or Path): Pasta dos arquivos de métricas. Se None, mantém os
+            dados apenas em memória (resumo e média por CNPJ continuam disponíveis).
+        timeouts (TimeoutsAdaptativos): Política de timeouts alimentada com as
+            durações das etapas concluídas com resultado 'ok' (opcional).
+    """
+
+    def __init__(self, pasta=None, timeouts=None):
+        self.timeouts = timeouts
+        self.caminho: Optional[Path] = None
+        if pasta is not None:
+            pasta = Path(pasta)
+            pasta.mkdir(parents=True, exist_ok=True)
+            self.caminho = pasta / f"etapas-{datetime.now():%Y%m%d-%H%M%S}.jsonl"
+        self._arquivo = None
+        self._lock = threading.Lock()
+        self._duracoes = {}
+
+    def registrar(self, etapa, cnpj, tentativa, resultado, duracao, inicio=None):
+        """Registra um intervalo já medido."""
+        registro = {
+            'etapa': etapa,
+            'cnpj': cnpj,
+            'tentativa': tentativa,
+            'resultado': resultado,
+            'inicio': inicio if inicio is not None else time.time() - duracao,
+            'duracao': round(duracao, 4),
+        }
+        with self._lock:
+            self._duracoes.setdefault(etapa, []).append(duracao)
+            if self.caminho is None:
+                return
+            try:
+                if self._arquivo is None:
+                    self._arquivo = open(self.caminho, 'a', encoding='utf-8')
+                self._arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+                self._arquivo.flush()
+            except OSError as e:
+                logging.warning(f"Não foi possível gravar métricas em {self.caminho}: {e}")
+                self.caminho = None
+
+    @contextmanager
+    def etapa(self, nome, cnpj=None, tentativa=None):
+        """
+        Mede o bloco como a etapa indicada.
+
+        O resultado é 'ok', o nome da exceção que interrompeu o bloco ou o
+        valor atribuído a intervalo.resultado dentro do bloco. Só as durações
+        com resultado 'ok' alimentam os timeouts: uma espera que terminou no
+        próprio limite (ex.: 'sem declaracao' no perfil 'fixo') faria o
+        timeout aprendido crescer a cada CNPJ.
+        """
+        intervalo = _Intervalo(nome, cnpj, tentativa)
+        inicio_relogio = time.time()
+        inicio = time.perf_counter()
+        try:
+            yield intervalo
+        except BaseException as e:
+            intervalo.resultado = type(e).__name__
+            raise
+        else:
+            if self.timeouts is not None and intervalo.resultado == 'ok':
+                self.timeouts.observar(nome, time.perf_counter() - inicio)
+        finally:
+            self.registrar(nome, cnpj, tentativa, intervalo.resultado, time.perf_counter() - inicio, inicio_relogio)
+
+    def cronometro(self, cnpj, tentativa):
+        """Retorna uma função nome -> etapa(nome, cnpj, tentativa), para repassar às funções auxiliares."""
+        def _etapa(nome):
+            return self.etapa(nome, cnpj, tentativa)
+        return _etapa
+
+    def media_por_cnpj(self) -> float:
+        """Média de segundos por CNPJ concluído até o momento."""
+        with self._lock:
+            duracoes = self._duracoes.get(ETAPA_CNPJ, [])
+            return sum(duracoes) / len(duracoes) if duracoes else 0.0
+
+    def resumo(self) -> dict:
+        """
+        Resumo por etapa.
+
+        Returns:
+            dict: etapa -> {'quantidade', 'media', 'p95', 'max'} (segundos).
+        """
+        with self._lock:
+            duracoes = {etapa: list(valores) for etapa, valores in self._duracoes.items()}
+        return {
+            etapa: {
+                'quantidade': len(valores),
+                'media': sum(valores) / len(valores),
+                'p95': percentil(valores, 95),
+                'max': max(valores),
+            }
+            for etapa, valores in duracoes.items()
+        }
+
+    def texto_resumo(self) -> str:
+        """Resumo formatado em tabela, uma linha por etapa."""
+        linhas = [f"{'Etapa':<20}{'Qtd':>6}{'Média':>10}{'p95':>10}{'Máx':>10}"]
+        for etapa, dados in self.resumo().items():
+            linhas.append(
+                f"{etapa:<20}{dados['quantidade']:>6}{dados['media']:>9.2f}s{dados['p95']:>9.2f}s{dados['max']:>9.2f}s"
+            )
+        return "\n".join(linhas)
+
+    def fechar(self) -> str:
+        """
+        Encerra o registro, grava o resumo ao lado do arquivo de etapas e o registra no log.
+
+        Returns:
+            str: Resumo formatado.
+        """
+        texto = self.texto_resumo()
+        with self._lock:
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+        if self.caminho is not None and self._duracoes:
+            try:
+                self.caminho.with_suffix('.resumo.json').write_text(
+                    json.dumps(self.resumo(), indent=2, ensure_ascii=False), encoding='utf-8'
+                )
+            except OSError as e:
+                logging.warning(f"Não foi possível gravar o resumo das métricas: {e}")
+        logging.info("Tempo por etapa:\n" + texto)
+        if self.timeouts is not None:
+            self.timeouts.salvar()
+            aprendidos = ", ".join(f"{etapa}={valor:.0f}s" for etapa, valor in self.timeouts.resumo().items())
+            if aprendidos:
+                logging.info(f"Timeouts aprendidos: {aprendidos}")
+        return texto
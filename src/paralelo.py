@@ -0,0 +1,257 @@
+"""
+Execução com vários navegadores em paralelo, compartilhando um único login manual.
+
+Após o login no navegador principal, os cookies da sessão são injetados em
+navegadores extras. Cada navegador tem sua própria pasta de download e recebe
+uma parte dos CNPJs pendentes; os status passam por um único escritor.
+"""
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from selenium.common.exceptions import TimeoutException
+
+from src.automacao import URL_ECAC, configurar_driver, transmissao
+from src.esperas import PERFIL_EVENTOS
+from src.planilha import GravadorPlanilha
+from src.sessao import exportar_cookies, injetar_cookies, sessao_valida
+
+
+class EscritorStatus:
+    """
+    Escritor único de status: serializa as alterações vindas de vários workers.
+
+    Expõe a mesma interface usada por transmissao (status, pendentes, atualizar,
+    registrar_tentativa, salvar_se_necessario); as gravações são feitas por
+    uma thread dedicada. As leituras também passam pela fila, de modo que o
+    DataFrame só é acessado pela thread do escritor e cada leitura já vê as
+    alterações enfileiradas antes dela.
+
+    Args:
+        gravador (GravadorPlanilha): Gravador que efetivamente altera a planilha.
+    """
+
+    _FIM = object()
+
+    def __init__(self, gravador: GravadorPlanilha):
+        self.gravador = gravador
+        self._fila = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, name="escritor-status", daemon=True)
+        self._thread.start()
+
+    def _executar(self):
+        while True:
+            item = self._fila.get()
+            if item is self._FIM:
+                break
+            funcao, argumentos = item
+            try:
+                funcao(*argumentos)
+            except Exception as e:
+                logging.error(f"Erro ao registrar status: {e}")
+
+    def _consultar(self, funcao, *argumentos):
+        """Executa uma leitura na thread do escritor e aguarda o resultado."""
+        resposta = queue.Queue(maxsize=1)
+
+        def executar():
+            try:
+                resposta.put((True, funcao(*argumentos)))
+            except Exception as e:
+                resposta.put((False, e))
+
+        self._fila.put((executar, ()))
+        ok, resultado = resposta.get()
+        if not ok:
+            raise resultado
+        return resultado
+
+    def status(self, cnpj):
+        return self._consultar(self.gravador.status, cnpj)
+
+    def pendentes(self, cnpjs, codigos):
+        return self._consultar(self.gravador.pendentes, cnpjs, codigos)
+
+    def atualizar(self, cnpj, status, arquivo=None):
+        self._fila.put((self.gravador.atualizar, (cnpj, status, arquivo)))
+
+    def registrar_tentativa(self, cnpj, tentativa, resultado, duracao, erro=None, arquivo=None):
+        self._fila.put((self.gravador.registrar_tentativa, (cnpj, tentativa, resultado, duracao, erro, arquivo)))
+
+    def salvar_se_necessario(self):
+        self._fila.put((self.gravador.salvar_se_necessario, ()))
+
+    def fechar(self):
+        """Aguarda as alterações pendentes serem registradas e encerra a thread."""
+        self._fila.put(self._FIM)
+        self._thread.join()
+
+
+def distribuir_cnpjs(cnpjs, codigos, quantidade):
+    """
+    Distribui os pares (CNPJ, código) em partes intercaladas.
+
+    Returns:
+        list: Lista de tuplas (cnpjs, codigos), uma por worker.
+    """
+    partes = [([], []) for _ in range(quantidade)]
+    for posicao, (cnpj, codigo) in enumerate(zip(cnpjs, codigos)):
+        parte = partes[posicao % quantidade]
+        parte[0].append(cnpj)
+        parte[1].append(codigo)
+    return partes
+
+
+def abrir_worker(pasta_download, cookies, perfil_espera=PERFIL_EVENTOS, eventos_download=False, timeout=30):
+    """
+    Abre um navegador extra já autenticado com os cookies da sessão principal.
+
+    Args:
+        pasta_download (Path): Pasta de download exclusiva do worker.
+        cookies (list): Cookies exportados do navegador principal.
+        perfil_espera (str): Perfil de espera (ver configurar_driver).
+        eventos_download (bool): Ativa eventos de download do DevTools.
+        timeout (int): Tempo máximo para confirmar a sessão (segundos).
+
+    Returns:
+        driver (uc.Chrome): Navegador na página inicial do e-CAC.
+    """
+    driver = configurar_driver(pasta_download, perfil_espera, eventos_download)
+    try:
+        injetar_cookies(driver, cookies, URL_ECAC)
+        if not sessao_valida(driver, timeout):
+            raise TimeoutException("Sessão do navegador principal não foi aceita")
+        return driver
+    except Exception:
+        driver.quit()
+        raise
+
+
+def transmissao_paralela(
+    cnpjs,
+    codigos,
+    df,
+    driver,
+    competencia,
+    pasta_competencia,
+    workers: int = 2,
+    callback: Optional[Callable[[str, int, int], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    gravador: Optional[GravadorPlanilha] = None,
+    planilha_path: Optional[str] = None,
+    **opcoes
+):
+    """
+    Processa os CNPJs com o navegador logado e mais (workers - 1) navegadores extras.
+
+    Args:
+        cnpjs (list): Lista de CNPJs.
+        codigos (list): Lista de códigos dos clientes.
+        df (pd.DataFrame): DataFrame da planilha de clientes.
+        driver (uc.Chrome): Navegador principal, já logado.
+        competencia (str): Competência (ex: '06 2025').
+        pasta_competencia (str or Path): Pasta final dos DARFs.
+        workers (int): Quantidade total de navegadores.
+        callback: Função para reportar progresso (mensagem, atual, total).
+        should_stop: Função que retorna True se deve parar a execução.
+        gravador: Gravador de status da planilha (se None, é criado e fechado aqui).
+        planilha_path: Caminho da planilha (usado se gravador for None).
+        **opcoes: Demais parâmetros repassados a transmissao (datas, timeouts etc.).
+    """
+    pasta_competencia = Path(pasta_competencia)
+    gravador_proprio = gravador is None
+    if gravador_proprio:
+        gravador = GravadorPlanilha(df, planilha_path or 'database.xlsx')
+
+    pendentes = gravador.pendentes(cnpjs, codigos)
+    total = len(pendentes)
+    logging.info(f"Modo paralelo: {total} CNPJs pendentes para até {workers} navegadores")
+
+    # Navegadores extras recebem a sessão do principal
+    drivers = [(driver, pasta_competencia)]
+    extras = max(0, min(workers, total) - 1)
+    if extras:
+        cookies = exportar_cookies(driver)
+        for numero in range(1, extras + 1):
+            if should_stop and should_stop():
+                break
+            pasta_worker = pasta_competencia / f".worker-{numero}"
+            pasta_worker.mkdir(parents=True, exist_ok=True)
+            try:
+                extra = abrir_worker(
+                    pasta_worker,
+                    cookies,
+                    perfil_espera=opcoes.get('perfil_espera', PERFIL_EVENTOS),
+                    eventos_download=opcoes.get('downloads_cdp', False),
+                    timeout=opcoes.get('timeout_elemento', 30),
+                )
+                drivers.append((extra, pasta_worker))
+                logging.info(f"Navegador extra {numero} pronto")
+            except Exception as e:
+                logging.error(f"Navegador extra {numero} não pôde ser iniciado: {e}")
+
+    escritor = EscritorStatus(gravador)
+    lock_progresso = threading.Lock()
+    processados = [0]
+
+    def progresso(numero):
+        def _callback(msg, atual, total_parte):
+            if not callback or msg == "Processamento concluído!":
+                return
+            with lock_progresso:
+                processados[0] += 1
+                callback(f"[Navegador {numero + 1}] {msg}", processados[0], total)
+        return _callback
+
+    def executar(numero, worker_driver, pasta_download, parte_cnpjs, parte_codigos):
+        try:
+            transmissao(
+                cnpjs=parte_cnpjs,
+                codigos=parte_codigos,
+                df=df,
+                driver=worker_driver,
+                competencia=competencia,
+                pasta_competencia=pasta_download,
+                callback=progresso(numero),
+                should_stop=should_stop,
+                gravador=escritor,
+                pasta_destino=pasta_competencia,
+                **opcoes
+            )
+        except Exception as e:
+            logging.error(f"Navegador {numero + 1} interrompido por erro: {e}")
+
+    partes = distribuir_cnpjs([p[0] for p in pendentes], [p[1] for p in pendentes], len(drivers))
+    threads = []
+    for numero, ((worker_driver, pasta_download), (parte_cnpjs, parte_codigos)) in enumerate(zip(drivers, partes)):
+        thread = threading.Thread(
+            target=executar,
+            args=(numero, worker_driver, pasta_download, parte_cnpjs, parte_codigos),
+            name=f"navegador-{numero + 1}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        escritor.fechar()
+        if gravador_proprio:
+            gravador.fechar()
+        for worker_driver, pasta_download in drivers[1:]:
+            try:
+                worker_driver.quit()
+            except Exception:
+                pass
+            try:
+                # Só remove a pasta do worker se não restou nenhum arquivo nela
+                pasta_download.rmdir()
+            except OSError:
+                logging.warning(f"Pasta {pasta_download} mantida: contém arquivos não renomeados")
+
+    if callback:
+        callback("Processamento concluído!", total, total)
@@ -0,0 +1,166 @@
+"""
+Perfil persistente do Chrome (pasta Config.cache).
+
+Com o perfil persistente, o cache HTTP dos arquivos estáticos do e-CAC
+(scripts, estilos, imagens do gov.br) sobrevive entre execuções. Um arquivo
+de trava impede que duas execuções usem o mesmo perfil ao mesmo tempo.
+"""
+import atexit
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+
+
+ARQUIVO_TRAVA = '.automacao.lock'
+
+# Subpastas de cache que podem ser apagadas sem perder cookies e preferências
+PASTAS_CACHE = (
+    'Cache',
+    'Code Cache',
+    'GPUCache',
+    'DawnCache',
+    'GrShaderCache',
+    'ShaderCache',
+    'GraphiteDawnCache',
+    'Crashpad',
+    os.path.join('Service Worker', 'CacheStorage'),
+    os.path.join('Service Worker', 'ScriptCache'),
+)
+
+
+class PerfilEmUsoError(RuntimeError):
+    """O perfil persistente já está em uso por outra execução."""
+
+
+def _processo_ativo(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    if sys.platform.startswith('win'):
+        import ctypes
+        # PROCESS_QUERY_LIMITED_INFORMATION; os.kill(pid, 0) encerraria o processo no Windows
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _dono_trava(trava: Path):
+    try:
+        return int(trava.read_text(encoding='utf-8').strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def travar_perfil(pasta) -> Path:
+    """
+    Reserva o perfil persistente para esta execução.
+
+    Travas deixadas por execuções encerradas de forma abrupta são removidas.
+
+    Args:
+        pasta (str or Path): Pasta do perfil do Chrome.
+
+    Returns:
+        Path: Caminho do arquivo de trava.
+
+    Raises:
+        PerfilEmUsoError: Se outra execução ativa estiver usando o perfil.
+    """
+    pasta = Path(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+    trava = pasta / ARQUIVO_TRAVA
+    while True:
+        try:
+            descritor = os.open(trava, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            dono = _dono_trava(trava)
+            if dono == os.getpid():
+                return trava
+            if _processo_ativo(dono):
+                raise PerfilEmUsoError(
+                    f"O perfil {pasta} está em uso por outra execução (processo {dono}). "
+                    "Feche-a ou desative o perfil persistente."
+                )
+            logging.warning(f"Removendo trava abandonada do perfil (processo {dono} encerrado).")
+            try:
+                trava.unlink()
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(descritor, 'w', encoding='utf-8') as f:
+            f.write(str(os.getpid()))
+        atexit.register(liberar_perfil, pasta)
+        return trava
+
+
+def liberar_perfil(pasta):
+    """Remove a trava do perfil, se pertencer a esta execução."""
+    trava = Path(pasta) / ARQUIVO_TRAVA
+    if _dono_trava(trava) == os.getpid():
+        try:
+            trava.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _tamanho(caminho: Path) -> int:
+    total = 0
+    for raiz, _, arquivos in os.walk(caminho):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except OSError:
+                pass
+    return total
+
+
+def podar_perfil(pasta, completo: bool = False) -> int:
+    """
+    Libera espaço do perfil persistente.
+
+    Args:
+        pasta (str or Path): Pasta do perfil do Chrome.
+        completo (bool): Se True, apaga o perfil inteiro (inclusive cookies);
+            caso contrário, apaga apenas as pastas de cache.
+
+    Returns:
+        int: Quantidade de bytes liberados.
+
+    Raises:
+        PerfilEmUsoError: Se o perfil estiver em uso.
+    """
+    pasta = Path(pasta)
+    if not pasta.exists():
+        return 0
+    travar_perfil(pasta)
+    try:
+        if completo:
+            alvos = [p for p in pasta.iterdir() if p.name != ARQUIVO_TRAVA]
+        else:
+            alvos = [
+                perfil / nome
+                for perfil in [pasta, *[p for p in pasta.iterdir() if p.is_dir()]]
+                for nome in PASTAS_CACHE
+                if (perfil / nome).is_dir()
+            ]
+        liberado = 0
+        for alvo in alvos:
+            liberado += _tamanho(alvo) if alvo.is_dir() else alvo.stat().st_size
+            if alvo.is_dir():
+                shutil.rmtree(alvo, ignore_errors=True)
+            else:
+                alvo.unlink()
+        logging.info(f"Perfil {pasta} podado: {liberado / 1024 / 1024:.1f} MB liberados")
+        return liberado
+    finally:
+        liberar_perfil(pasta)
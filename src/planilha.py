@@ -1,35 +1,337 @@
+import hashlib
+import json
+import os
+import re
+import time
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import logging
 
 
-def ler_planilha(planilha_path):
+# Colunas aceitas como nome do cliente (é lida a primeira encontrada)
+COLUNAS_NOME = ['NOME', 'RAZAO', 'RAZAO_SOCIAL', 'RAZAO SOCIAL', 'EMPRESA']
+
+# Nome do índice do DataFrame lido por carregar_planilha: número da linha na planilha
+LINHA_PLANILHA = 'LINHA_PLANILHA'
+
+# Versão do formato do cache; alterar quando a leitura ou a normalização mudar
+VERSAO_CACHE = 3
+
+# Status dos CNPJs rejeitados na leitura (ver marcar_cnpjs_invalidos); não vão ao portal
+STATUS_CNPJ_INVALIDO = 'CNPJ inválido'
+
+# Pesos dos dígitos verificadores do CNPJ (módulo 11)
+_PESOS_DV1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+_PESOS_DV2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+# Planilhas Excel lidas em parte são regravadas a cada N*fator alterações ou T*fator segundos
+# (cada gravação abre o xlsx inteiro; entre elas, o diário guarda as alterações)
+FATOR_SALVAMENTO_EXCEL = 10
+
+# Formatos de planilha aceitos, pela extensão do arquivo (os demais são lidos como Excel)
+FORMATOS = {'.xlsx': 'excel', '.xlsm': 'excel', '.csv': 'csv', '.parquet': 'parquet', '.pq': 'parquet'}
+
+
+def ler_planilha(planilha_path, estado=None):
     """
-    Lê a planilha de clientes e retorna listas de CNPJs, códigos e o DataFrame.
+    Lê a planilha de clientes e retorna listas de CNPJs, códigos, o DataFrame e o índice de status.
+    
+    Apenas as colunas usadas pela automação são lidas (ver carregar_planilha).
+    Alterações de STATUS registradas no diário e ainda não gravadas na planilha
+    (ex.: execução interrompida) são reaplicadas ao DataFrame, e CNPJs com
+    dígitos verificadores inválidos recebem o status 'CNPJ inválido'.
     
     Args:
-        planilha_path (str or Path): Caminho da planilha Excel.
+        planilha_path (str or Path): Caminho da planilha (Excel, CSV ou Parquet).
+        estado (EstadoExecucao): Se informado, os CNPJs são incluídos no banco e
+            o status gravado nele é projetado na coluna STATUS.
         
     Returns:
-        tuple: (lista de CNPJs, lista de códigos, DataFrame)
+        tuple: (lista de CNPJs, lista de códigos, DataFrame, IndiceStatus)
+    """
+    df = carregar_planilha(planilha_path)
+    
+    indice = IndiceStatus(df)
+    aplicar_diario(indice, planilha_path)
+    marcar_cnpjs_invalidos(df)
+    
+    cnpjs = df['CNPJ'].tolist()
+    codigos = df['COD'].tolist()
+    if estado is not None:
+        estado.sincronizar(indice, codigos)
+    
+    logging.info(f"Planilha carregada: {len(cnpjs)} CNPJs encontrados")
+    return cnpjs, codigos, df, indice
+
+
+def carregar_planilha(planilha_path, ao_ler=None, deve_parar=None, usar_cache=True):
     """
-    df = pd.read_excel(planilha_path)
+    Lê as colunas usadas pela automação (COD, CNPJ, STATUS e nome), já normalizadas.
     
-    # Garantir que CNPJ seja string para comparações consistentes
-    df['CNPJ'] = df['CNPJ'].astype(str).str.strip()
+    Planilhas Excel são lidas em blocos e o resultado é guardado em um cache ao
+    lado da planilha, identificado pelo tamanho, data de modificação e hash do
+    arquivo: reabrir uma planilha que não mudou (ex.: nos reinícios do modo CLI)
+    não repete a leitura do xlsx. O índice do DataFrame é o número de cada linha
+    na planilha, usado por salvar_planilha para gravar o STATUS sem tocar nas
+    demais colunas.
     
+    Arquivos CSV e Parquet (ver formato_planilha) são lidos diretamente, sem
+    cache: a leitura já é rápida.
+    
+    Args:
+        planilha_path (str or Path): Caminho da planilha (Excel, CSV ou Parquet).
+        ao_ler: Função chamada a cada bloco lido com (colunas, bloco, lidas, total),
+            como em ler_planilha_em_blocos. Chamada apenas na leitura de planilhas
+            Excel sem cache.
+        deve_parar: Função que retorna True para interromper a leitura.
+        usar_cache (bool): Se False, ignora o cache existente (ele é regravado).
+        
+    Returns:
+        pd.DataFrame: Colunas lidas da planilha, ou None se a leitura foi interrompida.
+        
+    Raises:
+        ValueError: Se a planilha não tem as colunas CNPJ e COD.
+    """
+    planilha = Path(planilha_path)
+    formato = formato_planilha(planilha)
+    if formato == 'csv':
+        return _normalizar_colunas(_ler_csv(planilha))
+    if formato == 'parquet':
+        return _normalizar_colunas(_ler_parquet(planilha))
+    
+    if usar_cache:
+        df = ler_cache(planilha)
+        if df is not None:
+            logging.info(f"Planilha lida do cache: {caminho_cache(planilha).name}")
+            return df
+    
+    # Assinatura calculada antes da leitura: se o arquivo mudar durante a leitura, o cache não vale
+    assinatura = assinatura_planilha(planilha)
+    colunas = []
+    linhas = []
+    for colunas, bloco, lidas, total in ler_planilha_em_blocos(planilha):
+        if deve_parar and deve_parar():
+            return None
+        linhas.extend(bloco)
+        if ao_ler is not None:
+            ao_ler(colunas, bloco, lidas, total)
+    
+    df = _normalizar_colunas(dataframe_de_linhas(colunas, linhas))
+    gravar_cache(df, planilha, assinatura)
+    return df
+
+
+def formato_planilha(planilha_path):
+    """Retorna o formato da planilha pela extensão: 'excel', 'csv' ou 'parquet'."""
+    return FORMATOS.get(Path(planilha_path).suffix.lower(), 'excel')
+
+
+def _colunas_usadas(cabecalho):
+    """
+    Colunas lidas pela automação, na ordem COD, CNPJ, nome e STATUS (as existentes).
+    
+    Raises:
+        ValueError: Se o cabeçalho não tem as colunas CNPJ e COD.
+    """
+    faltando = [coluna for coluna in ('CNPJ', 'COD') if coluna not in cabecalho]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias não encontradas: {', '.join(faltando)}")
+    nome = next((coluna for coluna in COLUNAS_NOME if coluna in cabecalho), None)
+    return [coluna for coluna in ('COD', 'CNPJ', nome, 'STATUS') if coluna in cabecalho]
+
+
+def _normalizar_colunas(df):
+    # CNPJ sem máscara e com os zeros à esquerda; COD como string para comparações consistentes
+    df['CNPJ'] = normalizar_cnpjs(df['CNPJ'])
+    df['COD'] = df['COD'].astype(str).str.strip()
     # Preservar STATUS existente - só cria coluna se não existir
     if 'STATUS' not in df.columns:
         df['STATUS'] = ''
     else:
-        # Preencher valores NaN com string vazia
         df['STATUS'] = df['STATUS'].fillna('')
+    return df
+
+
+def _dialeto_csv(caminho):
+    """
+    Retorna (separador, codificação, quebra de linha) do CSV.
     
-    cnpjs = df['CNPJ'].tolist()
-    codigos = df['COD'].astype(str).tolist()
+    Separador ';' ou ','; codificação UTF-8 (com ou sem BOM) ou Latin-1 (Excel
+    em português); quebra '\r\n' ou '\n'. Gravar com os mesmos valores mantém
+    o arquivo como o usuário o salvou.
+    """
+    conteudo = Path(caminho).read_bytes()
+    try:
+        conteudo.decode('utf-8')
+        codificacao = 'utf-8-sig' if conteudo.startswith(b'\xef\xbb\xbf') else 'utf-8'
+    except UnicodeDecodeError:
+        codificacao = 'latin-1'
+    primeira = conteudo.split(b'\n', 1)[0]
+    separador = ';' if primeira.count(b';') > primeira.count(b',') else ','
+    quebra = '\r\n' if primeira.endswith(b'\r') else '\n'
+    return separador, codificacao, quebra
+
+
+def _ler_csv(planilha, todas_colunas=False):
+    """Lê o CSV como texto (preserva zeros à esquerda); apenas as colunas usadas, salvo todas_colunas."""
+    separador, codificacao, _ = _dialeto_csv(planilha)
+    opcoes = {'sep': separador, 'encoding': codificacao, 'dtype': str, 'keep_default_na': False}
+    if todas_colunas:
+        return pd.read_csv(planilha, **opcoes)
+    nomes = {str(coluna).strip(): coluna for coluna in pd.read_csv(planilha, nrows=0, **opcoes).columns}
+    colunas = _colunas_usadas(list(nomes))
+    df = pd.read_csv(planilha, usecols=[nomes[coluna] for coluna in colunas], **opcoes)
+    df.columns = [str(coluna).strip() for coluna in df.columns]
+    return _sem_linhas_vazias(df[colunas])
+
+
+def _ler_parquet(planilha):
+    df = pd.read_parquet(planilha)
+    df.columns = [str(coluna).strip() for coluna in df.columns]
+    return _sem_linhas_vazias(df[_colunas_usadas(list(df.columns))])
+
+
+def _sem_linhas_vazias(df):
+    """Descarta as linhas sem valor nas colunas lidas; o índice mantém a posição no arquivo."""
+    preenchidas = (df.fillna('').astype(str).apply(lambda coluna: coluna.str.strip()) != '').any(axis=1)
+    return df[preenchidas].copy()
+
+
+def ler_planilha_em_blocos(planilha_path, tamanho_bloco=500):
+    """
+    Lê as colunas usadas pela automação linha a linha (openpyxl em modo somente leitura), em blocos.
     
-    logging.info(f"Planilha carregada: {len(cnpjs)} CNPJs encontrados")
-    return cnpjs, codigos, df
+    Permite acompanhar e interromper a leitura de planilhas grandes sem
+    carregar o arquivo inteiro de uma vez. Linhas sem valor nas colunas lidas
+    são ignoradas.
+    
+    Args:
+        planilha_path (str or Path): Caminho da planilha Excel.
+        tamanho_bloco (int): Quantidade de linhas por bloco.
+        
+    Yields:
+        tuple: (colunas lidas, bloco, linhas lidas até aqui, total estimado de linhas),
+            sendo cada item do bloco um par (número da linha na planilha, valores).
+            
+    Raises:
+        ValueError: Se a planilha não tem as colunas CNPJ e COD.
+    """
+    from openpyxl import load_workbook
+    
+    livro = load_workbook(planilha_path, read_only=True, data_only=True)
+    try:
+        aba = livro.active
+        # Dimensão declarada no arquivo; pode faltar ou incluir linhas vazias
+        total = max(0, (aba.max_row or 1) - 1)
+        cabecalho = [
+            str(valor).strip() if valor is not None else ''
+            for valor in next(aba.iter_rows(max_row=1, values_only=True), ())
+        ]
+        colunas = _colunas_usadas(cabecalho)
+        primeira = min(cabecalho.index(coluna) for coluna in colunas)
+        ultima = max(cabecalho.index(coluna) for coluna in colunas)
+        posicoes = [cabecalho.index(coluna) - primeira for coluna in colunas]
+        
+        bloco = []
+        lidas = 0
+        linhas = aba.iter_rows(min_row=2, min_col=primeira + 1, max_col=ultima + 1, values_only=True)
+        for numero, linha in enumerate(linhas, start=2):
+            valores = tuple(linha[posicao] if posicao < len(linha) else None for posicao in posicoes)
+            if all(valor is None for valor in valores):
+                continue
+            bloco.append((numero, valores))
+            lidas += 1
+            if len(bloco) >= tamanho_bloco:
+                yield colunas, bloco, lidas, max(total, lidas)
+                bloco = []
+        yield colunas, bloco, lidas, lidas
+    finally:
+        livro.close()
+
+
+def dataframe_de_linhas(colunas, linhas):
+    """
+    Monta o DataFrame a partir das linhas lidas por ler_planilha_em_blocos.
+    
+    Células vazias ficam como NaN, como em pd.read_excel; o índice é o número da linha na planilha.
+    """
+    indice = pd.Index([numero for numero, _ in linhas], name=LINHA_PLANILHA)
+    df = pd.DataFrame([valores for _, valores in linhas], columns=colunas, index=indice)
+    return df.fillna(value=float('nan'))
+
+
+def caminho_cache(planilha_path):
+    """Retorna o caminho do cache da planilha lida (ex.: 'database.cache.json')."""
+    planilha = Path(planilha_path)
+    return planilha.with_name(f"{planilha.stem}.cache.json")
+
+
+def _hash_arquivo(caminho):
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for parte in iter(lambda: arquivo.read(1 << 20), b''):
+            resumo.update(parte)
+    return resumo.hexdigest()
+
+
+def assinatura_planilha(planilha_path):
+    """Identifica o conteúdo da planilha: versão do cache, tamanho, data de modificação e hash."""
+    info = os.stat(planilha_path)
+    return {
+        'versao': VERSAO_CACHE,
+        'tamanho': info.st_size,
+        'modificacao': info.st_mtime_ns,
+        'hash': _hash_arquivo(planilha_path),
+    }
+
+
+def ler_cache(planilha_path):
+    """
+    Retorna o DataFrame em cache se ele corresponde ao conteúdo atual da planilha.
+    
+    Tamanho e data de modificação iguais bastam; se apenas a data mudou (ex.:
+    arquivo copiado), o hash decide. O cache é JSON (apenas dados): como fica
+    ao lado da planilha, possivelmente numa pasta compartilhada, lê-lo nunca
+    executa código.
+    
+    Returns:
+        pd.DataFrame: DataFrame gravado por carregar_planilha, ou None.
+    """
+    cache = caminho_cache(planilha_path)
+    if not cache.exists():
+        return None
+    try:
+        dados = json.loads(cache.read_text(encoding='utf-8'))
+        assinatura = dados['assinatura']
+        info = os.stat(planilha_path)
+        if assinatura['versao'] != VERSAO_CACHE or assinatura['tamanho'] != info.st_size:
+            return None
+        if assinatura['modificacao'] != info.st_mtime_ns and assinatura['hash'] != _hash_arquivo(planilha_path):
+            return None
+        indice = pd.Index(dados['linhas'], name=LINHA_PLANILHA)
+        return pd.DataFrame(dict(zip(dados['colunas'], dados['valores'])), columns=dados['colunas'], index=indice)
+    except Exception as e:
+        logging.warning(f"Cache da planilha ignorado ({cache.name}): {e}")
+        return None
+
+
+def gravar_cache(df, planilha_path, assinatura=None):
+    """Grava o DataFrame lido no cache da planilha (falhas apenas geram aviso)."""
+    cache = caminho_cache(planilha_path)
+    temporario = cache.with_name(f".~{cache.name}")
+    try:
+        dados = {
+            'assinatura': assinatura or assinatura_planilha(planilha_path),
+            'colunas': df.columns.tolist(),
+            'linhas': df.index.tolist(),
+            'valores': [df[coluna].tolist() for coluna in df.columns],
+        }
+        temporario.write_text(json.dumps(dados, ensure_ascii=False), encoding='utf-8')
+        os.replace(temporario, cache)
+    except (OSError, TypeError, ValueError) as e:
+        # TypeError: célula com um tipo que o JSON não representa (ex.: data na coluna de nome)
+        logging.warning(f"Não foi possível gravar o cache da planilha: {e}")
 
 
 def atualizar_status(df, cnpj, status):
@@ -49,4 +351,440 @@ def atualizar_status(df, cnpj, status):
         df.loc[mask, 'STATUS'] = status
         logging.info(f"Status atualizado para CNPJ {cnpj_str}: {status}")
     else:
-        logging.warning(f"CNPJ {cnpj_str} não encontrado na planilha") 
\ No newline at end of file
+        logging.warning(f"CNPJ {cnpj_str} não encontrado na planilha")
+
+
+def normalizar_cnpj(cnpj):
+    """
+    Retorna a chave de comparação de um CNPJ: apenas dígitos e letras maiúsculas.
+    
+    Trata valores lidos como número ('12345678000190.0', ou sem os zeros à
+    esquerda) e com máscara ('12.345.678/0001-90'). Letras são mantidas por
+    causa do CNPJ alfanumérico. Células vazias (None/NaN) viram '', como em
+    normalizar_cnpjs.
+    """
+    if cnpj is None or (not isinstance(cnpj, str) and pd.isna(cnpj)):
+        return ''
+    texto = str(cnpj).strip().upper()
+    if texto.endswith('.0'):
+        texto = texto[:-2]
+    chave = re.sub(r'[^0-9A-Z]', '', texto)
+    if chave.isdigit() and len(chave) < 14:
+        chave = chave.zfill(14)
+    return chave or texto
+
+
+def normalizar_cnpjs(cnpjs):
+    """
+    Versão vetorizada de normalizar_cnpj, para a coluna inteira (valores vazios viram '').
+    
+    Args:
+        cnpjs (pd.Series): Coluna CNPJ como lida da planilha.
+        
+    Returns:
+        pd.Series: CNPJs normalizados.
+    """
+    texto = cnpjs.fillna('').astype(str).str.strip().str.upper().str.replace(r'\.0$', '', regex=True)
+    chave = texto.str.replace(r'[^0-9A-Z]', '', regex=True)
+    numerico = chave.str.fullmatch(r'\d{1,13}')
+    chave = chave.where(~numerico, chave.str.zfill(14))
+    return chave.where(chave != '', texto)
+
+
+def _digito_verificador(valores, pesos):
+    resto = (valores @ pesos) % 11
+    return np.where(resto < 2, 0, 11 - resto)
+
+
+def cnpjs_validos(cnpjs):
+    """
+    Verifica (vetorizado) o formato e os dígitos verificadores de CNPJs normalizados.
+    
+    Aceita o CNPJ numérico e o alfanumérico (12 caracteres [0-9A-Z] seguidos
+    de 2 dígitos), em que cada caractere vale o seu código ASCII menos 48.
+    Sequências de um único caractere repetido são rejeitadas.
+    
+    Args:
+        cnpjs (pd.Series): CNPJs normalizados (ver normalizar_cnpjs).
+        
+    Returns:
+        np.ndarray: Máscara booleana, True para os CNPJs válidos.
+    """
+    formato = cnpjs.astype(str).str.fullmatch(r'[0-9A-Z]{12}\d{2}').to_numpy(dtype=bool)
+    valores = np.zeros((len(cnpjs), 14), dtype=np.int64)
+    if formato.any():
+        texto = ''.join(cnpjs[formato].astype(str).tolist()).encode('ascii')
+        valores[formato] = np.frombuffer(texto, dtype=np.uint8).reshape(-1, 14).astype(np.int64) - 48
+    dv1 = _digito_verificador(valores[:, :12], _PESOS_DV1)
+    dv2 = _digito_verificador(valores[:, :13], _PESOS_DV2)
+    repetidos = (valores == valores[:, :1]).all(axis=1)
+    return formato & (valores[:, 12] == dv1) & (valores[:, 13] == dv2) & ~repetidos
+
+
+def marcar_cnpjs_invalidos(df):
+    """
+    Atribui o status 'CNPJ inválido' às linhas cujo CNPJ não passa na validação.
+    
+    Essas linhas deixam de ser pendentes e nunca chegam ao navegador. Uma linha
+    marcada como inválida cujo CNPJ foi corrigido volta a ficar pendente.
+    
+    Args:
+        df (pd.DataFrame): DataFrame da planilha, com CNPJs normalizados.
+        
+    Returns:
+        int: Quantidade de linhas com CNPJ inválido.
+    """
+    validos = cnpjs_validos(df['CNPJ'])
+    status = df['STATUS'].astype(str).to_numpy()
+    df.loc[validos & (status == STATUS_CNPJ_INVALIDO), 'STATUS'] = ''
+    invalidos = ~validos
+    quantidade = int(invalidos.sum())
+    if quantidade:
+        df.loc[invalidos, 'STATUS'] = STATUS_CNPJ_INVALIDO
+        exemplos = ', '.join(df.loc[invalidos, 'CNPJ'].head(5).tolist())
+        logging.warning(
+            f"{quantidade} CNPJs inválidos na planilha não serão processados "
+            f"(ex.: {exemplos or 'vazio'})"
+        )
+    return quantidade
+
+
+class IndiceStatus:
+    """
+    Índice dos STATUS do DataFrame por CNPJ normalizado, com leitura e escrita O(1).
+    
+    Cada CNPJ aponta para as posições das linhas em que aparece (CNPJs
+    duplicados são atualizados em todas as linhas). As escritas vão direto
+    para o DataFrame, por posição.
+    
+    Args:
+        df (pd.DataFrame): DataFrame da planilha (com as colunas CNPJ e STATUS).
+    """
+    
+    def __init__(self, df):
+        self.df = df
+        self._coluna_status = df.columns.get_loc('STATUS')
+        self._posicoes = {}
+        for posicao, cnpj in enumerate(df['CNPJ'].tolist()):
+            self._posicoes.setdefault(normalizar_cnpj(cnpj), []).append(posicao)
+        duplicados = self.duplicados()
+        if duplicados:
+            logging.warning(f"CNPJs duplicados na planilha: {', '.join(sorted(duplicados))}")
+    
+    def __contains__(self, cnpj):
+        return normalizar_cnpj(cnpj) in self._posicoes
+    
+    def __len__(self):
+        return len(self._posicoes)
+    
+    def posicoes(self, cnpj):
+        """Retorna as posições das linhas do CNPJ no DataFrame (lista vazia se não existir)."""
+        return self._posicoes.get(normalizar_cnpj(cnpj), [])
+    
+    def get(self, cnpj, padrao=''):
+        """Retorna o STATUS do CNPJ (da primeira linha em que aparece)."""
+        posicoes = self._posicoes.get(normalizar_cnpj(cnpj))
+        if not posicoes:
+            return padrao
+        return self.df.iat[posicoes[0], self._coluna_status]
+    
+    def set(self, cnpj, status):
+        """
+        Atualiza o STATUS do CNPJ em todas as linhas em que aparece.
+        
+        Returns:
+            bool: True se o CNPJ existe na planilha.
+        """
+        posicoes = self._posicoes.get(normalizar_cnpj(cnpj))
+        if not posicoes:
+            logging.warning(f"CNPJ {str(cnpj).strip()} não encontrado na planilha")
+            return False
+        for posicao in posicoes:
+            self.df.iat[posicao, self._coluna_status] = status
+        logging.info(f"Status atualizado para CNPJ {str(cnpj).strip()}: {status}")
+        return True
+    
+    def duplicados(self):
+        """Retorna os CNPJs normalizados que aparecem em mais de uma linha."""
+        return {cnpj for cnpj, posicoes in self._posicoes.items() if len(posicoes) > 1}
+
+
+def caminho_diario(planilha_path):
+    """Retorna o caminho do diário de status da planilha (ex.: 'database.status.jsonl')."""
+    planilha = Path(planilha_path)
+    return planilha.with_name(f"{planilha.stem}.status.jsonl")
+
+
+def aplicar_diario(indice, planilha_path):
+    """
+    Reaplica ao DataFrame as alterações de STATUS pendentes no diário da planilha.
+    
+    Args:
+        indice (IndiceStatus): Índice de status do DataFrame da planilha.
+        planilha_path (str or Path): Caminho da planilha Excel.
+        
+    Returns:
+        int: Quantidade de registros reaplicados.
+    """
+    registros = DiarioStatus(caminho_diario(planilha_path)).ler()
+    for cnpj, status in registros:
+        indice.set(cnpj, status)
+    if registros:
+        logging.info(f"{len(registros)} alterações de status recuperadas do diário")
+    return len(registros)
+
+
+def salvar_planilha(df, planilha_path):
+    """
+    Grava o DataFrame na planilha de forma atômica e descarta o diário já incorporado.
+    
+    Um DataFrame lido por carregar_planilha tem apenas algumas colunas: nele,
+    somente a coluna STATUS é regravada, e as demais colunas e a formatação da
+    planilha são preservadas. CSV e Parquet são gravados no mesmo formato,
+    também substituindo apenas a coluna STATUS.
+    
+    Args:
+        df (pd.DataFrame): DataFrame da planilha.
+        planilha_path (str or Path): Caminho da planilha (Excel, CSV ou Parquet).
+    """
+    planilha = Path(planilha_path)
+    temporario = planilha.with_name(f".~{planilha.stem}.tmp{planilha.suffix}")
+    formato = formato_planilha(planilha)
+    parcial = formato == 'excel' and df.index.name == LINHA_PLANILHA
+    if formato == 'csv':
+        separador, codificacao, quebra = _dialeto_csv(planilha)
+        completo = _com_status(_ler_csv(planilha, todas_colunas=True), df)
+        completo.to_csv(temporario, index=False, sep=separador, encoding=codificacao, lineterminator=quebra)
+    elif formato == 'parquet':
+        _com_status(pd.read_parquet(planilha), df).to_parquet(temporario, index=False)
+    elif parcial:
+        _gravar_coluna_status(df, planilha, temporario)
+    else:
+        df.to_excel(temporario, index=False)
+    os.replace(temporario, planilha)
+    DiarioStatus(caminho_diario(planilha)).limpar()
+    if parcial:
+        # O DataFrame já reflete o arquivo gravado: a próxima leitura usa o cache
+        gravar_cache(df, planilha)
+
+
+def _com_status(completo, df):
+    """Substitui (ou cria) a coluna STATUS do arquivo completo pela do DataFrame (índice = posição no arquivo)."""
+    if len(df) and df.index.max() >= len(completo):
+        raise ValueError(f"A planilha tem {len(completo)} linhas, menos que as lidas; arquivo alterado durante a execução?")
+    nomes = {str(coluna).strip(): coluna for coluna in completo.columns}
+    coluna = nomes.get('STATUS', 'STATUS')
+    if coluna not in completo.columns:
+        completo[coluna] = ''
+    completo[coluna] = completo[coluna].astype(object)
+    completo.loc[df.index, coluna] = df['STATUS'].to_numpy()
+    return completo
+
+
+def _gravar_coluna_status(df, planilha, destino):
+    """Copia a planilha para o destino, substituindo apenas a coluna STATUS das linhas do DataFrame."""
+    from openpyxl import load_workbook
+    
+    livro = load_workbook(planilha)
+    try:
+        aba = livro.active
+        cabecalho = [str(celula.value).strip() if celula.value is not None else '' for celula in aba[1]]
+        if 'STATUS' in cabecalho:
+            coluna = cabecalho.index('STATUS') + 1
+        else:
+            coluna = len(cabecalho) + 1
+            aba.cell(row=1, column=coluna, value='STATUS')
+        for linha, status in zip(df.index.tolist(), df['STATUS'].tolist()):
+            aba.cell(row=linha, column=coluna, value=status or None)
+        livro.save(destino)
+    finally:
+        livro.close()
+
+
+class DiarioStatus:
+    """
+    Diário append-only (JSONL) das alterações de STATUS.
+    
+    Cada registro é gravado com fsync, de modo que uma queda do programa não
+    perde alterações ainda não gravadas na planilha. Uma linha incompleta
+    deixada por uma queda é encerrada antes do próximo registro.
+    
+    Args:
+        caminho (str or Path): Caminho do arquivo do diário.
+    """
+    
+    def __init__(self, caminho):
+        self.caminho = Path(caminho)
+        self._arquivo = None
+    
+    def registrar(self, cnpj, status):
+        """Acrescenta uma alteração de status ao diário."""
+        if self._arquivo is None:
+            self._arquivo = open(self.caminho, 'a', encoding='utf-8')
+            if self._arquivo.tell() and not self._termina_em_nova_linha():
+                self._arquivo.write('\n')
+        registro = {'cnpj': str(cnpj).strip(), 'status': status, 'ts': time.time()}
+        self._arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+    
+    def _termina_em_nova_linha(self):
+        with open(self.caminho, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+    
+    def ler(self):
+        """
+        Lê os registros do diário, ignorando uma última linha incompleta.
+        
+        Returns:
+            list: Lista de tuplas (cnpj, status) na ordem em que foram gravadas.
+        """
+        if not self.caminho.exists():
+            return []
+        registros = []
+        with open(self.caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                    registros.append((registro['cnpj'], registro['status']))
+                except (ValueError, KeyError):
+                    logging.warning(f"Registro inválido ignorado no diário {self.caminho}")
+        return registros
+    
+    def limpar(self):
+        """Remove o diário (após suas alterações terem sido gravadas na planilha)."""
+        self.fechar()
+        try:
+            self.caminho.unlink()
+        except FileNotFoundError:
+            pass
+    
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+
+class GravadorPlanilha:
+    """
+    Centraliza as alterações de STATUS durante a execução.
+    
+    Cada alteração é aplicada ao DataFrame e registrada no diário; a planilha
+    é regravada apenas a cada N alterações ou T segundos, e ao final. Uma
+    planilha Excel lida por carregar_planilha é regravada com intervalos
+    FATOR_SALVAMENTO_EXCEL vezes maiores: regravar a coluna STATUS exige abrir
+    o xlsx inteiro, e entre as gravações o diário já guarda as alterações.
+    
+    Com um EstadoExecucao, o banco SQLite substitui o diário e guarda também
+    as tentativas; a planilha vira uma projeção do estado, gravada apenas ao
+    final (fechar) ou quando solicitado (salvar).
+    
+    Args:
+        df (pd.DataFrame): DataFrame da planilha.
+        planilha_path (str or Path): Caminho da planilha Excel.
+        salvar_a_cada (int): Quantidade de alterações entre gravações da planilha.
+        intervalo_salvamento (float): Tempo máximo entre gravações (segundos).
+        indice (IndiceStatus): Índice de status do DataFrame. Se None, é criado.
+        estado (EstadoExecucao): Estado da execução em SQLite (opcional).
+        observador: Função chamada com (cnpj, status) após cada alteração
+            (ex.: atualizar a linha correspondente na interface).
+    """
+    
+    def __init__(
+        self,
+        df,
+        planilha_path,
+        salvar_a_cada: int = 50,
+        intervalo_salvamento: float = 60,
+        indice=None,
+        estado=None,
+        observador=None
+    ):
+        self.df = df
+        self.estado = estado
+        self.observador = observador
+        self.indice = indice if indice is not None else IndiceStatus(df)
+        self.planilha_path = Path(planilha_path)
+        fator = 1
+        if formato_planilha(planilha_path) == 'excel' and df.index.name == LINHA_PLANILHA:
+            fator = FATOR_SALVAMENTO_EXCEL
+        self.salvar_a_cada = max(1, int(salvar_a_cada)) * fator
+        self.intervalo_salvamento = intervalo_salvamento * fator
+        self.diario = DiarioStatus(caminho_diario(planilha_path))
+        self._pendentes = 0
+        self._ultimo_salvamento = time.monotonic()
+    
+    def status(self, cnpj):
+        """Retorna o status atual de um CNPJ."""
+        return self.indice.get(cnpj)
+    
+    def pendentes(self, cnpjs, codigos):
+        """
+        Pares (CNPJ, código) ainda sem guia baixada, na ordem recebida.
+        
+        CNPJs inválidos nunca são pendentes. Com estado, os pendentes vêm da
+        consulta indexada do banco.
+        """
+        if self.estado is not None:
+            abertos = self.estado.pendentes()
+            return [(cnpj, codigo) for cnpj, codigo in zip(cnpjs, codigos) if normalizar_cnpj(cnpj) in abertos]
+        return [
+            (cnpj, codigo) for cnpj, codigo in zip(cnpjs, codigos)
+            if 'Guia baixada' not in str(self.status(cnpj))
+            and self.status(cnpj) != STATUS_CNPJ_INVALIDO
+        ]
+    
+    def atualizar(self, cnpj, status, arquivo=None):
+        """Atualiza o status de um CNPJ no DataFrame e no diário (ou no estado)."""
+        self.indice.set(cnpj, status)
+        if self.estado is not None:
+            self.estado.atualizar(cnpj, status, arquivo)
+        else:
+            self.diario.registrar(cnpj, status)
+        self._pendentes += 1
+        if self.observador is not None:
+            self.observador(cnpj, status)
+    
+    def registrar_tentativa(self, cnpj, tentativa, resultado, duracao, erro=None, arquivo=None):
+        """Registra uma tentativa do CNPJ no estado (ignorado sem estado)."""
+        if self.estado is not None:
+            self.estado.registrar_tentativa(cnpj, tentativa, resultado, duracao, erro, arquivo)
+    
+    def salvar_se_necessario(self):
+        """Regrava a planilha se o limite de alterações ou de tempo foi atingido."""
+        if not self._pendentes or self.estado is not None:
+            return
+        decorrido = time.monotonic() - self._ultimo_salvamento
+        if self._pendentes >= self.salvar_a_cada or decorrido >= self.intervalo_salvamento:
+            self.salvar()
+    
+    def salvar(self):
+        """
+        Regrava a planilha com todas as alterações e descarta o diário.
+        
+        Returns:
+            bool: True se a planilha foi gravada.
+        """
+        self._ultimo_salvamento = time.monotonic()
+        try:
+            self.diario.fechar()
+            salvar_planilha(self.df, self.planilha_path)
+            self._pendentes = 0
+            logging.info(f"Planilha salva: {self.planilha_path}")
+            return True
+        except Exception as e:
+            # O diário é mantido: as alterações serão recuperadas na próxima leitura
+            logging.error(f"Erro ao salvar planilha: {e}")
+            return False
+    
+    def fechar(self):
+        """
+        Grava as alterações pendentes e fecha o diário.
+        
+        Returns:
+            bool: True se não restaram alterações fora da planilha.
+        """
+        salvo = self.salvar() if self._pendentes else True
+        self.diario.fechar()
+        return salvo
@@ -0,0 +1,167 @@
+"""
+Esperas entre tentativas e disjuntor para indisponibilidades do e-CAC.
+
+As novas tentativas aguardam um tempo que dobra a cada falha, com uma parte
+sorteada (jitter) para que navegadores e reinícios não voltem ao portal ao
+mesmo tempo. O disjuntor observa falhas consecutivas em CNPJs diferentes:
+quando o problema parece ser do portal e não de um CNPJ, o lote inteiro é
+pausado (aberto) e o portal é sondado periodicamente (meio-aberto) até voltar
+a responder, quando o lote é retomado (fechado).
+"""
+import logging
+import random
+import threading
+import time
+
+
+class PortalIndisponivelError(RuntimeError):
+    """O e-CAC continuou indisponível após a pausa máxima do disjuntor."""
+
+
+def espera_exponencial(tentativa, base=3.0, teto=60.0, sorteio=random) -> float:
+    """
+    Tempo de espera antes da tentativa seguinte.
+
+    O atraso é base x 2^(tentativa - 1), limitado ao teto; metade dele é fixa e
+    a outra metade é sorteada.
+
+    Args:
+        tentativa (int): Número da tentativa que falhou (1 = primeira).
+        base (float): Atraso após a primeira falha (segundos).
+        teto (float): Maior atraso permitido (segundos).
+        sorteio: Gerador com o método uniform (random ou random.Random).
+
+    Returns:
+        float: Segundos a aguardar.
+    """
+    atraso = min(teto, base * 2 ** max(0, tentativa - 1))
+    return atraso / 2 + sorteio.uniform(0, atraso / 2)
+
+
+def aguardar(segundos, should_stop=None, passo=0.5, relogio=time) -> bool:
+    """
+    Aguarda o tempo indicado, verificando periodicamente o pedido de parada.
+
+    Args:
+        relogio: Fonte de tempo com monotonic e sleep (o módulo time ou um substituto).
+
+    Returns:
+        bool: False se a execução foi interrompida durante a espera.
+    """
+    fim = relogio.monotonic() + segundos
+    while True:
+        if should_stop and should_stop():
+            return False
+        restante = fim - relogio.monotonic()
+        if restante <= 0:
+            return True
+        relogio.sleep(min(passo, restante))
+
+
+class Disjuntor:
+    """
+    Pausa o lote quando falhas consecutivas atingem CNPJs diferentes.
+
+    Só CNPJs distintos contam para o limite: um CNPJ com problema próprio que
+    falha várias vezes seguidas não abre o disjuntor sozinho.
+
+    Pode ser compartilhado entre threads (modo paralelo): apenas uma delas
+    sonda o portal enquanto as demais aguardam o resultado.
+
+    Args:
+        limite_falhas (int): CNPJs diferentes com falhas consecutivas que abrem o disjuntor.
+        intervalo_sonda (float): Espera inicial entre sondagens do portal (segundos);
+            dobra a cada sondagem sem sucesso, até 8x.
+        pausa_maxima (float): Tempo máximo de pausa antes de desistir (segundos).
+        relogio: Fonte de tempo com monotonic e sleep (ver aguardar).
+        sorteio: Gerador do jitter das sondagens (ver espera_exponencial).
+    """
+
+    def __init__(self, limite_falhas=4, intervalo_sonda=30.0, pausa_maxima=1800.0, relogio=time, sorteio=random):
+        self.limite_falhas = max(2, limite_falhas)
+        self.intervalo_sonda = intervalo_sonda
+        self.pausa_maxima = pausa_maxima
+        self.relogio = relogio
+        self.sorteio = sorteio
+        self.aberturas = 0
+        self._falhas = []
+        self._aberto = False
+        self._lock = threading.Lock()
+        self._sonda_lock = threading.Lock()
+
+    @property
+    def aberto(self) -> bool:
+        return self._aberto
+
+    def sucesso(self):
+        """Registra um CNPJ processado sem erro de portal; zera a sequência de falhas."""
+        with self._lock:
+            self._falhas.clear()
+
+    def falha(self, cnpj) -> bool:
+        """
+        Registra uma tentativa que falhou.
+
+        Returns:
+            bool: True se esta falha abriu o disjuntor (a tentativa não deve ser contada).
+        """
+        with self._lock:
+            self._falhas.append(cnpj)
+            if self._aberto:
+                return True
+            distintos = len(set(self._falhas))
+            if distintos >= self.limite_falhas:
+                self._aberto = True
+                self.aberturas += 1
+                logging.warning(
+                    f"Disjuntor aberto: {len(self._falhas)} falhas seguidas em "
+                    f"{distintos} CNPJs. Pausando o lote."
+                )
+                return True
+            return False
+
+    def cnpjs_afetados(self) -> list:
+        """CNPJs da sequência de falhas atual, na ordem em que falharam."""
+        with self._lock:
+            return list(dict.fromkeys(self._falhas))
+
+    def aguardar_portal(self, sonda, should_stop=None) -> bool:
+        """
+        Mantém o lote pausado até a sonda confirmar que o portal voltou.
+
+        Args:
+            sonda: Função sem argumentos que retorna True se o portal responde.
+            should_stop: Função que retorna True se deve parar a execução.
+
+        Returns:
+            bool: True se o portal voltou; False se a execução foi interrompida.
+
+        Raises:
+            PortalIndisponivelError: Se o portal não voltar dentro de pausa_maxima.
+        """
+        with self._sonda_lock:
+            if not self._aberto:
+                return True
+            inicio = self.relogio.monotonic()
+            sondagem = 0
+            while True:
+                sondagem += 1
+                espera = espera_exponencial(sondagem, self.intervalo_sonda, self.intervalo_sonda * 8, self.sorteio)
+                if self.relogio.monotonic() - inicio + espera > self.pausa_maxima:
+                    raise PortalIndisponivelError(
+                        f"e-CAC indisponível há {self.relogio.monotonic() - inicio:.0f} segundos"
+                    )
+                logging.info(f"Disjuntor aberto: nova sondagem do portal em {espera:.0f} segundos")
+                if not aguardar(espera, should_stop, relogio=self.relogio):
+                    return False
+                try:
+                    disponivel = sonda()
+                except Exception as e:
+                    logging.info(f"Sondagem do portal falhou: {e}")
+                    disponivel = False
+                if disponivel:
+                    with self._lock:
+                        self._aberto = False
+                        self._falhas.clear()
+                    logging.info(f"Portal disponível após {self.relogio.monotonic() - inicio:.0f} segundos. Retomando o lote.")
+                    return True
@@ -0,0 +1,186 @@
+"""
+Exportação e reaproveitamento da sessão autenticada do e-CAC entre navegadores.
+
+A sessão (cookies e localStorage) pode ser gravada em arquivo após o login e
+restaurada em um navegador novo, evitando um novo login manual quando a
+execução é reiniciada e a sessão ainda é válida.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+
+# Campos aceitos por Network.setCookies (o restante vem de Network.getAllCookies)
+CAMPOS_COOKIE = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+
+
+def exportar_cookies(driver):
+    """
+    Exporta todos os cookies do navegador (de todos os domínios, inclusive o gov.br).
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome já logada.
+
+    Returns:
+        list: Lista de cookies (dicionários no formato do DevTools ou do Selenium).
+    """
+    try:
+        cookies = driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']
+    except (WebDriverException, KeyError) as e:
+        logging.warning(f"Não foi possível ler todos os cookies pelo DevTools, usando os do domínio atual: {e}")
+        cookies = driver.get_cookies()
+    logging.info(f"Sessão exportada: {len(cookies)} cookies")
+    return cookies
+
+
+def injetar_cookies(driver, cookies, url):
+    """
+    Injeta cookies exportados em outro navegador e abre a URL informada.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome que receberá a sessão.
+        cookies (list): Cookies obtidos por exportar_cookies.
+        url (str): Página a abrir após a injeção (ex.: página inicial do e-CAC).
+    """
+    parametros = []
+    for cookie in cookies:
+        parametro = {campo: cookie[campo] for campo in CAMPOS_COOKIE if campo in cookie}
+        # Cookies de sessão não têm validade; expires negativo os descartaria
+        if cookie.get('session') or parametro.get('expires', 0) < 0:
+            parametro.pop('expires', None)
+        parametros.append(parametro)
+
+    try:
+        driver.execute_cdp_cmd('Network.setCookies', {'cookies': parametros})
+    except WebDriverException as e:
+        logging.warning(f"Falha ao injetar cookies pelo DevTools, usando o Selenium: {e}")
+        driver.get(url)
+        for cookie in cookies:
+            try:
+                driver.add_cookie({k: v for k, v in cookie.items() if k in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry')})
+            except WebDriverException:
+                # Cookies de outros domínios não podem ser adicionados pela página atual
+                pass
+    driver.get(url)
+    logging.info(f"Sessão injetada: {len(parametros)} cookies")
+
+
+def sessao_valida(driver, timeout=10):
+    """
+    Verifica se o navegador está autenticado, procurando o link Home do e-CAC.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome já na página do e-CAC.
+        timeout (int): Tempo máximo de espera (segundos).
+
+    Returns:
+        bool: True se a página principal do e-CAC foi identificada.
+    """
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.XPATH, '//*[@id="linkHome"]'))
+        )
+        return True
+    except TimeoutException:
+        return False
+
+
+def salvar_sessao(driver, caminho):
+    """
+    Grava os cookies e o localStorage da página atual em arquivo.
+
+    O arquivo contém credenciais de sessão e é criado com acesso restrito ao usuário.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome logada, na página do e-CAC.
+        caminho (str or Path): Arquivo JSON de destino.
+    """
+    caminho = Path(caminho)
+    try:
+        origem = driver.execute_script("return window.location.origin;")
+        itens = driver.execute_script(
+            "var itens = {};"
+            "for (var i = 0; i < localStorage.length; i++) {"
+            "  var chave = localStorage.key(i); itens[chave] = localStorage.getItem(chave);"
+            "}"
+            "return itens;"
+        ) or {}
+    except WebDriverException as e:
+        logging.warning(f"Não foi possível ler o localStorage: {e}")
+        origem, itens = None, {}
+
+    dados = {
+        'salvo_em': time.time(),
+        'cookies': exportar_cookies(driver),
+        'local_storage': {origem: itens} if origem else {},
+    }
+    temporario = caminho.with_name(f".~{caminho.name}")
+    descritor = os.open(temporario, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descritor, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+    logging.info(f"Sessão gravada em {caminho}")
+
+
+def descartar_sessao(caminho):
+    """Remove o arquivo de sessão gravado (ex.: quando a sessão expirou)."""
+    try:
+        Path(caminho).unlink()
+        logging.info(f"Sessão gravada descartada: {caminho}")
+    except FileNotFoundError:
+        pass
+
+
+def restaurar_sessao(driver, caminho, url, timeout=10):
+    """
+    Restaura em um navegador novo a sessão gravada por salvar_sessao.
+
+    Args:
+        driver (uc.Chrome): Instância do Chrome recém-aberta.
+        caminho (str or Path): Arquivo JSON gravado por salvar_sessao.
+        url (str): Página do e-CAC usada para validar a sessão.
+        timeout (int): Tempo máximo para confirmar a sessão (segundos).
+
+    Returns:
+        bool: True se a sessão restaurada está válida. Se expirou, o arquivo é descartado.
+    """
+    caminho = Path(caminho)
+    try:
+        dados = json.loads(caminho.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        logging.warning(f"Arquivo de sessão ilegível ({caminho}): {e}")
+        descartar_sessao(caminho)
+        return False
+
+    try:
+        injetar_cookies(driver, dados.get('cookies', []), url)
+        origem = driver.execute_script("return window.location.origin;")
+        itens = dados.get('local_storage', {}).get(origem)
+        if itens:
+            driver.execute_script(
+                "var itens = arguments[0];"
+                "for (var chave in itens) { localStorage.setItem(chave, itens[chave]); }",
+                itens
+            )
+            driver.refresh()
+    except WebDriverException as e:
+        logging.warning(f"Falha ao restaurar a sessão gravada: {e}")
+        return False
+
+    if sessao_valida(driver, timeout):
+        idade = (time.time() - dados.get('salvo_em', time.time())) / 60
+        logging.info(f"Sessão restaurada (gravada há {idade:.0f} min). Login manual dispensado.")
+        return True
+
+    logging.info("Sessão gravada expirou. Será necessário novo login.")
+    descartar_sessao(caminho)
+    return False
@@ -0,0 +1,139 @@
+"""
+Tabela virtualizada para planilhas grandes.
+
+Apenas as linhas visíveis existem como itens do Treeview; ao rolar, os mesmos
+itens recebem os valores da nova janela. Os dados continuam no DataFrame e
+são lidos por uma função posição -> valores, de modo que uma planilha com
+dezenas de milhares de linhas não cria um item Tk por linha.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+
+class TabelaVirtual:
+    """
+    Treeview que desenha somente a janela visível de uma lista de posições.
+
+    Args:
+        parent: Widget pai.
+        colunas (list): Tuplas (chave, título, largura, largura mínima, alinhamento).
+        linha: Função posição -> tupla de valores, na ordem das colunas.
+        style (str): Estilo ttk do Treeview.
+        altura_linha (int): Altura de cada linha em pixels (a mesma do estilo).
+        bg (str): Cor de fundo do contêiner.
+    """
+
+    def __init__(self, parent, colunas, linha, style=None, altura_linha=28, bg=None):
+        self.linha = linha
+        self.altura_linha = altura_linha
+        self.frame = tk.Frame(parent, bg=bg, highlightthickness=0)
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.frame.grid_rowconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(
+            self.frame,
+            columns=[coluna[0] for coluna in colunas],
+            show="headings",
+            style=style,
+            selectmode="browse",
+            height=8,
+        )
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scroll = ttk.Scrollbar(self.frame, orient="vertical", command=self._rolar)
+        self.scroll.grid(row=0, column=1, sticky="ns")
+        for chave, titulo, largura, minimo, alinhamento in colunas:
+            self.tree.heading(chave, text=titulo)
+            self.tree.column(chave, width=largura, minwidth=minimo, anchor=alinhamento)
+
+        self._posicoes = []
+        self._inicio = 0
+        self._itens = []
+
+        self.tree.bind("<Configure>", lambda evento: self._ajustar_itens())
+        self.tree.bind("<MouseWheel>", self._roda)
+        self.tree.bind("<Button-4>", lambda evento: self.rolar_linhas(-3))
+        self.tree.bind("<Button-5>", lambda evento: self.rolar_linhas(3))
+        self.tree.bind("<Prior>", lambda evento: self.rolar_linhas(-self._visiveis()))
+        self.tree.bind("<Next>", lambda evento: self.rolar_linhas(self._visiveis()))
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    def __len__(self):
+        return len(self._posicoes)
+
+    def mostrar(self, posicoes, manter_posicao=False):
+        """
+        Define as posições exibidas (ex.: resultado de um filtro).
+
+        Args:
+            posicoes (list): Posições das linhas no DataFrame, na ordem de exibição.
+            manter_posicao (bool): Se False, volta ao topo da lista.
+        """
+        self._posicoes = list(posicoes)
+        self._ir_para(self._inicio if manter_posicao else 0)
+
+    def atualizar(self, posicoes):
+        """Redesenha as linhas alteradas que estiverem visíveis."""
+        janela = self._posicoes[self._inicio:self._inicio + len(self._itens)]
+        if any(posicao in janela for posicao in posicoes):
+            self._desenhar()
+
+    def redesenhar(self):
+        self._desenhar()
+
+    def rolar_linhas(self, quantidade):
+        self._ir_para(self._inicio + quantidade)
+
+    def _visiveis(self) -> int:
+        altura = self.tree.winfo_height()
+        if altura <= 1:
+            altura = int(self.tree.cget("height")) * self.altura_linha
+        # Desconta o cabeçalho
+        return max(1, altura // self.altura_linha - 1)
+
+    def _ajustar_itens(self):
+        quantidade = self._visiveis()
+        while len(self._itens) < quantidade:
+            self._itens.append(self.tree.insert("", "end", values=()))
+        while len(self._itens) > quantidade:
+            self.tree.delete(self._itens.pop())
+        self._ir_para(self._inicio)
+
+    def _ir_para(self, inicio):
+        maximo = max(0, len(self._posicoes) - len(self._itens))
+        inicio = max(0, min(int(inicio), maximo))
+        if inicio != self._inicio:
+            # Os itens são reaproveitados: a seleção não acompanharia a linha
+            self.tree.selection_remove(self.tree.selection())
+        self._inicio = inicio
+        self._desenhar()
+
+    def _desenhar(self):
+        if not self._itens:
+            self._ajustar_itens()
+            return
+        janela = self._posicoes[self._inicio:self._inicio + len(self._itens)]
+        for item, posicao in zip(self._itens, janela):
+            self.tree.item(item, values=self.linha(posicao), tags=())
+        for item in self._itens[len(janela):]:
+            self.tree.item(item, values=(), tags=())
+        total = len(self._posicoes)
+        if total:
+            self.scroll.set(self._inicio / total, min(1.0, (self._inicio + len(self._itens)) / total))
+        else:
+            self.scroll.set(0.0, 1.0)
+
+    def _rolar(self, acao, *args):
+        if acao == "moveto":
+            self._ir_para(float(args[0]) * len(self._posicoes))
+        elif acao == "scroll":
+            passo = int(args[0])
+            if args[1] == "pages":
+                passo *= len(self._itens)
+            self.rolar_linhas(passo)
+
+    def _roda(self, evento):
+        self.rolar_linhas(-3 if evento.delta > 0 else 3)
+        return "break"
+
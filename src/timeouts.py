@@ -0,0 +1,104 @@
+"""
+Timeouts por etapa aprendidos a partir das durações observadas.
+
+Para cada etapa é mantida uma janela com as durações mais recentes que
+terminaram com sucesso; o timeout da etapa passa a ser um múltiplo do p99
+dessa janela, limitado entre um piso e um teto. As janelas são gravadas em
+arquivo, de modo que a execução seguinte já começa calibrada.
+"""
+import json
+import logging
+import os
+import threading
+from collections import deque
+from pathlib import Path
+
+from src.metricas import percentil
+
+
+class TimeoutsAdaptativos:
+    """
+    Política de timeout por etapa baseada no p99 recente.
+
+    Args:
+        caminho (str or Path): Arquivo JSON onde as janelas são persistidas (None = só memória).
+        multiplicador (float): Timeout = multiplicador x p99 da etapa.
+        piso (float): Menor timeout permitido (segundos).
+        teto (float): Maior timeout permitido (segundos).
+        janela (int): Quantidade de durações recentes consideradas por etapa.
+        minimo_amostras (int): Abaixo disso, usa o timeout padrão da etapa.
+    """
+
+    def __init__(self, caminho=None, multiplicador=3.0, piso=5.0, teto=120.0, janela=200, minimo_amostras=20):
+        self.caminho = Path(caminho) if caminho else None
+        self.multiplicador = multiplicador
+        self.piso = piso
+        self.teto = max(piso, teto)
+        self.janela = janela
+        self.minimo_amostras = minimo_amostras
+        self._duracoes = {}
+        self._lock = threading.Lock()
+        self._carregar()
+
+    def _carregar(self):
+        if self.caminho is None or not self.caminho.exists():
+            return
+        try:
+            dados = json.loads(self.caminho.read_text(encoding='utf-8'))
+            # Tudo ou nada: um arquivo corrompido não deixa janelas pela metade
+            duracoes = {
+                etapa: deque((float(v) for v in valores), maxlen=self.janela)
+                for etapa, valores in dados.get('duracoes', {}).items()
+            }
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"Timeouts aprendidos ignorados ({self.caminho}): {e}")
+            return
+        self._duracoes = duracoes
+        logging.info(f"Timeouts aprendidos carregados de {self.caminho}")
+
+    def observar(self, etapa, duracao):
+        """Acrescenta a duração de uma etapa concluída com sucesso."""
+        with self._lock:
+            if etapa not in self._duracoes:
+                self._duracoes[etapa] = deque(maxlen=self.janela)
+            self._duracoes[etapa].append(duracao)
+
+    def timeout(self, etapa, padrao):
+        """
+        Timeout a usar na etapa.
+
+        Args:
+            etapa (str): Nome da etapa (ver RegistroEtapas).
+            padrao (float): Timeout usado enquanto não há amostras suficientes.
+
+        Returns:
+            float: Timeout em segundos.
+        """
+        with self._lock:
+            valores = list(self._duracoes.get(etapa, ()))
+        if len(valores) < self.minimo_amostras:
+            return padrao
+        return min(self.teto, max(self.piso, self.multiplicador * percentil(valores, 99)))
+
+    def resumo(self) -> dict:
+        """Timeout aprendido de cada etapa com amostras suficientes."""
+        with self._lock:
+            etapas = [etapa for etapa, valores in self._duracoes.items() if len(valores) >= self.minimo_amostras]
+        return {etapa: self.timeout(etapa, None) for etapa in etapas}
+
+    def salvar(self):
+        """Grava as janelas de durações para a próxima execução."""
+        if self.caminho is None:
+            return
+        with self._lock:
+            dados = {
+                'multiplicador': self.multiplicador,
+                'duracoes': {etapa: [round(v, 4) for v in valores] for etapa, valores in self._duracoes.items()},
+            }
+        temporario = self.caminho.with_name(f".~{self.caminho.name}")
+        try:
+            self.caminho.parent.mkdir(parents=True, exist_ok=True)
+            temporario.write_text(json.dumps(dados, ensure_ascii=False), encoding='utf-8')
+            os.replace(temporario, self.caminho)
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar os timeouts aprendidos: {e}")
@@ -10,10 +10,11 @@ try:
 except ImportError:
     winreg = None
 
-import pyautogui
 
 # Função de reconhecimento de imagem na tela
 def reconhecimento(imagens_referencia, tempo_limite, confidence=1.0):
+    # Importado só aqui: o pyautogui exige um display e o fluxo do e-CAC não o usa
+    import pyautogui
     tempo_inicio = time.time()
     while time.time() - tempo_inicio < tempo_limite:
         for imagem_referencia in imagens_referencia:
@@ -30,6 +31,7 @@ def reconhecimento(imagens_referencia, tempo_limite, confidence=1.0):
 
 # Função de clique em imagem na tela
 def clique(imagens_referencia, tempo_limite, confidence=1.0):
+    import pyautogui
     tempo_inicio = time.time()
     while time.time() - tempo_inicio < tempo_limite:
         for imagem_referencia in imagens_referencia:
@@ -48,6 +50,7 @@ def clique(imagens_referencia, tempo_limite, confidence=1.0):
 
 # Função de clique em ocorrência específica de imagem
 def clique2(imagens_referencia, tempo_limite, confidence=1.0, ocorrencia=1):
+    import pyautogui
     tempo_inicio = time.time()
     while time.time() - tempo_inicio < tempo_limite:
         for imagem_referencia in imagens_referencia:
@@ -116,7 +119,37 @@ def limpar_pasta(pasta):
         except Exception as e:
             print(f'Erro ao remover {item_path}: {e}')
 
-def renomear_arquivo_recente(codigo, competencia, pasta_competencia):
+def caminho_darf(codigo, competencia, pasta) -> Path:
+    """Caminho final do DARF de um cliente: '<pasta>/<codigo> DARFWEB <competencia>.pdf'."""
+    return Path(pasta) / f"{codigo} DARFWEB {competencia}.pdf"
+
+def renomear_arquivo(arquivo, codigo, competencia, pasta_destino=None):
+    """
+    Renomeia um arquivo baixado para o padrão '<codigo> DARFWEB <competencia>.pdf'.
+    
+    Args:
+        arquivo (str or Path): Caminho exato do arquivo baixado.
+        codigo (str): Código do cliente.
+        competencia (str): Competência (ex: '06 2025').
+        pasta_destino (str or Path): Pasta final do arquivo. Se None, mantém a pasta do download.
+        
+    Returns:
+        bool: True se o arquivo foi renomeado com sucesso, False caso contrário.
+    """
+    try:
+        arquivo = Path(arquivo)
+        pasta = Path(pasta_destino) if pasta_destino else arquivo.parent
+        novo_nome = caminho_darf(codigo, competencia, pasta)
+        if novo_nome.exists():
+            logging.warning(f"Arquivo {novo_nome} já existe. Substituindo...")
+        os.replace(arquivo, novo_nome)
+        logging.info(f"Arquivo renomeado para: {novo_nome}")
+        return True
+    except Exception as e:
+        logging.error(f"Erro ao renomear o arquivo {arquivo}: {e}")
+        return False
+
+def renomear_arquivo_recente(codigo, competencia, pasta_competencia, pasta_destino=None):
     """
     Renomeia o arquivo mais recente da pasta para o padrão '<codigo> DARFWEB <competencia>.pdf'.
     
@@ -124,6 +157,7 @@ def renomear_arquivo_recente(codigo, competencia, pasta_competencia):
         codigo (str): Código do cliente.
         competencia (str): Competência (ex: '06 2025').
         pasta_competencia (str or Path): Caminho da pasta onde está o arquivo.
+        pasta_destino (str or Path): Pasta final do arquivo. Se None, usa pasta_competencia.
         
     Returns:
         bool: True se o arquivo foi renomeado com sucesso, False caso contrário.
@@ -132,9 +166,10 @@ def renomear_arquivo_recente(codigo, competencia, pasta_competencia):
         pasta = Path(pasta_competencia)
         
         # Filtrar apenas arquivos (não diretórios) e excluir arquivos já renomeados
+        # ou isolados como downloads atrasados de outro CNPJ
         arquivos = [
             f for f in pasta.glob("*") 
-            if f.is_file() and "DARFWEB" not in f.name
+            if f.is_file() and "DARFWEB" not in f.name and "_orfao" not in f.name
         ]
         
         if not arquivos:
@@ -142,7 +177,7 @@ def renomear_arquivo_recente(codigo, competencia, pasta_competencia):
             return False
         
         arquivo_recente = max(arquivos, key=os.path.getctime)
-        novo_nome = pasta / f"{codigo} DARFWEB {competencia}.pdf"
+        novo_nome = caminho_darf(codigo, competencia, pasta_destino or pasta)
         
         # Verificar se o arquivo de destino já existe
         if novo_nome.exists():
@@ -0,0 +1,119 @@
+import json
+import time
+
+import pytest
+
+from src.downloads import DownloadsCDP, MonitorDownloads, arquivo_concluido
+
+
+@pytest.fixture(params=[True, False], ids=['inotify', 'polling'])
+def monitor(request, tmp_path):
+    monitor = MonitorDownloads(tmp_path, usar_inotify=request.param)
+    yield monitor
+    monitor.fechar()
+
+
+def test_arquivo_orfao_nao_e_download_concluido():
+    assert arquivo_concluido('guia.pdf')
+    assert not arquivo_concluido('guia.pdf.crdownload')
+    assert not arquivo_concluido('guia_orfao.pdf')
+    assert not arquivo_concluido('123 DARFWEB 06 2025.pdf')
+
+
+def test_download_atrasado_e_isolado(monitor, tmp_path):
+    (tmp_path / 'antigo.pdf').write_bytes(b'x')
+    monitor.preparar()
+    with pytest.raises(TimeoutError):
+        monitor.aguardar(0.1)
+
+    # Ainda em andamento: o próximo CNPJ não pode começar
+    (tmp_path / 'guia.pdf.crdownload').write_bytes(b'x')
+    assert not monitor.descartar_atrasados()
+
+    (tmp_path / 'guia.pdf.crdownload').rename(tmp_path / 'guia.pdf')
+    assert monitor.descartar_atrasados()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['antigo.pdf', 'guia_orfao.pdf']
+
+    # O arquivo isolado não é entregue ao download seguinte
+    monitor.preparar()
+    assert monitor.verificar() is None
+
+
+def test_atraso_libera_apos_o_prazo(monitor, tmp_path):
+    monitor.preparar()
+    monitor.registrar_atraso(0.2)
+    assert not monitor.descartar_atrasados()
+    inicio = time.monotonic()
+    monitor.aguardar_atrasados()
+    assert time.monotonic() - inicio < 1
+    assert monitor.descartar_atrasados()
+
+
+def test_atraso_cancelado_pelo_proprio_cnpj(monitor, tmp_path):
+    monitor.preparar()
+    with pytest.raises(TimeoutError):
+        monitor.aguardar(0.1)
+    (tmp_path / 'guia.pdf').write_bytes(b'x')
+    assert monitor.verificar() == tmp_path / 'guia.pdf'
+    monitor.cancelar_atraso()
+    assert monitor.descartar_atrasados()
+    assert (tmp_path / 'guia.pdf').exists()
+
+
+def test_sem_atraso_nao_bloqueia(monitor):
+    monitor.preparar()
+    assert monitor.descartar_atrasados()
+
+
+class _DriverEventos:
+    """Driver falso que entrega eventos de download do DevTools."""
+
+    def __init__(self):
+        self.eventos = []
+
+    def iniciar(self, guid):
+        self.eventos.append({'message': json.dumps({'message': {
+            'method': 'Browser.downloadWillBegin', 'params': {'guid': guid, 'suggestedFilename': 'darf.pdf'},
+        }})})
+
+    def get_log(self, tipo):
+        eventos, self.eventos = self.eventos, []
+        return eventos
+
+
+def test_cdp_isola_arquivo_de_guid_anterior(tmp_path):
+    driver = _DriverEventos()
+    downloads = DownloadsCDP(driver, tmp_path)
+    try:
+        downloads.preparar()
+        driver.iniciar('guid-a')
+        with pytest.raises(TimeoutError):
+            downloads.aguardar(0.1)
+        # Com o GUID conhecido, a próxima aba não espera o download atrasado
+        assert downloads.descartar_atrasados()
+
+        downloads.preparar()
+        driver.iniciar('guid-b')
+        (tmp_path / 'guid-a').write_bytes(b'x')
+        assert downloads.verificar() is None
+        assert (tmp_path / 'guid-a_orfao').exists()
+
+        (tmp_path / 'guid-b').write_bytes(b'x')
+        assert downloads.verificar() == tmp_path / 'guid-b'
+    finally:
+        downloads.fechar()
+
+
+def test_cdp_isola_guid_abandonado_ja_na_pasta(tmp_path):
+    driver = _DriverEventos()
+    downloads = DownloadsCDP(driver, tmp_path)
+    try:
+        downloads.preparar()
+        driver.iniciar('guid-a')
+        downloads.verificar()
+        downloads.registrar_atraso(60)
+        (tmp_path / 'guid-a').write_bytes(b'x')
+        assert downloads.descartar_atrasados()
+        assert [p.name for p in tmp_path.iterdir()] == ['guid-a_orfao']
+    finally:
+        downloads.fechar()
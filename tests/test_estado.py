@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.estado import EstadoExecucao
+from src.planilha import STATUS_CNPJ_INVALIDO, IndiceStatus
+
+COMPETENCIA = '06 2025'
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def _indice(cnpjs, status):
+    df = pd.DataFrame({
+        'COD': [str(n) for n in range(1, len(cnpjs) + 1)],
+        'CNPJ': cnpjs,
+        'STATUS': status,
+    })
+    return IndiceStatus(df)
+
+
+def _ordens(caminho):
+    with sqlite3.connect(str(caminho)) as conexao:
+        return dict(conexao.execute("SELECT cnpj, ordem FROM cnpjs WHERE competencia = ?", (COMPETENCIA,)))
+
+
+@pytest.fixture
+def caminho(tmp_path):
+    return tmp_path / 'estado.sqlite3'
+
+
+def test_sincronizar_inclui_novos_e_projeta_existentes(caminho):
+    with EstadoExecucao(caminho, COMPETENCIA) as estado:
+        indice = _indice(['12345678000195', '11222333000181'], ['', 'Erro no download'])
+        assert estado.sincronizar(indice) == 0
+        estado.atualizar('12345678000195', 'Guia baixada', arquivo='1 DARFWEB 06 2025.pdf')
+
+        # Planilha reordenada, com um CNPJ novo e um status antigo
+        indice = _indice(
+            ['01234567000195', '11222333000181', '12.345.678/0001-95'],
+            ['', 'Erro no download', ''],
+        )
+        assert estado.sincronizar(indice) == 1
+        assert indice.df['STATUS'].tolist() == ['', 'Erro no download', 'Guia baixada']
+        assert estado.status('12345678000195') == 'Guia baixada'
+
+    # A ordem dos CNPJs já conhecidos não muda
+    ordens = _ordens(caminho)
+    assert ordens['12345678000195'] == 0
+    assert ordens['11222333000181'] == 1
+    assert '01234567000195' in ordens
+
+
+def test_sincronizar_marca_invalido_como_concluido(caminho):
+    with EstadoExecucao(caminho, COMPETENCIA) as estado:
+        estado.sincronizar(_indice(['12345678000194'], ['']))
+        assert estado.pendentes() == {'12345678000194'}
+        indice = _indice(['12345678000194'], [STATUS_CNPJ_INVALIDO])
+        estado.sincronizar(indice)
+        assert estado.pendentes() == set()
+        assert estado.status('12345678000194') == STATUS_CNPJ_INVALIDO
+
+
+def test_pendentes(caminho):
+    with EstadoExecucao(caminho, COMPETENCIA) as estado:
+        estado.sincronizar(_indice(
+            ['12345678000195', '11222333000181', '01234567000195'],
+            ['Guia baixada', '', ''],
+        ))
+        assert estado.pendentes() == {'11222333000181', '01234567000195'}
+        estado.atualizar('11222333000181', 'Erro no download')
+        estado.atualizar('01234567000195', 'Guia baixada')
+        assert estado.pendentes() == {'11222333000181'}
+
+    with EstadoExecucao(caminho, '07 2025') as outra:
+        assert outra.pendentes() == set()
+
+
+def test_registrar_tentativa_e_historico(caminho):
+    with EstadoExecucao(caminho, COMPETENCIA) as estado:
+        estado.sincronizar(_indice(['12345678000195'], ['']))
+        estado.registrar_tentativa('12345678000195', 1, 'Erro no download', 30.123456, erro='TimeoutError')
+        estado.registrar_tentativa('12.345.678/0001-95', 2, 'Guia baixada', 4.5, arquivo='1 DARFWEB 06 2025.pdf')
+
+        historico = estado.historico('12345678000195')
+        assert [(h['tentativa'], h['resultado'], h['erro'], h['arquivo']) for h in historico] == [
+            (1, 'Erro no download', 'TimeoutError', None),
+            (2, 'Guia baixada', None, '1 DARFWEB 06 2025.pdf'),
+        ]
+        assert historico[0]['duracao'] == 30.1235
+        assert historico[0]['inicio'] <= historico[1]['inicio']
+        assert estado.historico('11222333000181') == []
+
+    with sqlite3.connect(str(caminho)) as conexao:
+        assert conexao.execute("SELECT tentativas FROM cnpjs").fetchone() == (2,)
+
+
+_QUEDA = """
+import os, sys
+from src.estado import EstadoExecucao
+estado = EstadoExecucao(sys.argv[1], '06 2025')
+estado.atualizar('12345678000195', 'Guia baixada', arquivo='1 DARFWEB 06 2025.pdf')
+estado.registrar_tentativa('12345678000195', 1, 'Guia baixada', 2.0)
+os._exit(1)  # queda sem fechar o banco nem fazer checkpoint do WAL
+"""
+
+
+def test_reabrir_apos_queda_em_wal(caminho):
+    ambiente = dict(os.environ, PYTHONPATH=str(RAIZ))
+    resultado = subprocess.run([sys.executable, '-c', _QUEDA, str(caminho)], env=ambiente)
+    assert resultado.returncode == 1
+    assert caminho.with_name(caminho.name + '-wal').exists()
+
+    with EstadoExecucao(caminho, COMPETENCIA) as estado:
+        assert estado.status('12345678000195') == 'Guia baixada'
+        assert [h['resultado'] for h in estado.historico('12345678000195')] == ['Guia baixada']
+        with estado._lock:
+            modo = estado._conexao.execute("PRAGMA journal_mode").fetchone()[0]
+        assert modo == 'wal'
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from src.metricas import ETAPA_CNPJ, RegistroEtapas, percentil
+
+
+@pytest.mark.parametrize('valores, p, esperado', [
+    ([], 95, 0.0),
+    ([7.0], 99, 7.0),
+    ([1, 2, 3, 4], 0, 1),
+    ([1, 2, 3, 4], 100, 4),
+    ([1, 2, 3, 4], 50, 2.5),
+    ([4, 1, 3, 2], 50, 2.5),
+    (list(range(1, 101)), 95, 95.05),
+    (list(range(1, 101)), 99, 99.01),
+])
+def test_percentil(valores, p, esperado):
+    assert percentil(valores, p) == pytest.approx(esperado)
+
+
+def test_resumo_por_etapa():
+    metricas = RegistroEtapas()
+    for duracao in (1.0, 2.0, 3.0, 4.0):
+        metricas.registrar('download', '12345678000195', 1, 'ok', duracao)
+    metricas.registrar(ETAPA_CNPJ, '12345678000195', 1, 'Guia baixada', 10.0)
+    metricas.registrar(ETAPA_CNPJ, '11222333000181', 2, 'Guia baixada', 20.0)
+
+    resumo = metricas.resumo()
+    assert resumo['download'] == {'quantidade': 4, 'media': 2.5, 'p95': pytest.approx(3.85), 'max': 4.0}
+    assert resumo[ETAPA_CNPJ]['quantidade'] == 2
+    assert metricas.media_por_cnpj() == 15.0
+    assert 'download' in metricas.texto_resumo()
+
+
+def test_etapa_registra_resultado_da_excecao():
+    metricas = RegistroEtapas()
+    with pytest.raises(TimeoutError):
+        with metricas.etapa('download', '12345678000195', 1):
+            raise TimeoutError
+    with metricas.etapa('resultado', '12345678000195', 1) as intervalo:
+        intervalo.resultado = 'sem declaracao'
+    assert metricas.resumo()['download']['quantidade'] == 1
+    assert metricas.resumo()['resultado']['quantidade'] == 1
+
+
+def test_fechar_grava_etapas_e_resumo(tmp_path):
+    metricas = RegistroEtapas(tmp_path)
+    cronometro = metricas.cronometro('12345678000195', 1)
+    with cronometro('pesquisa'):
+        pass
+    metricas.registrar('download', '12345678000195', 1, 'TimeoutError', 60.0)
+    texto = metricas.fechar()
+
+    registros = [json.loads(linha) for linha in metricas.caminho.read_text(encoding='utf-8').splitlines()]
+    assert [(r['etapa'], r['resultado']) for r in registros] == [('pesquisa', 'ok'), ('download', 'TimeoutError')]
+    resumo = json.loads(metricas.caminho.with_suffix('.resumo.json').read_text(encoding='utf-8'))
+    assert set(resumo) == {'pesquisa', 'download'}
+    assert resumo['download']['max'] == 60.0
+    assert 'pesquisa' in texto
+
+
+def test_fechar_sem_registros_nao_grava_resumo(tmp_path):
+    metricas = RegistroEtapas(tmp_path)
+    metricas.fechar()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_timeouts_recebem_apenas_etapas_com_sucesso():
+    class Politica:
+        def __init__(self):
+            self.observadas = []
+
+        def observar(self, etapa, duracao):
+            self.observadas.append(etapa)
+
+        def salvar(self):
+            pass
+
+        def resumo(self):
+            return {}
+
+    politica = Politica()
+    metricas = RegistroEtapas(timeouts=politica)
+    with metricas.etapa('pesquisa'):
+        pass
+    with pytest.raises(ValueError):
+        with metricas.etapa('download'):
+            raise ValueError
+    metricas.fechar()
+    assert politica.observadas == ['pesquisa']
+
+
+class _TimeoutsFalso:
+    def __init__(self):
+        self.observados = []
+
+    def observar(self, etapa, duracao):
+        self.observados.append(etapa)
+
+
+def test_timeouts_aprendem_somente_etapas_ok():
+    timeouts = _TimeoutsFalso()
+    metricas = RegistroEtapas(timeouts=timeouts)
+    with metricas.etapa('resultado', '12345678000195', 1):
+        pass
+    with metricas.etapa('resultado', '11222333000181', 1) as intervalo:
+        intervalo.resultado = 'sem declaracao'
+    with pytest.raises(TimeoutError):
+        with metricas.etapa('download', '12345678000195', 1):
+            raise TimeoutError
+    assert timeouts.observados == ['resultado']
+    assert metricas.resumo()['resultado']['quantidade'] == 2
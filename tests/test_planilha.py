@@ -0,0 +1,329 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.planilha as planilha_mod
+from src.planilha import (
+    FATOR_SALVAMENTO_EXCEL,
+    LINHA_PLANILHA,
+    STATUS_CNPJ_INVALIDO,
+    DiarioStatus,
+    GravadorPlanilha,
+    IndiceStatus,
+    aplicar_diario,
+    caminho_cache,
+    caminho_diario,
+    carregar_planilha,
+    cnpjs_validos,
+    ler_cache,
+    marcar_cnpjs_invalidos,
+    normalizar_cnpj,
+    normalizar_cnpjs,
+    salvar_planilha,
+)
+
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('12ABC34501DE35', '12ABC34501DE35'),
+    ('12.ABC.345/01DE-35', '12ABC34501DE35'),
+    ('12.345.678/0001-95', '12345678000195'),
+    (' 12345678000195 ', '12345678000195'),
+    (12345678000195, '12345678000195'),
+    (1.2345678000195e13, '12345678000195'),
+    ('12345678000195.0', '12345678000195'),
+    (1234567000195, '01234567000195'),
+    ('1234567000195', '01234567000195'),
+    (None, ''),
+    (float('nan'), ''),
+    ('', ''),
+])
+def test_normalizar_cnpj(valor, esperado):
+    assert normalizar_cnpj(valor) == esperado
+
+
+def test_normalizacao_escalar_e_vetorizada_iguais():
+    valores = [
+        '12ABC34501DE35', '12.345.678/0001-95', 1.2345678000195e13, 1234567000195,
+        '1234567000195', None, float('nan'), '', '  ', 'abc', '---',
+    ]
+    vetorizado = normalizar_cnpjs(pd.Series(valores, dtype=object)).tolist()
+    assert vetorizado == [normalizar_cnpj(valor) for valor in valores]
+
+
+def test_cnpjs_validos():
+    cnpjs = pd.Series([
+        '12ABC34501DE35',   # alfanumérico válido
+        '12ABC34501DE36',   # dígito verificador errado
+        '12345678000195',   # numérico válido
+        '12345678000194',   # numérico inválido
+        '01234567000195',   # zero à esquerda restaurado
+        '11111111111111',   # repetido (dígitos conferem, mas é rejeitado)
+        '1234567800019',    # curto
+        '',
+    ])
+    esperado = [True, False, True, False, True, False, False, False]
+    assert cnpjs_validos(cnpjs).tolist() == esperado
+
+
+def test_marcar_cnpjs_invalidos():
+    df = pd.DataFrame({
+        'CNPJ': ['12345678000195', '12345678000194', '', '12ABC34501DE35'],
+        'STATUS': ['Guia baixada', '', '', STATUS_CNPJ_INVALIDO],
+    })
+    assert marcar_cnpjs_invalidos(df) == 2
+    # A linha corrigida volta a ficar pendente; as demais mantêm o status
+    assert df['STATUS'].tolist() == ['Guia baixada', STATUS_CNPJ_INVALIDO, STATUS_CNPJ_INVALIDO, '']
+
+
+def test_marcar_cnpjs_invalidos_sem_invalidos():
+    df = pd.DataFrame({'CNPJ': ['12345678000195'], 'STATUS': ['']})
+    assert marcar_cnpjs_invalidos(df) == 0
+    assert isinstance(cnpjs_validos(df['CNPJ']), np.ndarray)
+
+
+def _df_status(cnpjs, status=None):
+    return pd.DataFrame({
+        'COD': [str(n) for n in range(1, len(cnpjs) + 1)],
+        'CNPJ': cnpjs,
+        'STATUS': status or [''] * len(cnpjs),
+    })
+
+
+def test_diario_reaplicado_apos_queda_com_linha_truncada(tmp_path):
+    planilha = tmp_path / 'clientes.xlsx'
+    diario = DiarioStatus(caminho_diario(planilha))
+    diario.registrar('12345678000195', 'Erro no download')
+    diario.registrar('12345678000195', 'Guia baixada')
+    diario.fechar()
+    # Queda no meio da gravação do terceiro registro
+    with open(caminho_diario(planilha), 'a', encoding='utf-8') as f:
+        f.write('{"cnpj": "11222333000181", "sta')
+
+    df = _df_status(['12345678000195', '11222333000181'])
+    indice = IndiceStatus(df)
+    assert aplicar_diario(indice, planilha) == 2
+    assert df['STATUS'].tolist() == ['Guia baixada', '']
+
+    # A execução retomada continua o diário sem perder o novo registro
+    diario = DiarioStatus(caminho_diario(planilha))
+    diario.registrar('11222333000181', 'Guia baixada')
+    diario.fechar()
+    assert diario.ler() == [
+        ('12345678000195', 'Erro no download'),
+        ('12345678000195', 'Guia baixada'),
+        ('11222333000181', 'Guia baixada'),
+    ]
+
+
+def test_indice_atualiza_todas_as_linhas_do_cnpj_duplicado():
+    df = _df_status(['12345678000195', '11222333000181', '12.345.678/0001-95'])
+    df.index = [2, 3, 5]
+    indice = IndiceStatus(df)
+    assert indice.duplicados() == {'12345678000195'}
+    assert indice.posicoes('12345678000195') == [0, 2]
+
+    assert indice.set('12345678000195', 'Guia baixada')
+    assert df['STATUS'].tolist() == ['Guia baixada', '', 'Guia baixada']
+    assert indice.get('12.345.678/0001-95') == 'Guia baixada'
+    assert not indice.set('99999999000191', 'Guia baixada')
+
+
+def _criar_xlsx(caminho):
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    livro = Workbook()
+    aba = livro.active
+    aba.append(['COD', 'CNPJ', 'RAZAO SOCIAL', 'OBSERVACAO', 'STATUS'])
+    aba.append(['1', '01234567000195', 'Empresa A', 'manter', None])
+    aba.append(['2', '12345678000195', 'Empresa B', 42, 'Erro no download'])
+    aba.append(['3', '12ABC34501DE35', 'Empresa C', None, None])
+    for linha in range(2, 5):
+        aba.cell(row=linha, column=2).number_format = '@'
+    aba['A1'].font = Font(bold=True)
+    livro.save(caminho)
+
+
+def test_salvar_planilha_xlsx_preserva_colunas_e_formato(tmp_path):
+    from openpyxl import load_workbook
+
+    planilha = tmp_path / 'clientes.xlsx'
+    _criar_xlsx(planilha)
+    df = carregar_planilha(planilha, usar_cache=False)
+    indice = IndiceStatus(df)
+    indice.set('12345678000195', 'Guia baixada')
+    indice.set('01234567000195', 'Nenhuma declaração encontrada')
+
+    salvar_planilha(df, planilha)
+
+    livro = load_workbook(planilha)
+    aba = livro.active
+    valores = [[celula.value for celula in linha] for linha in aba.iter_rows()]
+    assert valores == [
+        ['COD', 'CNPJ', 'RAZAO SOCIAL', 'OBSERVACAO', 'STATUS'],
+        ['1', '01234567000195', 'Empresa A', 'manter', 'Nenhuma declaração encontrada'],
+        ['2', '12345678000195', 'Empresa B', 42, 'Guia baixada'],
+        ['3', '12ABC34501DE35', 'Empresa C', None, None],
+    ]
+    assert all(aba.cell(row=linha, column=2).number_format == '@' for linha in range(2, 5))
+    assert aba['A1'].font.bold
+    livro.close()
+    assert not caminho_diario(planilha).exists()
+
+
+def test_cache_em_json_reproduz_a_leitura(tmp_path):
+    planilha = tmp_path / 'clientes.xlsx'
+    _criar_xlsx(planilha)
+    lido = carregar_planilha(planilha)
+    cache = caminho_cache(planilha)
+    assert cache.name == 'clientes.cache.json'
+    json.loads(cache.read_text(encoding='utf-8'))
+
+    do_cache = ler_cache(planilha)
+    pd.testing.assert_frame_equal(do_cache, lido)
+    assert do_cache.index.name == LINHA_PLANILHA
+
+
+def test_cache_invalidado_pelo_tamanho(tmp_path):
+    planilha = tmp_path / 'clientes.xlsx'
+    _criar_xlsx(planilha)
+    carregar_planilha(planilha)
+    with open(planilha, 'ab') as f:
+        f.write(b'\0')
+    assert ler_cache(planilha) is None
+
+
+def test_cache_data_alterada_decide_pelo_hash(tmp_path):
+    planilha = tmp_path / 'clientes.xlsx'
+    _criar_xlsx(planilha)
+    carregar_planilha(planilha)
+    info = os.stat(planilha)
+
+    # Mesmo conteúdo com outra data (ex.: cópia): o cache continua valendo
+    os.utime(planilha, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+    assert ler_cache(planilha) is not None
+
+    # Mesmo tamanho, outro conteúdo e outra data: o hash invalida
+    conteudo = bytearray(planilha.read_bytes())
+    conteudo[-1] ^= 0xFF
+    planilha.write_bytes(bytes(conteudo))
+    os.utime(planilha, ns=(info.st_atime_ns, info.st_mtime_ns + 2 * 10**9))
+    assert ler_cache(planilha) is None
+
+
+def test_cache_invalidado_pela_versao(tmp_path, monkeypatch):
+    planilha = tmp_path / 'clientes.xlsx'
+    _criar_xlsx(planilha)
+    carregar_planilha(planilha)
+    assert ler_cache(planilha) is not None
+    monkeypatch.setattr(planilha_mod, 'VERSAO_CACHE', planilha_mod.VERSAO_CACHE + 1)
+    assert ler_cache(planilha) is None
+
+
+def test_cache_corrompido_e_ignorado(tmp_path):
+    planilha = tmp_path / 'clientes.xlsx'
+    _criar_xlsx(planilha)
+    lido = carregar_planilha(planilha)
+    caminho_cache(planilha).write_text('{"assinatura": ', encoding='utf-8')
+    assert ler_cache(planilha) is None
+    pd.testing.assert_frame_equal(carregar_planilha(planilha), lido)
+
+
+def test_gravador_xlsx_regrava_com_intervalo_maior(tmp_path):
+    planilha = tmp_path / 'clientes.xlsx'
+    _criar_xlsx(planilha)
+    df = carregar_planilha(planilha)
+    original = planilha.read_bytes()
+    gravador = GravadorPlanilha(df, planilha, salvar_a_cada=1, intervalo_salvamento=60)
+    assert gravador.salvar_a_cada == FATOR_SALVAMENTO_EXCEL
+
+    gravador.atualizar('12345678000195', 'Guia baixada')
+    gravador.salvar_se_necessario()
+    assert planilha.read_bytes() == original
+    assert DiarioStatus(caminho_diario(planilha)).ler() == [('12345678000195', 'Guia baixada')]
+
+    for _ in range(FATOR_SALVAMENTO_EXCEL - 1):
+        gravador.atualizar('01234567000195', 'Erro no download')
+    gravador.salvar_se_necessario()
+    assert not caminho_diario(planilha).exists()
+    assert carregar_planilha(planilha)['STATUS'].tolist() == ['Erro no download', 'Guia baixada', '']
+
+    gravador.atualizar('01234567000195', 'Guia baixada')
+    assert gravador.fechar()
+    assert carregar_planilha(planilha)['STATUS'].tolist() == ['Guia baixada', 'Guia baixada', '']
+
+
+CSV_CLIENTES = [
+    ['COD', 'CNPJ', 'RAZAO SOCIAL', 'OBSERVACAO', 'STATUS'],
+    ['001', '01234567000195', 'Construção Ltda', 'manter', ''],
+    ['002', '12.345.678/0001-95', 'Açaí & Cia', '', 'Erro no download'],
+    ['003', '12ABC34501DE35', 'Empresa C', '', ''],
+]
+
+
+def _gravar_csv(caminho, linhas, separador=';', codificacao='utf-8', quebra='\n'):
+    texto = quebra.join(separador.join(linha) for linha in linhas) + quebra
+    caminho.write_bytes(texto.encode(codificacao))
+
+
+@pytest.mark.parametrize('separador', [';', ','])
+def test_csv_separador_detectado(tmp_path, separador):
+    planilha = tmp_path / 'clientes.csv'
+    _gravar_csv(planilha, CSV_CLIENTES, separador=separador)
+    df = carregar_planilha(planilha)
+    assert df.columns.tolist() == ['COD', 'CNPJ', 'RAZAO SOCIAL', 'STATUS']
+    assert df['COD'].tolist() == ['001', '002', '003']
+    assert df['CNPJ'].tolist() == ['01234567000195', '12345678000195', '12ABC34501DE35']
+
+
+@pytest.mark.parametrize('codificacao', ['latin-1', 'utf-8-sig', 'utf-8'])
+def test_csv_codificacao_detectada_e_mantida(tmp_path, codificacao):
+    planilha = tmp_path / 'clientes.csv'
+    _gravar_csv(planilha, CSV_CLIENTES, codificacao=codificacao, quebra='\r\n')
+    df = carregar_planilha(planilha)
+    assert df['RAZAO SOCIAL'].tolist()[:2] == ['Construção Ltda', 'Açaí & Cia']
+
+    IndiceStatus(df).set('12345678000195', 'Guia baixada')
+    salvar_planilha(df, planilha)
+
+    conteudo = planilha.read_bytes()
+    assert conteudo.startswith(b'\xef\xbb\xbf') == (codificacao == 'utf-8-sig')
+    esperado = [linha[:] for linha in CSV_CLIENTES]
+    esperado[2][4] = 'Guia baixada'
+    assert conteudo.decode(codificacao).split('\r\n')[:-1] == [';'.join(linha) for linha in esperado]
+
+
+def test_csv_linhas_vazias_mantem_as_posicoes(tmp_path):
+    planilha = tmp_path / 'clientes.csv'
+    linhas = CSV_CLIENTES[:2] + [['', '', '', '', '']] + CSV_CLIENTES[2:]
+    _gravar_csv(planilha, linhas)
+    df = carregar_planilha(planilha)
+    assert df.index.tolist() == [0, 2, 3]
+
+    indice = IndiceStatus(df)
+    indice.set('12ABC34501DE35', 'Guia baixada')
+    salvar_planilha(df, planilha)
+
+    gravado = pd.read_csv(planilha, sep=';', dtype=str, keep_default_na=False)
+    assert gravado['STATUS'].tolist() == ['', '', 'Erro no download', 'Guia baixada']
+    assert gravado['COD'].tolist() == ['001', '', '002', '003']
+
+
+def test_parquet_ida_e_volta(tmp_path):
+    pytest.importorskip('pyarrow')
+    planilha = tmp_path / 'clientes.parquet'
+    original = pd.DataFrame(CSV_CLIENTES[1:], columns=CSV_CLIENTES[0])
+    original.to_parquet(planilha, index=False)
+
+    df = carregar_planilha(planilha)
+    assert df['CNPJ'].tolist() == ['01234567000195', '12345678000195', '12ABC34501DE35']
+    IndiceStatus(df).set('01234567000195', 'Guia baixada')
+    salvar_planilha(df, planilha)
+
+    gravado = pd.read_parquet(planilha)
+    assert gravado.columns.tolist() == CSV_CLIENTES[0]
+    assert gravado['STATUS'].tolist() == ['Guia baixada', 'Erro no download', '']
+    assert gravado['OBSERVACAO'].tolist() == ['manter', '', '']
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from src.resiliencia import Disjuntor, PortalIndisponivelError, aguardar, espera_exponencial
+
+
+class RelogioFalso:
+    """Relógio com monotonic/sleep que só avança quando alguém dorme."""
+
+    def __init__(self):
+        self.agora = 0.0
+        self.esperas = []
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
+
+
+class SorteioFixo:
+    def __init__(self, fracao):
+        self.fracao = fracao
+
+    def uniform(self, minimo, maximo):
+        return minimo + (maximo - minimo) * self.fracao
+
+
+@pytest.mark.parametrize('tentativa, minimo, maximo', [
+    (1, 2.5, 5), (2, 5, 10), (3, 10, 20), (5, 40, 80), (6, 60, 120), (20, 60, 120),
+])
+def test_espera_exponencial_limites(tentativa, minimo, maximo):
+    assert espera_exponencial(tentativa, base=5, teto=120, sorteio=SorteioFixo(0)) == minimo
+    assert espera_exponencial(tentativa, base=5, teto=120, sorteio=SorteioFixo(1)) == maximo
+    sorteio = random.Random(tentativa)
+    for _ in range(100):
+        assert minimo <= espera_exponencial(tentativa, base=5, teto=120, sorteio=sorteio) <= maximo
+
+
+def test_aguardar_interrompido():
+    relogio = RelogioFalso()
+    assert aguardar(10, relogio=relogio)
+    assert relogio.agora == pytest.approx(10)
+    assert not aguardar(10, should_stop=lambda: True, relogio=relogio)
+
+
+def test_disjuntor_nao_abre_com_um_cnpj_repetido():
+    disjuntor = Disjuntor(limite_falhas=4)
+    for _ in range(3):
+        assert not disjuntor.falha('A')
+    assert not disjuntor.falha('B')
+    assert not disjuntor.falha('B')
+    assert not disjuntor.aberto
+    assert not disjuntor.falha('C')
+    assert disjuntor.falha('D')
+    assert disjuntor.aberto
+    assert disjuntor.cnpjs_afetados() == ['A', 'B', 'C', 'D']
+
+
+def test_disjuntor_sucesso_zera_a_sequencia():
+    disjuntor = Disjuntor(limite_falhas=2)
+    assert not disjuntor.falha('A')
+    disjuntor.sucesso()
+    assert not disjuntor.falha('B')
+    assert disjuntor.falha('C')
+
+
+def test_disjuntor_aberto_meio_aberto_fechado():
+    relogio = RelogioFalso()
+    disjuntor = Disjuntor(2, intervalo_sonda=30, pausa_maxima=1800, relogio=relogio, sorteio=SorteioFixo(1))
+    disjuntor.falha('A')
+    assert disjuntor.falha('B')
+    # Aberto: novas falhas não contam como tentativa
+    assert disjuntor.falha('C')
+
+    respostas = iter([False, False, True])
+    sondagens = []
+
+    def sonda():
+        # Meio-aberto: o portal é testado, mas o lote continua parado
+        sondagens.append(relogio.agora)
+        assert disjuntor.aberto
+        return next(respostas)
+
+    assert disjuntor.aguardar_portal(sonda)
+    assert sondagens == [30, 90, 210]
+    assert not disjuntor.aberto
+    assert disjuntor.cnpjs_afetados() == []
+    assert disjuntor.aberturas == 1
+    # Fechado: a contagem recomeça do zero
+    assert not disjuntor.falha('D')
+
+
+def test_disjuntor_desiste_apos_pausa_maxima():
+    relogio = RelogioFalso()
+    disjuntor = Disjuntor(2, intervalo_sonda=30, pausa_maxima=300, relogio=relogio, sorteio=SorteioFixo(1))
+    disjuntor.falha('A')
+    disjuntor.falha('B')
+    with pytest.raises(PortalIndisponivelError):
+        disjuntor.aguardar_portal(lambda: False)
+    assert relogio.agora <= 300
+    assert disjuntor.aberto
+
+
+def test_disjuntor_interrompido_durante_a_pausa():
+    relogio = RelogioFalso()
+    disjuntor = Disjuntor(2, relogio=relogio)
+    disjuntor.falha('A')
+    disjuntor.falha('B')
+    assert not disjuntor.aguardar_portal(lambda: True, should_stop=lambda: True)
+    assert disjuntor.aberto
+
+
+def test_disjuntor_fechado_nao_sonda():
+    disjuntor = Disjuntor(2, relogio=RelogioFalso())
+    assert disjuntor.aguardar_portal(lambda: pytest.fail('sonda com o disjuntor fechado'))
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from src.timeouts import TimeoutsAdaptativos
+
+
+def _observar(timeouts, etapa, duracoes):
+    for duracao in duracoes:
+        timeouts.observar(etapa, duracao)
+
+
+def test_usa_o_padrao_ate_o_minimo_de_amostras():
+    timeouts = TimeoutsAdaptativos(multiplicador=3.0, piso=5.0, teto=120.0)
+    _observar(timeouts, 'pesquisa', [4.0] * 19)
+    assert timeouts.timeout('pesquisa', 30) == 30
+    assert timeouts.resumo() == {}
+    timeouts.observar('pesquisa', 4.0)
+    assert timeouts.timeout('pesquisa', 30) == pytest.approx(12.0)
+    assert timeouts.timeout('download', 60) == 60
+
+
+@pytest.mark.parametrize('duracao, esperado', [
+    (0.5, 5.0),     # 3 x 0,5 = 1,5: vale o piso
+    (10.0, 30.0),   # 3 x p99
+    (50.0, 120.0),  # 3 x 50 = 150: vale o teto
+])
+def test_multiplicador_do_p99_limitado(duracao, esperado):
+    timeouts = TimeoutsAdaptativos(multiplicador=3.0, piso=5.0, teto=120.0)
+    _observar(timeouts, 'download', [duracao] * 20)
+    assert timeouts.timeout('download', 60) == pytest.approx(esperado)
+
+
+def test_p99_acompanha_a_cauda_da_janela():
+    timeouts = TimeoutsAdaptativos(multiplicador=2.0, piso=1.0, teto=1000.0, janela=100)
+    _observar(timeouts, 'download', [1.0] * 99 + [40.0])
+    assert timeouts.timeout('download', 60) > 2.0
+    # A janela descarta as durações antigas
+    _observar(timeouts, 'download', [1.0] * 100)
+    assert timeouts.timeout('download', 60) == pytest.approx(2.0)
+
+
+def test_persistencia(tmp_path):
+    caminho = tmp_path / 'timeouts.json'
+    timeouts = TimeoutsAdaptativos(caminho)
+    _observar(timeouts, 'pesquisa', [2.0] * 25)
+    _observar(timeouts, 'download', [1.0] * 3)
+    timeouts.salvar()
+    assert not list(tmp_path.glob('.~*'))
+
+    reaberto = TimeoutsAdaptativos(caminho)
+    assert reaberto.resumo() == timeouts.resumo() == {'pesquisa': pytest.approx(6.0)}
+    assert reaberto.timeout('download', 60) == 60
+    assert json.loads(caminho.read_text(encoding='utf-8'))['duracoes']['download'] == [1.0, 1.0, 1.0]
+
+
+@pytest.mark.parametrize('conteudo', [
+    '{"duracoes": {"pesquisa": [1, 2',
+    '[1, 2, 3]',
+    '{"duracoes": [1, 2]}',
+    '{"duracoes": {"pesquisa": 5}}',
+    '{"duracoes": {"download": [1, 1], "pesquisa": ["x"]}}',
+])
+def test_arquivo_corrompido_usa_os_padroes(tmp_path, conteudo):
+    caminho = tmp_path / 'timeouts.json'
+    caminho.write_text(conteudo, encoding='utf-8')
+    timeouts = TimeoutsAdaptativos(caminho, minimo_amostras=1)
+    assert timeouts.resumo() == {}
+    assert timeouts.timeout('pesquisa', 30) == 30
+    # A próxima gravação substitui o arquivo corrompido
+    _observar(timeouts, 'pesquisa', [2.0])
+    timeouts.salvar()
+    assert TimeoutsAdaptativos(caminho, minimo_amostras=1).timeout('pesquisa', 30) == pytest.approx(6.0)